@@ -1,9 +1,8 @@
 import os
-import tempfile
+import uuid
 from pathlib import Path
-from typing import TypedDict
+from typing import Callable, TypedDict
 
-import chromadb
 import pandas as pd
 import streamlit as st
 import toml
@@ -13,7 +12,13 @@ import sys
 
 # Añadir el directorio padre al path para poder importar models
 sys.path.append(str(Path(__file__).parents[1]))
-from models.RAG import RAG
+from models.ingest_jobs import IngestJob, IngestJobQueue
+from models.ingestion import IngestStats
+from models.RAG import RAG, RETRIEVER_MODES
+from models.router import RouterLLM
+from models.streaming import QueryStream
+from models.tracing import QueryTrace
+from models.upload_store import StoredUpload, UploadStore
 
 load_dotenv()
 
@@ -29,10 +34,30 @@ SYSTEM_PROMPT = (
 )
 
 
+# Labels of the retriever modes of the RAG
+RETRIEVER_MODE_LABELS = {
+    "vector": "Semántica",
+    "hybrid": "Híbrida (semántica + palabras clave)",
+}
+
+# Labels of the states of the ingestion jobs
+JOB_STATE_LABELS = {
+    "queued": "En cola",
+    "running": "Indexando",
+    "succeeded": "Completado",
+    "failed": "Error",
+    "cancelled": "Cancelado",
+}
+
+# Latest ingestion jobs of the session shown in the sidebar
+MAX_SHOWN_JOBS = 5
+
+
 class SidebarOutput(TypedDict):
     """Class to store the sidebar output."""
 
     top_k: int
+    retriever_mode: str
     query_engine_response_mode: str
     chat_engine_response_mode: str
 
@@ -84,6 +109,207 @@ def _clean_file_uploader():
         del st.session_state["pdf_uploader"]
 
 
+def _collect_upload_garbage(
+    rag: RAG, upload_store: UploadStore, job_queue: IngestJobQueue
+) -> None:
+    """Delete the uploaded files that are no longer in the knowledge base.
+
+    The files of ingestion jobs that have not succeeded are kept, so they can
+    still be ingested or retried. It runs in the app and in the job threads, so
+    it does not use `st.session_state`.
+    """
+    upload_store.collect_garbage(
+        rag.get_indexed_hashes(
+            vector_store_path=config["chroma"]["VECTOR_STORE"],
+            chroma_collection_name=config["chroma"]["CHROMA_COLLECTION"],
+        )
+        | job_queue.retained_hashes()
+    )
+
+
+def _submit_ingest_job(
+    description: str,
+    uploads: list[StoredUpload],
+    ingest: Callable[[str, IngestJob], IngestStats | None],
+) -> None:
+    """Queue the ingest of stored uploads as a background job of the session.
+
+    The uploads must be pinned in the upload store (`put(..., pin=True)`), so
+    the garbage collection of another job cannot delete them before this job
+    is registered; they are unpinned once it is. They are recorded as ingested
+    (`UploadStore.commit`) only when the ingest succeeds.
+
+    Parameters
+    ----------
+    description : str
+        What the job ingests, shown in the sidebar.
+    uploads : list[StoredUpload]
+        The pinned uploads to ingest.
+    ingest : Callable[[str, IngestJob], IngestStats | None]
+        The ingest, called with the directory where the uploads are staged and
+        the job (for its progress callback and cancel event). The chunks should
+        record the stored paths of the uploads (`UploadStore.blob_paths`), since
+        the staging directory is deleted afterwards.
+    """
+    rag = st.session_state["rag"]
+    upload_store = st.session_state["upload_store"]
+    job_queue = st.session_state["job_queue"]
+
+    def run(job: IngestJob) -> IngestStats | None:
+        with upload_store.staging(uploads) as data_dir:
+            stats = ingest(data_dir, job)
+        upload_store.commit(uploads)
+        _collect_upload_garbage(rag, upload_store, job_queue)
+        return stats
+
+    try:
+        job = job_queue.submit(
+            description, run, frozenset(upload["file_hash"] for upload in uploads)
+        )
+    finally:
+        # From now on the job keeps them (`IngestJobQueue.retained_hashes`)
+        upload_store.unpin(upload["file_hash"] for upload in uploads)
+    st.session_state["ingest_jobs"].append(job.id)
+
+
+def _format_seconds(seconds: float) -> str:
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def _show_ingest_jobs() -> None:
+    """Show the latest ingestion jobs of the session with their progress.
+
+    It runs as a fragment that reruns every second while a job is queued or
+    running, so only this panel is refreshed. When one of them finishes, the
+    whole app is rerun to show the new version of the index.
+    """
+    job_queue = st.session_state["job_queue"]
+    jobs = [
+        job
+        for job in map(job_queue.get, st.session_state["ingest_jobs"][-MAX_SHOWN_JOBS:])
+        if job is not None
+    ]
+    if not jobs:
+        return
+
+    if any(job.done for job in jobs if job.id in st.session_state["active_jobs"]):
+        st.rerun()
+
+    st.markdown("**Indexación**")
+    for job in reversed(jobs):
+        progress = job.progress()
+        text = f"{JOB_STATE_LABELS[job.state]}: {job.description}"
+        if job.attempt > 1:
+            text += f" (intento {job.attempt})"
+        st.progress(progress["fraction"], text=text)
+
+        if job.state == "running":
+            eta = (
+                f", quedan ~{_format_seconds(progress['eta_seconds'])}"
+                if progress["eta_seconds"] is not None
+                else ""
+            )
+            st.caption(
+                f"{progress['files_parsed']}/{progress['files']} archivos, "
+                f"{progress['pages']} páginas, {progress['chunks']} fragmentos "
+                f"({_format_seconds(progress['elapsed_seconds'])}{eta})"
+            )
+        elif job.state == "succeeded" and job.stats is not None:
+            st.caption(job.stats.summary())
+        elif job.error is not None:
+            st.caption(job.error)
+
+        if not job.done:
+            if st.button("Cancelar", key=f"cancel_{job.id}"):
+                job_queue.cancel(job.id)
+        elif job.state in ["failed", "cancelled"]:
+            if st.button("Reintentar", key=f"retry_{job.id}"):
+                new_job = job_queue.retry(job.id)
+                if new_job is not None:
+                    ingest_jobs = st.session_state["ingest_jobs"]
+                    ingest_jobs[ingest_jobs.index(job.id)] = new_job.id
+                st.rerun()
+
+
+def _build_ingest_jobs() -> None:
+    """Show the ingestion jobs of the session in the sidebar."""
+    job_queue = st.session_state["job_queue"]
+    st.session_state["active_jobs"] = {
+        job_id
+        for job_id in st.session_state["ingest_jobs"]
+        if (job := job_queue.get(job_id)) is not None and not job.done
+    }
+    with st.sidebar:
+        st.fragment(
+            _show_ingest_jobs,
+            run_every=1 if st.session_state["active_jobs"] else None,
+        )()
+
+
+def _build_document_actions(container, indexed_documents: list[dict]) -> None:
+    """Build the controls to delete or replace one indexed document.
+
+    Only the chunks of the selected document are deleted or re-embedded, the
+    rest of the knowledge base is left untouched.
+
+    Parameters
+    ----------
+    container : DeltaGenerator
+        The container where the controls are shown.
+    indexed_documents : list[dict]
+        The documents of the knowledge base.
+    """
+    rag = st.session_state["rag"]
+    upload_store = st.session_state["upload_store"]
+    job_queue = st.session_state["job_queue"]
+
+    file_name = container.selectbox(
+        "Documento",
+        options=[document["file_name"] for document in indexed_documents],
+        key="selected_document",
+    )
+    new_version = container.file_uploader(
+        "Nueva versión", type="pdf", key=f"new_version_{file_name}"
+    )
+    delete_col, replace_col = container.columns(2)
+
+    if delete_col.button("Eliminar", key="delete_document"):
+        with st.spinner(f"Eliminando {file_name}..."):
+            rag.delete_document(
+                vector_store_path=config["chroma"]["VECTOR_STORE"],
+                chroma_collection_name=config["chroma"]["CHROMA_COLLECTION"],
+                file_name=file_name,
+            )
+            upload_store.forget(file_name)
+            _collect_upload_garbage(rag, upload_store, job_queue)
+        # Otherwise the PDF still in the file uploader would be indexed again
+        _clean_file_uploader()
+        st.rerun()
+
+    if replace_col.button(
+        "Reemplazar", key="replace_document", disabled=new_version is None
+    ):
+        # The new version is indexed under the name of the document it replaces,
+        # in the background: the previous version is queried until it commits
+        upload = upload_store.put(file_name, new_version, pin=True)
+        _submit_ingest_job(
+            f"{file_name} (nueva versión)",
+            [upload],
+            lambda data_dir, job: rag.upsert_document(
+                vector_store_path=config["chroma"]["VECTOR_STORE"],
+                chroma_collection_name=config["chroma"]["CHROMA_COLLECTION"],
+                file_path=os.path.join(data_dir, file_name),
+                progress=job.report,
+                cancel_event=job.cancel_event,
+                source_path=upload_store.blob_path(upload["file_hash"]),
+            ),
+        )
+        # Otherwise the old version still in the file uploader would be indexed again
+        _clean_file_uploader()
+        st.rerun()
+
+
 # Sidebar
 def build_sidebar() -> SidebarOutput:
     """Build the sidebar of the app.
@@ -118,29 +344,43 @@ def build_sidebar() -> SidebarOutput:
         # En el caso de que el usuario suba un nuevo PDF o cambie uno de los PDFs
         if current_pdf_identifiers != previous_pdf_identifiers:
             with st.spinner("Cargando PDFs..."):
-                temp_dir = tempfile.mkdtemp()
-
-                for pdf in uploaded_pdfs:
-                    file_path = os.path.join(temp_dir, pdf.name)
-                    with open(file_path, "wb") as f:
-                        f.write(pdf.read())
+                # Each PDF is streamed to the upload store under its content hash;
+                # only new or changed files are ingested, and they stay pinned
+                # until their job is registered
+                upload_store = st.session_state["upload_store"]
+                uploads = [
+                    upload_store.put(pdf.name, pdf, pin=True) for pdf in uploaded_pdfs
+                ]
+                changed_uploads = [upload for upload in uploads if upload["changed"]]
+                upload_store.unpin(
+                    upload["file_hash"] for upload in uploads if not upload["changed"]
+                )
 
-                st.session_state["rag"].create_or_update_rag_index(
-                    vector_store_path=config["chroma"]["VECTOR_STORE"],
-                    chroma_collection_name=config["chroma"]["CHROMA_COLLECTION"],
-                    data_dir=temp_dir,
+            # The ingest runs as a background job: queries keep being answered
+            # from the last committed index until it finishes
+            rag = st.session_state["rag"]
+            if changed_uploads or rag.index is None:
+                _submit_ingest_job(
+                    ", ".join(upload["file_name"] for upload in changed_uploads)
+                    or "Base de Conocimiento",
+                    changed_uploads,
+                    lambda data_dir, job: rag.create_or_update_rag_index(
+                        vector_store_path=config["chroma"]["VECTOR_STORE"],
+                        chroma_collection_name=config["chroma"]["CHROMA_COLLECTION"],
+                        data_dir=data_dir,
+                        progress=job.report,
+                        cancel_event=job.cancel_event,
+                        source_paths=upload_store.blob_paths(changed_uploads),
+                    ),
                 )
 
-                # In case `uploaded_pdfs` changes from previous state,
-                # st.session_state[“docs_updated”] = True
-                # This is to check if the documents have been updated,
-                # so that the chat context is preserved
-                st.session_state["docs_updated"] = True
-                st.session_state["previous_uploaded_pdfs"] = uploaded_pdfs
+            st.session_state["previous_uploaded_pdfs"] = uploaded_pdfs
 
     else:
         disable = True
 
+    _build_ingest_jobs()
+
     top_k = st.sidebar.slider(
         "Número de resultados",
         min_value=1,
@@ -149,6 +389,15 @@ def build_sidebar() -> SidebarOutput:
         disabled=disable,
     )
 
+    # Hybrid search also finds exact terms (article numbers, codes, names)
+    retriever_mode = st.sidebar.radio(
+        "Búsqueda",
+        options=RETRIEVER_MODES,
+        format_func=RETRIEVER_MODE_LABELS.get,
+        key="retriever_mode",
+        disabled=disable,
+    )
+
     tab1, tab2 = st.sidebar.tabs(["Query engine", "Chat engine"])
 
     query_engine_response_mode = tab1.selectbox(
@@ -166,11 +415,6 @@ def build_sidebar() -> SidebarOutput:
 
     st.sidebar.divider()
 
-    db = chromadb.PersistentClient(path=config["chroma"]["VECTOR_STORE"])
-    chroma_collection = db.get_or_create_collection(
-        config["chroma"]["CHROMA_COLLECTION"]
-    )
-
     # Show indexed documents in the sidebar (knowledge base from the RAG)
     expander = st.sidebar.expander("Ver documentos indexados (Base de Conocimiento)")
 
@@ -180,15 +424,19 @@ def build_sidebar() -> SidebarOutput:
     # Deleting Knwoledge Base functionality
     if st.sidebar.button("Limpiar Base de Conocimiento", disabled=disable):
         try:
-            db.delete_collection(config["chroma"]["CHROMA_COLLECTION"])
-            # db.get_or_create_collection(config["chroma"]["CHROMA_COLLECTION"])
+            st.session_state["rag"].clear_knowledge_base(
+                vector_store_path=config["chroma"]["VECTOR_STORE"],
+                chroma_collection_name=config["chroma"]["CHROMA_COLLECTION"],
+            )
+            _collect_upload_garbage(
+                st.session_state["rag"],
+                st.session_state["upload_store"],
+                st.session_state["job_queue"],
+            )
 
             # Clean the file uploader
             _clean_file_uploader()
 
-            # Now there are no documents in the collection
-            st.session_state["docs_updated"] = True
-
             st.success("Base de Conocimiento limpiada exitosamente.")
 
             expander.info("No hay documentos indexados.")
@@ -200,21 +448,59 @@ def build_sidebar() -> SidebarOutput:
         except Exception as e:
             st.sidebar.error(f"Error al limpiar la Base de Conocimiento: {e}")
 
-    # In case there is no collections
-    if len(db.list_collections()) == 0:
-        existing_filenames = []
-    else:
-        existing_filenames = list(
-            st.session_state["rag"].get_existing_filenames(chroma_collection)
-        )
+    # The manifest of the collection lists the indexed documents without
+    # scanning the chunks stored in ChromaDB
+    indexed_documents = st.session_state["rag"].get_indexed_documents(
+        vector_store_path=config["chroma"]["VECTOR_STORE"],
+        chroma_collection_name=config["chroma"]["CHROMA_COLLECTION"],
+    )
+    if indexed_documents:
         expander.dataframe(
-            pd.DataFrame(existing_filenames, columns=["Documentos indexados"]),
+            pd.DataFrame(indexed_documents).rename(
+                columns={
+                    "file_name": "Documentos indexados",
+                    "chunks": "Fragmentos",
+                    "bytes": "Tamaño (bytes)",
+                    "indexed_at": "Indexado",
+                }
+            ),
             hide_index=True,
         )
+        _build_document_actions(expander, indexed_documents)
+
+    # Construction cost of the query/chat engines and the time saved reusing them
+    pool_stats = st.session_state["rag"].engine_pool.stats()
+    st.sidebar.caption(
+        f"Motores construidos: {pool_stats['builds']} "
+        f"({pool_stats['build_seconds']:.2f}s), reutilizados: {pool_stats['reuses']} "
+        f"(~{pool_stats['saved_seconds']:.2f}s ahorrados)"
+    )
+
+    # Latency and health of each model behind the router
+    if isinstance(st.session_state["rag"].model, RouterLLM):
+        for route in st.session_state["rag"].model.stats():
+            p95 = route["p95_seconds"]
+            st.sidebar.caption(
+                f"{route['name']}{'' if route['healthy'] else ' (en pausa)'}: "
+                f"p95 {f'{p95:.2f}s' if p95 is not None else 'N/A'}, "
+                f"errores {route['error_rate']:.0%}, {route['wins']} respuestas, "
+                f"{route['hedges']} duplicadas"
+            )
+
+    # Export the per-stage traces of the latest queries for offline analysis
+    tracer = st.session_state["rag"].tracer
+    if tracer is not None and tracer.traces:
+        st.sidebar.download_button(
+            "Descargar trazas (JSONL)",
+            data=tracer.export_jsonl(),
+            file_name="traces.jsonl",
+            mime="application/jsonl",
+        )
 
     # Sidebar Inputs
     sidebar_output = {
         "top_k": top_k,
+        "retriever_mode": retriever_mode,
         "query_engine_response_mode": query_engine_response_mode,
         "chat_engine_response_mode": chat_engine_response_mode,
     }
@@ -222,16 +508,41 @@ def build_sidebar() -> SidebarOutput:
     return sidebar_output
 
 
-def build_chat() -> None:
+def _add_message(role: str, content: str) -> None:
+    """Add a message to the chat history of the app, keeping only the latest ones.
+
+    Older messages are not rendered again: the chat memory of the RAG keeps
+    them as a summary.
+    """
+    st.session_state.messages.append({"role": role, "content": content})
+    overflow = len(st.session_state.messages) - config["chat"]["UI_WINDOW"]
+    if overflow > 0:
+        del st.session_state.messages[:overflow]
+        st.session_state["hidden_messages"] += overflow
+
+
+def build_chat(sidebar_output: SidebarOutput) -> None:
     """Build the chat interface of the app that allows the user
-    to interact with the RAG assistant."""
+    to interact with the RAG assistant.
+
+    Parameters
+    ----------
+    sidebar_output : SidebarOutput
+        A dictionary containing the selected parameters from the sidebar.
+    """
     cont1, cont2 = st.container(), st.container(height=500)
     if cont1.button("Limpiar chat", key="clear_button"):
         st.session_state.messages = []
+        st.session_state["hidden_messages"] = 0
         st.session_state["chat_engine"].reset()
 
     # Display chat messages from history on app rerun
     # Note: App rerun occurs when a user interacts with the app
+    if st.session_state["hidden_messages"]:
+        cont2.caption(
+            f"{st.session_state['hidden_messages']} mensajes anteriores "
+            "(resumidos en la memoria del chat)"
+        )
     for message in st.session_state.messages:
         with cont2.chat_message(message["role"]):
             st.markdown(message["content"])
@@ -239,17 +550,67 @@ def build_chat() -> None:
     # Accept user input
     if prompt := st.chat_input("What is up?"):
         # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        _add_message("user", prompt)
         # Display user message in chat message container
         with cont2.chat_message("user"):
             st.markdown(prompt)
 
         # Display assistant response in chat message container
         with cont2.chat_message("assistant"):
-            stream_response = st.session_state["chat_engine"].stream_chat(prompt)
+            stream_response = st.session_state["rag"].stream_chat(
+                prompt,
+                chat_mode=sidebar_output["chat_engine_response_mode"],
+                top_k=sidebar_output["top_k"],
+                session_id=st.session_state["session_id"],
+                retriever_mode=sidebar_output["retriever_mode"],
+            )
             response = st.write_stream(stream_response.response_gen)
+            _show_trace(stream_response.trace)
+
+        _add_message("assistant", response)
 
-        st.session_state.messages.append({"role": "assistant", "content": response})
+
+@st.cache_resource
+def get_shared_rag() -> RAG:
+    """Get the RAG shared by every session of the app, built once per process.
+
+    Its index is updated in place by any session (see `RAG.create_or_update_rag_index`)
+    while the others keep querying it. Chat memories are kept per session id.
+    """
+    return RAG(
+        system_prompt=SYSTEM_PROMPT,
+        model=config["google-genai"]["MODEL_NAME"],
+        ingestion_config=config.get("ingestion"),
+        embedding_cache_config=config.get("embedding_cache"),
+        response_cache_config=config.get("response_cache"),
+        concurrency_config=config.get("concurrency"),
+        tracing_config=config.get("tracing"),
+        context_budget_config=config.get("context_budget"),
+        diversity_config=config.get("diversity"),
+        sharding_config=config.get("sharding"),
+        vector_store_config=config.get("vector_store"),
+        document_cache_config=config.get("document_cache"),
+        chat_memory_config=config.get("chat_memory"),
+        router_config=config.get("router"),
+    )
+
+
+@st.cache_resource
+def get_shared_upload_store() -> UploadStore:
+    """Get the store of uploaded PDFs shared by every session of the app."""
+    return UploadStore(
+        path=config["uploads"]["PATH"],
+        block_size=config["uploads"]["BLOCK_SIZE"],
+    )
+
+
+@st.cache_resource
+def get_shared_job_queue() -> IngestJobQueue:
+    """Get the queue of ingestion jobs shared by every session of the app.
+
+    Its jobs update the shared RAG one after another, in background threads.
+    """
+    return IngestJobQueue(workers=1)
 
 
 # Main Page
@@ -279,19 +640,17 @@ def build_main_page(sidebar_output: SidebarOutput) -> None:
 
         # Chat Engine
         with tab_chat:
-            # In case the documents have been updated
-            if st.session_state["docs_updated"]:
-                chat_engine = st.session_state["rag"].build_chat_engine(
-                    chat_mode=sidebar_output["chat_engine_response_mode"],
-                    top_k=sidebar_output["top_k"],
-                )
-
-                st.session_state["chat_engine"] = chat_engine
-
-                st.session_state["docs_updated"] = False
+            # The engine pool of the RAG returns the same chat engine (and chat
+            # memory) on every rerun, and a new one when the documents change
+            st.session_state["chat_engine"] = st.session_state["rag"].build_chat_engine(
+                chat_mode=sidebar_output["chat_engine_response_mode"],
+                top_k=sidebar_output["top_k"],
+                session_id=st.session_state["session_id"],
+                retriever_mode=sidebar_output["retriever_mode"],
+            )
 
             # Chat
-            build_chat()
+            build_chat(sidebar_output)
 
 
 def _build_query_section(sidebar_output: SidebarOutput) -> None:
@@ -307,28 +666,104 @@ def _build_query_section(sidebar_output: SidebarOutput) -> None:
     """
     user_query = st.text_input("Consulta")
     if st.button("Consultar"):
-        with st.spinner("Consultando..."):
-            query_engine = st.session_state["rag"].build_query_engine(
+        # The answer is streamed above the sources, which are shown as soon as
+        # retrieval finishes
+        answer_container = st.container()
+
+        with st.spinner("Buscando documentos..."):
+            stream = st.session_state["rag"].stream_query(
+                query=user_query,
                 response_mode=sidebar_output["query_engine_response_mode"],
                 top_k=sidebar_output["top_k"],
+                retriever_mode=sidebar_output["retriever_mode"],
                 # Important: This configuration makes metadata available in the response
                 node_postprocessors=[],
             )
 
-            response = query_engine.query(user_query)
-            st.write(response.response)
+        source_data = get_source_data_from_response(stream)
+
+        # Show source data in a table
+        if source_data:
+            st.dataframe(source_data, use_container_width=True)
+
+        else:
+            st.info("No se encontraron nodos fuente para esta consulta.")
+
+        # Duplicate and redundant chunks removed from the retrieved candidates
+        diversity = stream.postprocessor_stats.get("DiversityPostprocessor")
+        if diversity is not None:
+            st.caption(
+                f"Diversidad: {diversity.nodes_removed} de {diversity.nodes_in} "
+                f"fragmentos eliminados ({diversity.duplicates} duplicados, "
+                f"{diversity.over_file_cap} por límite de archivo, "
+                f"{diversity.not_selected} redundantes)"
+            )
+
+        # Tokens of retrieved context left out to fit the token budget
+        packing = stream.postprocessor_stats.get("TokenBudgetPacker")
+        if packing is not None:
+            st.caption(
+                f"Contexto: {packing.tokens_out} de {packing.tokens_in} tokens "
+                f"({packing.tokens_saved} ahorrados, "
+                f"{packing.nodes_dropped} fragmentos descartados, "
+                f"{packing.nodes_truncated} recortados)"
+            )
+
+        # Filled in once the answer is complete
+        trace_container = st.container()
+
+        with answer_container:
+            st.write_stream(stream.response_gen)
+
+            timings = stream.timings
+            st.caption(
+                f"Recuperación: {timings.retrieval_seconds:.2f}s · "
+                f"Primer token: {timings.time_to_first_token or 0:.2f}s · "
+                f"Total: {timings.total_seconds:.2f}s"
+                + (" · Respuesta en caché" if timings.cached else "")
+            )
+
+        with trace_container:
+            _show_trace(stream.trace)
 
-            source_data = get_source_data_from_response(response)
 
-            # Show source data in a table
-            if source_data:
-                st.dataframe(source_data, use_container_width=True)
+def _show_trace(trace: QueryTrace | None) -> None:
+    """Show the time and tokens spent in each stage of a query or chat turn.
 
-            else:
-                st.info("No se encontraron nodos fuente para esta consulta.")
+    Parameters
+    ----------
+    trace : QueryTrace | None
+        The trace of the query, or None when tracing is disabled.
+    """
+    if trace is None:
+        return
+
+    with st.expander(
+        f"Etapas: {trace.llm_calls} llamadas al LLM, "
+        f"{trace.prompt_tokens} tokens de entrada, "
+        f"{trace.completion_tokens} tokens de salida"
+    ):
+        st.dataframe(
+            pd.DataFrame(
+                [
+                    {
+                        "Etapa": name,
+                        "Segundos": round(stage.seconds, 3),
+                        "Llamadas": stage.calls,
+                        "Tokens entrada": stage.prompt_tokens,
+                        "Tokens salida": stage.completion_tokens,
+                    }
+                    for name, stage in trace.stages.items()
+                ]
+            ),
+            hide_index=True,
+            use_container_width=True,
+        )
 
 
-def get_source_data_from_response(response: Response) -> list[SourceData]:
+def get_source_data_from_response(
+    response: Response | QueryStream,
+) -> list[SourceData]:
     """Get source metadata from LlamaIndex query response.
 
     This function extracts the source metadata from the LlamaIndex query response
@@ -337,8 +772,8 @@ def get_source_data_from_response(response: Response) -> list[SourceData]:
 
     Parameters
     ----------
-    response : Response
-        The LlamaIndex query response object.
+    response : Response | QueryStream
+        The LlamaIndex query response object, or the streamed answer of the RAG.
         It contains the source nodes and their metadata.
 
     Returns
@@ -387,22 +822,38 @@ _hide_header()
 if "messages" not in st.session_state:
     st.session_state["messages"] = []
 
+# Messages removed from the chat window of the app
+if "hidden_messages" not in st.session_state:
+    st.session_state["hidden_messages"] = 0
+
 if "chat_engine" not in st.session_state:
     st.session_state["chat_engine"] = None
 
+# The RAG (LLM client, loaded index, caches) and the upload store are shared by
+# every session of the process; each session keeps only its own chat state
 if "rag" not in st.session_state:
-    rag = RAG(
-        system_prompt=SYSTEM_PROMPT,
-        model=config["google-genai"]["MODEL_NAME"],
-    )
-    st.session_state["rag"] = rag
+    st.session_state["rag"] = get_shared_rag()
+
+if "upload_store" not in st.session_state:
+    st.session_state["upload_store"] = get_shared_upload_store()
+
+if "job_queue" not in st.session_state:
+    st.session_state["job_queue"] = get_shared_job_queue()
+
+# Ids of the ingestion jobs submitted by the session, and those still queued or
+# running at the last run of the app
+if "ingest_jobs" not in st.session_state:
+    st.session_state["ingest_jobs"] = []
+
+if "active_jobs" not in st.session_state:
+    st.session_state["active_jobs"] = set()
 
 # This is to "clean" the file uploader when "Limpiar Base de Conocimiento" is clicked
 if "pdf_uploader_key" not in st.session_state:
     st.session_state["pdf_uploader_key"] = "pdf_uploader"
 
-if "docs_updated" not in st.session_state:
-    st.session_state["docs_updated"] = False
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = str(uuid.uuid4())
 
 if "previous_uploaded_pdfs" not in st.session_state:
     st.session_state["previous_uploaded_pdfs"] = []
@@ -0,0 +1,488 @@
+"""Offline benchmark suite of the RAG: ingest, index load, retrieval and end-to-end.
+
+Everything runs locally: documents are embedded with the deterministic
+`StubEmbedding` and answered by `StubLLM`, whose delays simulate the latency of
+the remote providers. The corpora are the PDFs of `Quick-Examples/data` and
+synthetic text corpora scaled up to the requested number of documents. Every
+corpus is measured with each vector store backend of `--backends`; the load
+of the index is also measured in a new process, with its resident memory.
+
+The results are stored as JSON. Pass a previous result with `--baseline` to
+compare the run against it: the command exits with status 1 when a metric is
+worse than the baseline by more than `--tolerance`.
+
+Example
+-------
+python Example-Projects/Streamlit-RAG-Chat/benchmarks/run_benchmarks.py \\
+    --synthetic-docs 50 200 --baseline benchmarks/results/baseline.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+# Añadir el directorio padre al path para poder importar models
+sys.path.append(str(Path(__file__).parents[1]))
+from models.RAG import RAG, RETRIEVER_MODES, VECTOR_STORE_BACKENDS
+from models.stubs import StubEmbedding, StubLLM
+
+REPO_ROOT = Path(__file__).parents[3]
+PDF_DATA_DIR = REPO_ROOT / "Quick-Examples" / "data"
+RESULTS_DIR = Path(__file__).parent / "results"
+
+SYSTEM_PROMPT = "Eres un asistente virtual que ayuda a los usuarios a encontrar información en documentos. "
+
+QUERIES = [
+    "¿Qué dice el texto sobre el alma?",
+    "¿Cómo se debe afrontar la muerte?",
+    "¿Qué es el Tao?",
+    "¿Qué papel tiene la virtud en la vida?",
+    "¿Cómo se describe la naturaleza?",
+    "¿Qué consejos da sobre la ira?",
+    "¿Qué relación hay entre el sabio y el pueblo?",
+    "¿Qué significa vivir conforme a la razón?",
+    "¿Qué se dice del tiempo y de la fama?",
+    "¿Cómo se gobierna un estado?",
+]
+
+# Vocabulary of the synthetic corpora
+VOCABULARY = (
+    "alma razón naturaleza virtud muerte tiempo vida camino sabio pueblo agua "
+    "cielo tierra guerra paz deber justicia placer dolor fama memoria mente "
+    "cuerpo destino orden universo hombre mujer ciudad estado ley libertad "
+    "bien mal verdad error juicio acción palabra silencio fuerza debilidad "
+    "riqueza pobreza amistad enemigo maestro discípulo origen fin principio "
+    "armonía cambio quietud vacío forma materia"
+).split()
+
+# Metrics where a higher value is better; for the rest (times) lower is better
+HIGHER_IS_BETTER = ("per_second",)
+
+
+def make_synthetic_corpus(target_dir: Path, n_docs: int, seed: int = 0) -> None:
+    """Write `n_docs` deterministic text documents of about 1500 words each.
+
+    Parameters
+    ----------
+    target_dir : Path
+        The directory where the documents are written.
+    n_docs : int
+        The number of documents.
+    seed : int, optional
+        The seed of the random generator, by default 0.
+    """
+    rng = random.Random(seed)
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for i in range(n_docs):
+        paragraphs = []
+        for _ in range(15):
+            sentences = [
+                " ".join(rng.choices(VOCABULARY, k=rng.randint(8, 16))).capitalize()
+                + "."
+                for _ in range(8)
+            ]
+            paragraphs.append(" ".join(sentences))
+        (target_dir / f"documento_{i:05d}.txt").write_text(
+            "\n\n".join(paragraphs), encoding="utf-8"
+        )
+
+
+def make_pdf_corpus(target_dir: Path) -> None:
+    """Copy the PDFs of `Quick-Examples/data` (kept in subdirectories) into one directory."""
+    target_dir.mkdir(parents=True, exist_ok=True)
+    for pdf in sorted(PDF_DATA_DIR.rglob("*.pdf")):
+        shutil.copy(pdf, target_dir / pdf.name)
+
+
+def percentiles(samples: list[float]) -> dict:
+    """Get the p50, p95 and mean of latency samples, in milliseconds."""
+    values = np.asarray(samples) * 1000
+    return {
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "mean_ms": float(values.mean()),
+    }
+
+
+def resident_memory_mb() -> float:
+    """Get the resident memory of this process in MiB (the peak outside Linux)."""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def directory_mb(path: Path) -> float:
+    """Get the size on disk of the files of a directory, in MiB."""
+    return (
+        sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+        / 1024
+        / 1024
+    )
+
+
+def build_rag(args, backend: str = "chroma") -> RAG:
+    """Build a RAG with local models and without caches.
+
+    With `--shards` a ChromaDB collection is spread over that many hash shards.
+    """
+    return RAG(
+        system_prompt=SYSTEM_PROMPT,
+        embed_model=StubEmbedding(delay=args.embed_delay),
+        llm=StubLLM(delay=args.llm_delay),
+        sharding_config=(
+            {"ENABLED": True, "STRATEGY": "hash", "NUM_SHARDS": args.shards}
+            if args.shards and backend == "chroma"
+            else None
+        ),
+        vector_store_config={
+            "BACKEND": backend,
+            "DTYPE": args.dtype,
+            "IVF_LISTS": args.ivf_lists,
+            "IVF_MIN_ROWS": 0,
+        },
+    )
+
+
+def bench_ingest(data_dir: Path, workdir: Path, args, backend: str) -> tuple[RAG, dict]:
+    """Measure a full ingest of a corpus, then an update with no changes."""
+    rag = build_rag(args, backend)
+    vector_store_path = str(workdir / "chroma_db")
+
+    start = time.perf_counter()
+    rag.create_or_update_rag_index(vector_store_path, "benchmark", str(data_dir))
+    ingest_seconds = time.perf_counter() - start
+    stats = rag.last_ingest_stats
+
+    start = time.perf_counter()
+    rag.create_or_update_rag_index(vector_store_path, "benchmark", str(data_dir))
+    noop_update_seconds = time.perf_counter() - start
+
+    return rag, {
+        "files": stats.files,
+        "pages": stats.pages,
+        "chunks": stats.chunks,
+        "ingest_seconds": ingest_seconds,
+        "chunks_per_second": stats.chunks / ingest_seconds,
+        "pages_per_second": stats.pages / ingest_seconds,
+        "stage_seconds": dict(stats.stage_seconds),
+        "noop_update_seconds": noop_update_seconds,
+    }
+
+
+def _cold_load(data_dir: Path, workdir: Path, args, backend: str, queue) -> None:
+    """Load the index in a new process and report its time and memory."""
+    rag = build_rag(args, backend)
+    memory_before = resident_memory_mb()
+
+    start = time.perf_counter()
+    rag.create_or_update_rag_index(
+        str(workdir / "chroma_db"), "benchmark", str(data_dir)
+    )
+    load_seconds = time.perf_counter() - start
+    memory_loaded = resident_memory_mb()
+
+    retriever = rag.build_retriever(max(args.top_k), "vector")
+    start = time.perf_counter()
+    retriever.retrieve(QUERIES[0])
+    first_query_seconds = time.perf_counter() - start
+    for query in QUERIES[1:]:
+        retriever.retrieve(query)
+
+    queue.put(
+        {
+            "cold_load_seconds": load_seconds,
+            "cold_first_query_ms": first_query_seconds * 1000,
+            "load_resident_mb": memory_loaded - memory_before,
+            "query_resident_mb": resident_memory_mb() - memory_before,
+        }
+    )
+
+
+def bench_load(data_dir: Path, workdir: Path, args, backend: str) -> dict:
+    """Measure the start-up of a new RAG on an existing index (as the app does).
+
+    The load is repeated in this process, and measured once in a new process:
+    its time, the latency of its first query, and the resident memory taken by
+    the load and by the first queries.
+    """
+    samples = []
+    for _ in range(args.load_repeats):
+        rag = build_rag(args, backend)
+        start = time.perf_counter()
+        rag.create_or_update_rag_index(
+            str(workdir / "chroma_db"), "benchmark", str(data_dir)
+        )
+        samples.append(time.perf_counter() - start)
+
+    # A spawned process starts without the index in memory
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(
+        target=_cold_load, args=(data_dir, workdir, args, backend, queue)
+    )
+    process.start()
+    cold = queue.get()
+    process.join()
+
+    return {
+        "load_seconds": float(np.median(samples)),
+        **cold,
+        "disk_mb": directory_mb(workdir / "chroma_db"),
+    }
+
+
+def bench_retrieval(rag: RAG, args) -> dict:
+    """Measure the retrieval latency for every retriever mode and `top_k`.
+
+    The latency of the keyword search alone is reported as "keyword_search".
+    """
+    results = {}
+    for retriever_mode in args.retriever_modes:
+        results[retriever_mode] = {}
+        for top_k in args.top_k:
+            retriever = rag.build_retriever(top_k, retriever_mode)
+            samples = []
+            for _ in range(args.repeats):
+                for query in QUERIES:
+                    start = time.perf_counter()
+                    retriever.retrieve(query)
+                    samples.append(time.perf_counter() - start)
+            results[retriever_mode][f"top_k={top_k}"] = percentiles(samples)
+
+    results["keyword_search"] = {}
+    for top_k in args.top_k:
+        samples = []
+        for _ in range(args.repeats):
+            for query in QUERIES:
+                start = time.perf_counter()
+                rag.sparse_index.search(query, top_k)
+                samples.append(time.perf_counter() - start)
+        results["keyword_search"][f"top_k={top_k}"] = percentiles(samples)
+    return results
+
+
+def bench_end_to_end(rag: RAG, args) -> dict:
+    """Measure the query latency and the LLM calls for every response mode."""
+    results = {}
+    for response_mode in args.response_modes:
+        query_engine = rag.build_query_engine(
+            response_mode=response_mode, top_k=args.e2e_top_k
+        )
+        samples = []
+        calls_before = rag.model.calls
+        for query in QUERIES:
+            start = time.perf_counter()
+            query_engine.query(query)
+            samples.append(time.perf_counter() - start)
+        results[response_mode] = {
+            **percentiles(samples),
+            "llm_calls_per_query": (rag.model.calls - calls_before) / len(QUERIES),
+        }
+    return results
+
+
+def run_corpus(name: str, data_dir: Path, args, backend: str) -> dict:
+    """Run every benchmark on one corpus, in a temporary vector store."""
+    print(f"Benchmark: {name} ({backend})")
+    workdir = Path(tempfile.mkdtemp(prefix="rag-benchmark-"))
+    try:
+        rag, ingest = bench_ingest(data_dir, workdir, args, backend)
+        return {
+            "ingest": ingest,
+            "load": bench_load(data_dir, workdir, args, backend),
+            "retrieval": bench_retrieval(rag, args),
+            "end_to_end": bench_end_to_end(rag, args),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def _flatten(results: dict, prefix: str = "") -> dict[str, float]:
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Print the relative change of every metric and return the regressions.
+
+    Parameters
+    ----------
+    current : dict
+        The corpora results of this run.
+    baseline : dict
+        The corpora results of the baseline run.
+    tolerance : float
+        The relative change allowed before a metric counts as a regression.
+    """
+    current_flat, baseline_flat = _flatten(current), _flatten(baseline)
+    regressions = []
+    for metric, value in current_flat.items():
+        reference = baseline_flat.get(metric)
+        if not reference:
+            continue
+        change = (value - reference) / reference
+        worse = -change if metric.endswith(HIGHER_IS_BETTER) else change
+        flag = ""
+        if worse > tolerance:
+            flag = "  <-- regresión"
+            regressions.append(metric)
+        print(f"{metric}: {reference:.4g} -> {value:.4g} ({change:+.1%}){flag}")
+    return regressions
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_ROOT,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of the RAG.")
+    parser.add_argument(
+        "--synthetic-docs",
+        type=int,
+        nargs="*",
+        default=[50, 200],
+        help="Sizes of the synthetic corpora, in documents.",
+    )
+    parser.add_argument("--top-k", type=int, nargs="+", default=[1, 5, 10, 20])
+    parser.add_argument(
+        "--retriever-modes",
+        nargs="+",
+        default=["vector", "hybrid"],
+        choices=RETRIEVER_MODES,
+    )
+    parser.add_argument(
+        "--response-modes",
+        nargs="+",
+        default=["compact", "refine", "tree_summarize", "simple_summarize"],
+    )
+    parser.add_argument("--e2e-top-k", type=int, default=5)
+    parser.add_argument(
+        "--llm-delay", type=float, default=0.05, help="Seconds per LLM call."
+    )
+    parser.add_argument(
+        "--embed-delay",
+        type=float,
+        default=0.0,
+        help="Seconds per embedding call (a batch is one call).",
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        default=VECTOR_STORE_BACKENDS,
+        choices=VECTOR_STORE_BACKENDS,
+    )
+    parser.add_argument(
+        "--dtype",
+        default="int8",
+        choices=["int8", "float16"],
+        help="Embedding type of the mmap backend.",
+    )
+    parser.add_argument(
+        "--ivf-lists",
+        type=int,
+        default=0,
+        help="IVF lists of the mmap backend (0 for exact search).",
+    )
+    parser.add_argument(
+        "--shards", type=int, default=0, help="Hash shards of the chroma backend."
+    )
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--load-repeats", type=int, default=3)
+    parser.add_argument("--output", help="Results file (default: results/<date>.json).")
+    parser.add_argument("--baseline", help="Results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    args = parser.parse_args()
+
+    corpora_root = Path(tempfile.mkdtemp(prefix="rag-corpora-"))
+    make_pdf_corpus(corpora_root / "pdfs")
+    corpora = {"pdfs": corpora_root / "pdfs"}
+    for n_docs in args.synthetic_docs:
+        corpus_dir = corpora_root / f"synthetic-{n_docs}"
+        make_synthetic_corpus(corpus_dir, n_docs)
+        corpora[f"synthetic-{n_docs}"] = corpus_dir
+
+    try:
+        corpora_results = {
+            name: {
+                backend: run_corpus(name, data_dir, args, backend)
+                for backend in args.backends
+            }
+            for name, data_dir in corpora.items()
+        }
+    finally:
+        shutil.rmtree(corpora_root, ignore_errors=True)
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": {
+            key: value
+            for key, value in vars(args).items()
+            if key not in ["output", "baseline"]
+        },
+        "corpora": corpora_results,
+    }
+
+    output = Path(
+        args.output or RESULTS_DIR / f"{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2, ensure_ascii=False))
+    print(f"Resultados guardados en {output}")
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if baseline["parameters"] != results["parameters"]:
+            print("Aviso: la línea base se ejecutó con otros parámetros")
+        regressions = compare(corpora_results, baseline["corpora"], args.tolerance)
+        if regressions:
+            print(
+                f"{len(regressions)} métricas empeoran más de un {args.tolerance:.0%}"
+            )
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
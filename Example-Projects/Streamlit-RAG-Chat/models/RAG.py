@@ -1,76 +1,566 @@
+import contextlib
+import copy
 import os
+import shutil
+import sys
+import threading
+import time
+from collections import deque
 from pathlib import Path
+from typing import AsyncGenerator, Callable, Iterator
 
-import chromadb
 import toml
-from chromadb.api.models.Collection import Collection
 from dotenv import load_dotenv
-from llama_index.core import SimpleDirectoryReader, StorageContext, VectorStoreIndex
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.chat_engine import (
+    CondensePlusContextChatEngine,
+    ContextChatEngine,
+)
+from llama_index.core.base.response.schema import RESPONSE_TYPE, Response
+from llama_index.core.llms import LLM
+from llama_index.core.memory import BaseMemory, ChatMemoryBuffer
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.schema import BaseNode, QueryBundle, TextNode
+from llama_index.core.vector_stores import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
 from llama_index.llms.google_genai import GoogleGenAI
 from llama_index.llms.openai import OpenAI
 from llama_index.vector_stores.chroma import ChromaVectorStore
 
+# Añadir el directorio padre al path para poder importar models
+sys.path.append(str(Path(__file__).parents[1]))
+from models.chat_memory import SummaryChatMemory
+from models.concurrency import (
+    get_provider_limiter,
+    shared_async_http_client,
+    shared_chroma_client,
+    shared_http_client,
+)
+from models.diversity import DiversityPostprocessor
+from models.document_cache import DocumentCache
+from models.embedding_cache import EmbeddingCache, embed_model_name
+from models.engine_pool import EnginePool
+from models.hybrid_retriever import HybridRetriever
+from models.ingestion import IngestStats, ParallelIngestionPipeline
+from models.manifest import (
+    IndexedDocument,
+    IndexManifest,
+    file_sha256,
+    manifest_path,
+)
+from models.mmap_store import MmapVectorStore, mmap_store_path
+from models.response_cache import CachedQueryEngine, ResponseCache
+from models.router import Route, RouterLLM
+from models.sharding import ShardedVectorStore, shard_collection_names
+from models.sparse_index import SparseIndex, sparse_index_path
+from models.streaming import QueryStream, QueryTimings, collect_postprocessor_stats
+from models.token_budget import TokenBudgetPacker
+from models.tracing import QueryTrace, Tracer
+
+# Model provider of each supported model
+PROVIDERS = {"gemini-2.0-flash": "google-genai", "gpt-4o-mini": "openai"}
+
+# Retrieval modes: vector search only, or vector + BM25 keyword search fused
+RETRIEVER_MODES = ["vector", "hybrid"]
+
+# Backends of the collection: ChromaDB, or quantized embeddings in memory-mapped files
+VECTOR_STORE_BACKENDS = ["chroma", "mmap"]
+
+# Chunks requested from each search per chunk returned by the hybrid retriever
+HYBRID_CANDIDATES_PER_CHUNK = 4
+
+# Sessions whose chat memory is kept; the oldest one is released beyond it
+MAX_CHAT_SESSIONS = 500
+
+# Bump this whenever the document parsing or chunking changes, so that
+# every file indexed with the previous chunker is re-embedded
+CHUNKER_VERSION = "simple-directory-reader/sentence-splitter-v1"
+
 
 class RAG:
     def __init__(
         self,
         system_prompt: str,
         model: str = "gpt-4o-mini",
+        embed_model: BaseEmbedding | None = None,
+        ingestion_config: dict | None = None,
+        embedding_cache_config: dict | None = None,
+        response_cache_config: dict | None = None,
+        concurrency_config: dict | None = None,
+        tracing_config: dict | None = None,
+        context_budget_config: dict | None = None,
+        diversity_config: dict | None = None,
+        sharding_config: dict | None = None,
+        vector_store_config: dict | None = None,
+        document_cache_config: dict | None = None,
+        chat_memory_config: dict | None = None,
+        router_config: dict | None = None,
+        llm: LLM | None = None,
     ):
         self.system_prompt = system_prompt
 
-        if model not in ["gemini-2.0-flash", "gpt-4o-mini"]:
-            raise ValueError(
-                "Invalid model. Choose 'gemini-2.0-flash' or 'gpt-4o-mini'."
+        router_config = _lower_keys(router_config or {})
+        if llm is not None:
+            # Injected model, e.g. a local `StubLLM` in tests and benchmarks
+            self.model = llm
+            self.provider = type(llm).__name__
+        elif router_config.pop("enabled", False):
+            # Both providers, each request sent to the fastest healthy one
+            # (`[router]` section of config.toml); `model` is tried first
+            models = sorted(
+                router_config.pop("models", list(PROVIDERS)),
+                key=lambda name: name != model,
             )
-
-        if model == "gemini-2.0-flash":
-            self.model = GoogleGenAI(
-                model=f"models/{model}", api_key=os.environ["GEMINI_API_KEY"]
+            self.model = RouterLLM(
+                routes=[
+                    Route(
+                        name=name,
+                        llm=_provider_llm(name),
+                        limiter=get_provider_limiter(
+                            PROVIDERS[name],
+                            **_lower_keys(
+                                (concurrency_config or {}).get(PROVIDERS[name], {})
+                            ),
+                        ),
+                    )
+                    for name in models
+                ],
+                **router_config,
             )
-        elif model == "gpt-4o-mini":
-            self.model = OpenAI(model=model, api_key=os.environ["OPENAI_API_KEY"])
+            self.provider = "router"
+        else:
+            self.model = _provider_llm(model)
+            self.provider = PROVIDERS[model]
 
+        # Limit of concurrent async calls to the provider (`[concurrency]` section
+        # of config.toml, one table per provider). With the router, every call
+        # also goes through the limiter of the provider that answers it
+        self.limiter = get_provider_limiter(
+            self.provider,
+            **_lower_keys((concurrency_config or {}).get(self.provider, {})),
+        )
+
+        # If no embedding model is given, LlamaIndex global `Settings` is used
+        self.embed_model = embed_model
+
+        # Worker counts, batch and queue sizes of the ingestion pipeline
+        # (`[ingestion]` section of config.toml)
+        self.ingestion_config = _lower_keys(ingestion_config or {})
+        self.last_ingest_stats: IngestStats | None = None
+
+        # On-disk cache of chunk embeddings (`[embedding_cache]` section of config.toml)
+        self.embedding_cache = (
+            EmbeddingCache(**_lower_keys(embedding_cache_config))
+            if embedding_cache_config
+            else None
+        )
+
+        # On-disk cache of parsed documents (`[document_cache]` section of config.toml)
+        self.document_cache = (
+            DocumentCache(**_lower_keys(document_cache_config))
+            if document_cache_config
+            else None
+        )
+
+        # Cache of query engine answers (`[response_cache]` section of config.toml)
+        self.response_cache = (
+            ResponseCache(**_lower_keys(response_cache_config))
+            if response_cache_config
+            else None
+        )
+
+        # Spread the collection over several shards (`[sharding]` section of
+        # config.toml); a single collection when disabled
+        sharding_config = _lower_keys(sharding_config or {})
+        self.sharding_config = (
+            sharding_config if sharding_config.pop("enabled", False) else None
+        )
+
+        # Backend of the collection and its options (`[vector_store]` section of
+        # config.toml): ChromaDB, or quantized embeddings in memory-mapped files
+        self.vector_store_config = _lower_keys(vector_store_config or {})
+        self.vector_store_backend = self.vector_store_config.pop("backend", "chroma")
+        if self.vector_store_backend not in VECTOR_STORE_BACKENDS:
+            raise ValueError("Invalid vector store backend. Choose 'chroma' or 'mmap'.")
+        if self.vector_store_backend == "mmap" and self.sharding_config is not None:
+            raise ValueError("Sharding is only supported by the 'chroma' backend.")
+
+        # The loaded index is shared by every thread (e.g. every session of the app).
+        # Updates are serialized by `_update_lock` and applied to a copy of the
+        # manifest, published when the new chunks are written: queries never wait
+        # for an ingest and keep seeing the previous documents until it commits
         self.index = None
+        self.vector_store = None
+        self.manifest = None
+        self._update_lock = threading.Lock()
+        # Content hashes being ingested: their chunks are already in the vector
+        # store but hidden from queries until the ingest commits
+        self._uncommitted_hashes: frozenset[str] = frozenset()
+        # BM25 keyword index of the collection, kept next to it
+        self.sparse_index: SparseIndex | None = None
+
+        # Engines are built once per configuration and reused until the index changes
+        self.engine_pool = EnginePool()
+
+        # Chat memory of each session, shared by its chat engines and kept when
+        # the index changes (the pooled engines are rebuilt on every ingest).
+        # With a config (`[chat_memory]` section of config.toml) older turns are
+        # folded into a rolling summary within a token budget
+        self.chat_memory_config = (
+            _lower_keys(chat_memory_config) if chat_memory_config else None
+        )
+        self._chat_memories: dict[str, BaseMemory] = {}
+
+        # Latency (retrieval, time to first token, total) of the latest queries
+        self.query_timings: deque[QueryTimings] = deque(maxlen=1000)
+
+        # Per-stage timings and token counts of every query and chat turn
+        # (`[tracing]` section of config.toml); nothing is recorded when disabled
+        tracing_config = _lower_keys(tracing_config or {})
+        self.tracer = (
+            Tracer(**tracing_config) if tracing_config.pop("enabled", False) else None
+        )
+
+        # Token budget of the retrieved context sent to the LLM, whatever the
+        # `top_k` (`[context_budget]` section of config.toml)
+        context_budget_config = _lower_keys(context_budget_config or {})
+        self.context_packer = (
+            TokenBudgetPacker(
+                token_budget=context_budget_config["max_tokens"],
+                model_name=self.model.metadata.model_name,
+                min_node_tokens=context_budget_config.get("min_node_tokens", 64),
+            )
+            if context_budget_config
+            else None
+        )
+
+        # Removal of duplicate and redundant chunks from the retrieved nodes
+        # (`[diversity]` section of config.toml)
+        self.diversity_filter = (
+            DiversityPostprocessor(
+                embedding_lookup=self._get_chunk_embeddings,
+                embed_model=self._get_embed_model(),
+                **_lower_keys(diversity_config),
+            )
+            if diversity_config
+            else None
+        )
+
+    @property
+    def index_version(self) -> int:
+        """Version of the indexed knowledge base, bumped every time it changes."""
+        return self.manifest.version if self.manifest is not None else 0
 
-    def get_existing_filenames(self, chroma_collection: Collection) -> set:
-        """Get existing filenames from the ChromaDB collection.
+    @property
+    def _index_generation(self) -> tuple:
+        """Identify the loaded index, so pooled engines are rebuilt when it changes."""
+        return (id(self.index), self.index_version, self._uncommitted_hashes)
+
+    def _committed_filters(self) -> MetadataFilters | None:
+        """Get the filter that hides the chunks of the ingest in progress, if any."""
+        if not self._uncommitted_hashes:
+            return None
+        return MetadataFilters(
+            filters=[
+                MetadataFilter(
+                    key="file_hash",
+                    value=sorted(self._uncommitted_hashes),
+                    operator=FilterOperator.NIN,
+                )
+            ]
+        )
+
+    def _get_embed_model(self) -> BaseEmbedding:
+        """Get the embedding model used to index and query the documents."""
+        return self.embed_model or Settings.embed_model
+
+    def _index_signature(self) -> str:
+        """Get the chunker/embedding-model signature of the current configuration.
+
+        Files indexed with a different signature are re-embedded, because their
+        chunks are not comparable with the ones produced now. The backend and the
+        shard layout are part of the signature, so switching the backend or enabling
+        sharding moves the files to the new store.
+        """
+        signature = f"{CHUNKER_VERSION}|{embed_model_name(self._get_embed_model())}"
+        if self.vector_store_backend != "chroma":
+            signature += f"|{self.vector_store_backend}"
+        if self.sharding_config is not None:
+            layout = (
+                self.sharding_config.get("strategy", "hash"),
+                self.sharding_config.get("num_shards", 4),
+                self.sharding_config.get("source_key", "file_type"),
+            )
+            signature += f"|shards:{layout}"
+        return signature
+
+    def _start_trace(self, kind: str, query: str, **settings) -> QueryTrace | None:
+        """Start the trace of a query or chat turn, if tracing is enabled."""
+        if self.tracer is None:
+            return None
+        return self.tracer.start(kind, query, **settings)
+
+    def _finish_trace(
+        self,
+        trace: QueryTrace | None,
+        timings: QueryTimings,
+        error: BaseException | None = None,
+    ) -> None:
+        if trace is not None:
+            self.tracer.finish(trace, timings, error)
+
+    @contextlib.contextmanager
+    def _trace_errors(
+        self, trace: QueryTrace | None, timings: QueryTimings, start: float
+    ) -> Iterator[None]:
+        """Record a failed query in its trace, which is then closed."""
+        try:
+            yield
+        except BaseException as e:
+            timings.total_seconds = time.perf_counter() - start
+            self._finish_trace(trace, timings, e)
+            raise
+
+    def _with_postprocessors(self, node_postprocessors: list, top_k: int) -> list:
+        """Surround the given node postprocessors with those of the RAG.
+
+        The diversity filter (if any) runs first, on all the retrieved candidates,
+        keeping `top_k` of them, and the context packer (if any) last, on the
+        nodes sent to the LLM.
+        """
+        return [
+            *(
+                [self.diversity_filter.for_top_k(top_k)]
+                if self.diversity_filter is not None
+                else []
+            ),
+            *node_postprocessors,
+            *([self.context_packer] if self.context_packer is not None else []),
+        ]
+
+    def _candidates_top_k(self, top_k: int) -> int:
+        """Get the chunks to retrieve so that `top_k` survive the diversity filter."""
+        if self.diversity_filter is None:
+            return top_k
+        return top_k * self.diversity_filter.oversample
+
+    def _get_chunk_embeddings(self, node_ids: list[str]) -> dict[str, list[float]]:
+        """Get the embeddings of chunks stored in the collection."""
+        if self.vector_store is None or not node_ids:
+            return {}
+        if isinstance(self.vector_store, (ShardedVectorStore, MmapVectorStore)):
+            return self.vector_store.get_embeddings(node_ids)
+        result = self.vector_store.client.get(ids=node_ids, include=["embeddings"])
+        return dict(zip(result["ids"], result["embeddings"]))
+
+    def _open_sparse_index(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> SparseIndex:
+        """Get the keyword index of a collection, reusing the one already open."""
+        path = sparse_index_path(vector_store_path, chroma_collection_name)
+        if self.sparse_index is None or self.sparse_index.path != path:
+            self.sparse_index = SparseIndex(path)
+        return self.sparse_index
+
+    def _sync_sparse_index(
+        self, n_chunks: int, pages: Iterator[list[BaseNode]]
+    ) -> None:
+        """Rebuild the keyword index when it does not match the collection.
+
+        This happens for collections indexed before the keyword index existed.
+        `pages` yields every chunk of the collection and is only consumed when
+        the index has to be rebuilt.
+        """
+        if self.sparse_index.count() == n_chunks:
+            return
+
+        print("Reconstruyendo el índice de palabras clave...")
+        self.sparse_index.clear()
+        for page in pages:
+            self.sparse_index.add(page)
+
+    def _delete_chunks(self, key: str, value: str) -> None:
+        """Delete from the vector store every chunk whose metadata `key` is `value`."""
+        self.vector_store.delete_nodes(
+            filters=MetadataFilters(filters=[MetadataFilter(key=key, value=value)])
+        )
+        if self.sparse_index is not None:
+            self.sparse_index.delete(key, value)
+
+    def _plan_ingest(
+        self, manifest: IndexManifest, file_paths: list[str]
+    ) -> tuple[dict[str, str], list[tuple[str, str]], list[str]]:
+        """Compare files with a copy of the manifest, updating it.
+
+        Unchanged files are skipped. Files whose content changed have the chunks of
+        their previous version removed once the new version is written. Content that
+        is already indexed under another name is only recorded in the manifest,
+        without embedding it again.
+
+        Parameters
+        ----------
+        manifest : IndexManifest
+            The copy of the manifest updated by this ingest.
+        file_paths : list[str]
+            The paths of the documents to be indexed, named as they must appear
+            in the knowledge base.
+
+        Returns
+        -------
+        dict[str, str]
+            The paths of the files that must be embedded, mapped to their content hash.
+        list[tuple[str, str]]
+            The (content hash, file name) pairs of files whose content is embedded in
+            this same ingest under another name. They are recorded once it finishes.
+        list[str]
+            The content hashes of the previous versions of edited files, whose chunks
+            are deleted once the new versions are written.
+        """
+        files_to_index = {}
+        aliases = []
+        stale_hashes = []
+        for file_path in file_paths:
+            file_name = os.path.basename(file_path)
+            file_hash = file_sha256(file_path)
+            indexed_hash = manifest.hash_for_name(file_name)
+
+            # Same name, same content and same chunker/embedding model: nothing to do
+            if indexed_hash == file_hash and manifest.is_current(file_hash):
+                continue
+
+            # The file was edited: its previous version is queried until the new
+            # one is written, then its chunks are dropped
+            if indexed_hash is not None and indexed_hash != file_hash:
+                stale_hash = manifest.remove_name(file_name)
+                if stale_hash is not None:
+                    stale_hashes.append(stale_hash)
+
+            # The content was indexed with another chunker or embedding model
+            if file_hash in manifest.entries and not manifest.is_current(file_hash):
+                del manifest.entries[file_hash]
+                self._delete_chunks("file_hash", file_hash)
+
+            # Same content already indexed (or about to be) under another name
+            if manifest.is_current(file_hash):
+                manifest.add(file_hash, file_name)
+                continue
+            if file_hash in files_to_index.values():
+                aliases.append((file_hash, file_name))
+                continue
+
+            # Collections created before the manifest existed only know file names
+            if not manifest.exists:
+                self._delete_chunks("file_name", file_name)
+
+            files_to_index[file_path] = file_hash
+
+        # A previous version uploaded again under another name is embedded again
+        indexed_hashes = set(files_to_index.values())
+        for file_hash in indexed_hashes.intersection(stale_hashes):
+            self._delete_chunks("file_hash", file_hash)
+        stale_hashes = [
+            file_hash for file_hash in stale_hashes if file_hash not in indexed_hashes
+        ]
+        return files_to_index, aliases, stale_hashes
+
+    def _load_manifest(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> IndexManifest:
+        """Get the manifest of a collection, reusing the one loaded by the last ingest."""
+        path = manifest_path(vector_store_path, chroma_collection_name)
+        if self.manifest is not None and self.manifest.path == path:
+            return self.manifest
+        return IndexManifest(path=path)
+
+    def get_existing_filenames(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> set:
+        """Get existing filenames from the manifest of the ChromaDB collection.
 
         This method retrieves the filenames of documents that have already been indexed
-        in the ChromaDB collection. It helps to avoid re-indexing documents that are
-        already present in the collection.
+        in the ChromaDB collection. It reads the manifest kept next to the vector store
+        instead of scanning the chunks of the collection.
 
         Parameters
         ----------
-        chroma_collection : Collection
-            The ChromaDB collection from which to retrieve existing filenames.
+        vector_store_path : str
+            The path where the vector store is persisted.
+        chroma_collection_name : str
+            The name of the ChromaDB collection.
 
         Returns
         -------
         set
             A set of filenames that are already indexed in the ChromaDB collection.
         """
-        metadatas = chroma_collection.get().get("metadatas", [])
-        if metadatas:
-            existing_filenames = {
-                metadata["file_name"]
-                for metadata in metadatas
-                if "file_name" in metadata
-            }
-        else:
-            existing_filenames = set()
+        return self._load_manifest(
+            vector_store_path, chroma_collection_name
+        ).file_names()
+
+    def get_indexed_documents(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> list[IndexedDocument]:
+        """Get a summary of the documents indexed in the ChromaDB collection.
 
-        return existing_filenames
+        Parameters
+        ----------
+        vector_store_path : str
+            The path where the vector store is persisted.
+        chroma_collection_name : str
+            The name of the ChromaDB collection.
+
+        Returns
+        -------
+        list[IndexedDocument]
+            One record per indexed file with its number of chunks, size in bytes
+            and indexing date.
+        """
+        return self._load_manifest(
+            vector_store_path, chroma_collection_name
+        ).documents()
+
+    def get_indexed_hashes(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> set[str]:
+        """Get the content hashes of the files indexed in the ChromaDB collection.
+
+        Parameters
+        ----------
+        vector_store_path : str
+            The path where the vector store is persisted.
+        chroma_collection_name : str
+            The name of the ChromaDB collection.
+        """
+        return set(
+            self._load_manifest(vector_store_path, chroma_collection_name).entries
+        )
 
     def create_or_update_rag_index(
-        self, vector_store_path: str, chroma_collection_name: str, data_dir: str
-    ) -> None:
+        self,
+        vector_store_path: str,
+        chroma_collection_name: str,
+        data_dir: str,
+        progress: Callable[[IngestStats], None] | None = None,
+        cancel_event: threading.Event | None = None,
+        source_paths: dict[str, str] | None = None,
+    ) -> IngestStats | None:
         """Create or update the RAG index.
 
         This method initializes the ChromaDB client, creates a new collection if it doesn't
-        exist, and loads documents from the specified data directory. If the vector store
-        already exists, it loads the existing index from storage. It also checks for new files
-        in the data directory and indexes them if they are not already present in the collection.
+        exist, and loads the index from it. The files in the data directory are then compared
+        by content hash with the manifest of the collection: only new or changed files are
+        embedded, the chunks of changed files are replaced and everything else is skipped.
+        New files go through a `ParallelIngestionPipeline` (parallel parsing, batched
+        embedding and bulk writes) and its throughput report is kept in
+        `last_ingest_stats`.
+
+        Updates from several threads run one at a time, while queries keep using
+        the previous documents until the update commits.
 
         Parameters
         ----------
@@ -80,94 +570,885 @@ class RAG:
             The name of the ChromaDB collection to be created or loaded.
         data_dir : str
             The directory containing the documents to be indexed.
+        progress : Callable[[IngestStats], None] | None, optional
+            Called with the live stats of the ingest while it runs, by default None.
+        cancel_event : threading.Event | None, optional
+            When set, the ingest stops, its chunks are removed and
+            `IngestCancelledError` is raised, by default None.
+        source_paths : dict[str, str] | None, optional
+            The path stored in the `file_path` metadata of the chunks of each
+            file, by file name, when `data_dir` is temporary, by default None
+            (the path in `data_dir`).
+
+        Returns
+        -------
+        IngestStats | None
+            The report of the ingest, or None if no file had to be embedded.
+        """
+        with self._update_lock:
+            self._open_index(vector_store_path, chroma_collection_name)
+            return self._ingest_files(
+                [
+                    os.path.join(data_dir, file_name)
+                    for file_name in sorted(os.listdir(data_dir))
+                    if os.path.isfile(os.path.join(data_dir, file_name))
+                ],
+                progress,
+                cancel_event,
+                source_paths,
+            )
+
+    def _open_index(self, vector_store_path: str, chroma_collection_name: str) -> None:
+        """Load the index, keyword index and manifest of a collection.
+
+        The collection is created if it does not exist. The new index replaces
+        the loaded one at the end, so queries in flight finish on the previous one.
         """
         if not os.path.exists(vector_store_path):
             os.makedirs(vector_store_path)
 
-        # Initialize the ChromaDB client
-        db = chromadb.PersistentClient(path=vector_store_path)
+        if self.vector_store_backend == "mmap":
+            store_path = mmap_store_path(vector_store_path, chroma_collection_name)
+            # Reopening is cheap, but engines in flight may still use the open store
+            if isinstance(self.vector_store, MmapVectorStore) and (
+                self.vector_store.path == store_path
+            ):
+                vector_store = self.vector_store
+            else:
+                vector_store = MmapVectorStore(
+                    path=store_path, **self.vector_store_config
+                )
+            n_chunks = vector_store.count()
+            pages = vector_store.iter_nodes()
+        else:
+            vector_store, n_chunks, pages = self._open_chroma(
+                vector_store_path, chroma_collection_name
+            )
 
-        # Create a new collection
-        chroma_collection = db.get_or_create_collection(chroma_collection_name)
+        index = VectorStoreIndex.from_vector_store(
+            vector_store, embed_model=self._get_embed_model()
+        )
 
-        # Assign chroma as the vector_store to the context
-        vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
-        storage_context = StorageContext.from_defaults(vector_store=vector_store)
+        # The keyword index is updated with the same chunks as the collection
+        self._open_sparse_index(vector_store_path, chroma_collection_name)
+        self._sync_sparse_index(n_chunks, pages)
 
-        if (
-            not os.path.exists(vector_store_path)
-            or len(os.listdir(vector_store_path)) == 0
-        ):
-            # Load documents
-            documents = SimpleDirectoryReader(data_dir).load_data()
-            # Verify that there are no empty documents
-            for doc in documents:
-                if not doc:
-                    print("Documento vacío encontrado")
+        self.vector_store = vector_store
+        self.index = index
+        self.manifest = IndexManifest(
+            path=manifest_path(vector_store_path, chroma_collection_name),
+            signature=self._index_signature(),
+        )
 
-            # Create index
-            index = VectorStoreIndex.from_documents(
-                documents, storage_context=storage_context
-            )
-            self.index = index
+    def _open_chroma(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> tuple[ChromaVectorStore | ShardedVectorStore, int, Iterator[list[BaseNode]]]:
+        """Open a ChromaDB collection (or its shards) as a vector store.
 
-            return
+        Returns
+        -------
+        ChromaVectorStore | ShardedVectorStore
+            The vector store of the collection.
+        int
+            The number of chunks in the collection.
+        Iterator[list[BaseNode]]
+            The chunks of the collection, read lazily in pages.
+        """
+        # The ChromaDB client of the directory, opened once per process
+        db = shared_chroma_client(vector_store_path)
+
+        if self.sharding_config is None:
+            # Create a new collection
+            chroma_collection = db.get_or_create_collection(chroma_collection_name)
+            chroma_collections = [chroma_collection]
+
+            # Assign chroma as the vector_store and load the index from it
+            vector_store = ChromaVectorStore(chroma_collection=chroma_collection)
         else:
-            # Load index from storage
-            index = VectorStoreIndex.from_vector_store(
-                vector_store, storage_context=storage_context
+            # The chunks are spread over several collections, queried in parallel
+            vector_store = ShardedVectorStore(
+                client=db,
+                collection_name=chroma_collection_name,
+                **self.sharding_config,
             )
+            chroma_collections = vector_store.collections()
+
+        return (
+            vector_store,
+            sum(collection.count() for collection in chroma_collections),
+            _chroma_pages(chroma_collections),
+        )
+
+    def _ensure_index(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> None:
+        """Open a collection unless it is the one already loaded."""
+        path = manifest_path(vector_store_path, chroma_collection_name)
+        if self.index is None or self.manifest is None or self.manifest.path != path:
+            self._open_index(vector_store_path, chroma_collection_name)
 
-            # Get existing filenames previously indexed
-            # Note: This assume that we can get metadata from the documents
+    def _publish_manifest(self, manifest: IndexManifest) -> None:
+        """Persist an updated copy of the manifest and make it the current one.
+
+        Nothing is done if its entries are those of the current manifest.
+        """
+        if manifest.entries != self.manifest.entries:
+            manifest.save()
+            self.manifest = manifest
+            # Cached answers were generated from the previous documents
+            if self.response_cache is not None:
+                self.response_cache.invalidate()
+
+    def _ingest_files(
+        self,
+        file_paths: list[str],
+        progress: Callable[[IngestStats], None] | None = None,
+        cancel_event: threading.Event | None = None,
+        source_paths: dict[str, str] | None = None,
+    ) -> IngestStats | None:
+        """Embed the new or changed files into the open collection.
+
+        The new chunks are hidden from queries until the manifest that lists
+        them is published. `source_paths` maps file names to the path stored in
+        the chunks, when the files are read from a temporary directory.
+        """
+        source_paths = source_paths or {}
+        manifest = self.manifest.copy()
+        files_to_index, aliases, stale_hashes = self._plan_ingest(manifest, file_paths)
+
+        stats = None
+        if files_to_index:
+            # only index new or changed files
+            pipeline = ParallelIngestionPipeline(
+                embed_model=self._get_embed_model(),
+                vector_store=self.vector_store,
+                transformations=Settings.transformations,
+                embedding_cache=self.embedding_cache,
+                sparse_index=self.sparse_index,
+                document_cache=self.document_cache,
+                progress=progress,
+                cancel_event=cancel_event,
+                **self.ingestion_config,
+            )
+            self._uncommitted_hashes = frozenset(files_to_index.values())
             try:
-                existing_filenames = self.get_existing_filenames(chroma_collection)
-            except Exception as e:
-                print(f"WARNING: (Error: {e})")
-                # If the collection is empty, set the existing filenames to an empty set
-                existing_filenames = set()
-
-            all_files = os.listdir(data_dir)
-            new_files = set(all_files) - existing_filenames
-
-            if new_files:
-                new_file_paths = [os.path.join(data_dir, file) for file in new_files]
-                # Verify that the files exist
-                new_files_paths = [
-                    path for path in new_file_paths if os.path.exists(path)
-                ]
-                # only index new files
-                new_documents = SimpleDirectoryReader(
-                    input_files=new_files_paths
-                ).load_data()
-
-                # TODO: Filtrar documentos vaciós?
-                if new_documents:
-                    for new_doc in new_documents:
-                        index.insert(new_doc)
-
-            self.index = index
-            return
+                stats = pipeline.run(
+                    files_to_index,
+                    {
+                        file_path: source_paths[os.path.basename(file_path)]
+                        for file_path in files_to_index
+                        if os.path.basename(file_path) in source_paths
+                    },
+                )
+            except Exception:
+                # Do not leave half-written files behind: they are not in the
+                # manifest, so the next ingest would index them again
+                for file_hash in files_to_index.values():
+                    self._delete_chunks("file_hash", file_hash)
+                self._uncommitted_hashes = frozenset()
+                raise
+            self.last_ingest_stats = stats
+            print(f"Ingesta: {stats.summary()}")
+
+            for file_path, file_hash in files_to_index.items():
+                manifest.add(
+                    file_hash,
+                    os.path.basename(file_path),
+                    chunks=stats.chunks_by_hash[file_hash],
+                    size=os.path.getsize(file_path),
+                )
+            for file_hash, file_name in aliases:
+                manifest.add(file_hash, file_name)
+
+        # The new versions are written: show them and drop the previous ones
+        self._uncommitted_hashes = frozenset()
+        for file_hash in stale_hashes:
+            self._delete_chunks("file_hash", file_hash)
+        self._publish_manifest(manifest)
+        return stats
+
+    def upsert_document(
+        self,
+        vector_store_path: str,
+        chroma_collection_name: str,
+        file_path: str,
+        progress: Callable[[IngestStats], None] | None = None,
+        cancel_event: threading.Event | None = None,
+        source_path: str | None = None,
+    ) -> IngestStats | None:
+        """Add a document to the knowledge base, or replace the indexed version.
+
+        The document is indexed under its file name. If a previous version with
+        that name is indexed, its chunks are deleted and only the new file is
+        embedded, so the cost depends on the document, not on the knowledge base.
 
-    def build_chat_engine(self, chat_mode: str, top_k: int):
-        chat_engine = self.index.as_chat_engine(
+        Parameters
+        ----------
+        vector_store_path : str
+            The path where the vector store is persisted.
+        chroma_collection_name : str
+            The name of the ChromaDB collection.
+        file_path : str
+            The path of the new version of the document.
+        progress : Callable[[IngestStats], None] | None, optional
+            Called with the live stats of the ingest while it runs, by default None.
+        cancel_event : threading.Event | None, optional
+            When set, the ingest stops and `IngestCancelledError` is raised,
+            by default None.
+        source_path : str | None, optional
+            The path stored in the `file_path` metadata of the chunks, when
+            `file_path` is temporary, by default None (`file_path`).
+
+        Returns
+        -------
+        IngestStats | None
+            The report of the ingest, or None if the document was not embedded.
+        """
+        with self._update_lock:
+            self._ensure_index(vector_store_path, chroma_collection_name)
+            return self._ingest_files(
+                [file_path],
+                progress,
+                cancel_event,
+                {os.path.basename(file_path): source_path} if source_path else None,
+            )
+
+    def delete_document(
+        self, vector_store_path: str, chroma_collection_name: str, file_name: str
+    ) -> None:
+        """Remove a document from the knowledge base.
+
+        Its chunks are deleted by metadata from the collection and the keyword
+        index. Content also indexed under another file name is kept for it.
+
+        Parameters
+        ----------
+        vector_store_path : str
+            The path where the vector store is persisted.
+        chroma_collection_name : str
+            The name of the ChromaDB collection.
+        file_name : str
+            The name of the indexed document.
+        """
+        with self._update_lock:
+            self._ensure_index(vector_store_path, chroma_collection_name)
+            manifest = self.manifest.copy()
+
+            if manifest.hash_for_name(file_name) is None:
+                # Collections created before the manifest existed only know file names
+                self._delete_chunks("file_name", file_name)
+                if self.response_cache is not None:
+                    self.response_cache.invalidate()
+            else:
+                stale_hash = manifest.remove_name(file_name)
+                if stale_hash is not None:
+                    self._delete_chunks("file_hash", stale_hash)
+
+            self._publish_manifest(manifest)
+
+    def clear_knowledge_base(
+        self, vector_store_path: str, chroma_collection_name: str
+    ) -> None:
+        """Empty the collection (or its shards) and delete its manifest.
+
+        The collections are emptied instead of deleted, so queries in flight
+        still find them.
+
+        Parameters
+        ----------
+        vector_store_path : str
+            The path where the vector store is persisted.
+        chroma_collection_name : str
+            The name of the collection to be deleted.
+        """
+        with self._update_lock:
+            if self.vector_store_backend == "mmap":
+                store_path = mmap_store_path(vector_store_path, chroma_collection_name)
+                if (
+                    isinstance(self.vector_store, MmapVectorStore)
+                    and self.vector_store.path == store_path
+                ):
+                    # The open store stays usable, empty
+                    self.vector_store.clear()
+                else:
+                    shutil.rmtree(store_path, ignore_errors=True)
+            else:
+                db = shared_chroma_client(vector_store_path)
+                if self.sharding_config is None:
+                    collection_names = [chroma_collection_name]
+                else:
+                    collection_names = shard_collection_names(
+                        db, chroma_collection_name
+                    )
+                for collection_name in collection_names:
+                    ChromaVectorStore(
+                        chroma_collection=db.get_or_create_collection(collection_name)
+                    ).clear()
+
+            path = manifest_path(vector_store_path, chroma_collection_name)
+            if os.path.exists(path):
+                os.remove(path)
+            self.manifest = None
+            self._open_sparse_index(vector_store_path, chroma_collection_name).clear()
+
+            if self.response_cache is not None:
+                self.response_cache.invalidate()
+
+    def build_retriever(self, top_k: int, retriever_mode: str = "vector"):
+        """Build a retriever of the index.
+
+        When the diversity filter is enabled, the retriever returns its
+        `oversample` times `top_k` candidates, which the filter narrows down.
+
+        Parameters
+        ----------
+        top_k : int
+            The number of chunks retrieved per query.
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+        """
+        if retriever_mode not in RETRIEVER_MODES:
+            raise ValueError("Invalid retriever mode. Choose 'vector' or 'hybrid'.")
+        top_k = self._candidates_top_k(top_k)
+        filters = self._committed_filters()
+        if retriever_mode == "vector":
+            return self.index.as_retriever(similarity_top_k=top_k, filters=filters)
+
+        candidates = top_k * HYBRID_CANDIDATES_PER_CHUNK
+        return HybridRetriever(
+            vector_retriever=self.index.as_retriever(
+                similarity_top_k=candidates, filters=filters
+            ),
+            sparse_index=self.sparse_index,
+            vector_store=self.vector_store,
+            top_k=top_k,
+            candidates_per_side=candidates,
+            filters=filters,
+        )
+
+    def build_chat_engine(
+        self,
+        chat_mode: str,
+        top_k: int,
+        session_id: str = "default",
+        retriever_mode: str = "vector",
+    ):
+        """Get the chat engine of a session from the engine pool.
+
+        Parameters
+        ----------
+        chat_mode : str
+            The chat mode of the engine ("context", "condense_plus_context", ...).
+        top_k : int
+            The number of chunks retrieved per message.
+        session_id : str, optional
+            The session that owns the engine and its chat memory, by default "default".
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+            The hybrid mode supports the "context" and "condense_plus_context"
+            chat modes.
+        """
+        if retriever_mode not in RETRIEVER_MODES:
+            raise ValueError("Invalid retriever mode. Choose 'vector' or 'hybrid'.")
+
+        def build():
+            if retriever_mode == "vector":
+                return self.index.as_chat_engine(
+                    chat_mode=chat_mode,
+                    verbose=True,
+                    system_prompt=self.system_prompt,
+                    similarity_top_k=self._candidates_top_k(top_k),
+                    filters=self._committed_filters(),
+                    llm=self.model,
+                    memory=self.get_chat_memory(session_id),
+                    node_postprocessors=self._with_postprocessors([], top_k),
+                )
+
+            engines = {
+                "context": ContextChatEngine,
+                "condense_plus_context": CondensePlusContextChatEngine,
+            }
+            if chat_mode not in engines:
+                raise ValueError(
+                    "The hybrid retriever supports the 'context' and "
+                    "'condense_plus_context' chat modes."
+                )
+            return engines[chat_mode].from_defaults(
+                retriever=self.build_retriever(top_k, retriever_mode),
+                llm=self.model,
+                memory=self.get_chat_memory(session_id),
+                system_prompt=self.system_prompt,
+                node_postprocessors=self._with_postprocessors([], top_k),
+                verbose=True,
+            )
+
+        return self.engine_pool.get(
+            ("chat", session_id, chat_mode, top_k, retriever_mode),
+            self._index_generation,
+            build,
+        )
+
+    def get_chat_memory(self, session_id: str) -> BaseMemory:
+        """Get the chat memory of a session, creating it if needed.
+
+        It is the summarized memory of the `[chat_memory]` config, or else the
+        default LlamaIndex memory (the latest turns that fit in the context).
+        """
+        if session_id not in self._chat_memories:
+            memory = (
+                SummaryChatMemory(
+                    llm=self.model,
+                    model_name=self.model.metadata.model_name,
+                    **self.chat_memory_config,
+                )
+                if self.chat_memory_config is not None
+                else ChatMemoryBuffer.from_defaults(llm=self.model)
+            )
+            # `setdefault` keeps one memory if two threads create it at once
+            self._chat_memories.setdefault(session_id, memory)
+            # Sessions of a shared RAG (e.g. closed browser tabs) are never ended
+            if len(self._chat_memories) > MAX_CHAT_SESSIONS:
+                self.end_chat_session(next(iter(self._chat_memories)))
+        return self._chat_memories[session_id]
+
+    def end_chat_session(self, session_id: str) -> None:
+        """Release the chat engines (and chat memory) of a session."""
+        self.engine_pool.discard_prefix(("chat", session_id))
+        self._chat_memories.pop(session_id, None)
+
+    def build_query_engine(
+        self,
+        response_mode: str,
+        top_k: int,
+        retriever_mode: str = "vector",
+        **kwargs,
+    ):
+        """Get a query engine from the engine pool.
+
+        Engines are keyed by response mode, `top_k`, retriever mode and the rest
+        of the keyword arguments (e.g. `node_postprocessors`), which are passed to
+        `VectorStoreIndex.as_query_engine`.
+
+        Parameters
+        ----------
+        response_mode : str
+            The response mode of the synthesizer ("tree_summarize", "compact", ...).
+        top_k : int
+            The number of chunks retrieved per query.
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+        """
+        if retriever_mode not in RETRIEVER_MODES:
+            raise ValueError("Invalid retriever mode. Choose 'vector' or 'hybrid'.")
+
+        def build():
+            engine_kwargs = {
+                **kwargs,
+                "node_postprocessors": self._with_postprocessors(
+                    kwargs.get("node_postprocessors", []), top_k
+                ),
+            }
+            if retriever_mode == "vector":
+                query_engine = self.index.as_query_engine(
+                    response_mode=response_mode,
+                    verbose=True,
+                    similarity_top_k=self._candidates_top_k(top_k),
+                    filters=self._committed_filters(),
+                    llm=self.model,
+                    **engine_kwargs,
+                )
+            else:
+                query_engine = RetrieverQueryEngine.from_args(
+                    retriever=self.build_retriever(top_k, retriever_mode),
+                    llm=self.model,
+                    response_mode=response_mode,
+                    verbose=True,
+                    **engine_kwargs,
+                )
+
+            # Repeated or near-duplicate questions are answered from the cache
+            if self.response_cache is not None:
+                query_engine = CachedQueryEngine(
+                    query_engine=query_engine,
+                    cache=self.response_cache,
+                    embed_model=self._get_embed_model(),
+                    # Engines with other postprocessors or prompts do not share answers
+                    scope=(
+                        self.index_version,
+                        response_mode,
+                        top_k,
+                        retriever_mode,
+                        _kwargs_key(kwargs),
+                    ),
+                )
+            return query_engine
+
+        key = ("query", response_mode, top_k, retriever_mode, _kwargs_key(kwargs))
+        return self.engine_pool.get(key, self._index_generation, build)
+
+    def stream_query(
+        self,
+        query: str,
+        response_mode: str,
+        top_k: int,
+        retriever_mode: str = "vector",
+        **kwargs,
+    ) -> QueryStream:
+        """Answer a query streaming its tokens.
+
+        Retrieval runs before this method returns, so the source nodes can be shown
+        while the answer is being synthesized. Synthesis starts when the tokens of
+        `response_gen` are first requested. Answers found in the response cache
+        are returned as a single token.
+
+        Parameters
+        ----------
+        query : str
+            The user query.
+        response_mode : str
+            The response mode of the synthesizer ("tree_summarize", "compact", ...).
+        top_k : int
+            The number of chunks retrieved for the query.
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+        **kwargs
+            Extra arguments for `build_query_engine`, e.g. `node_postprocessors`.
+
+        Returns
+        -------
+        QueryStream
+            The source nodes, the token generator, the timings of the query and
+            the stats of its node postprocessors. The timings are also appended
+            to `query_timings`.
+        """
+        start = time.perf_counter()
+        timings = QueryTimings(query=query)
+        trace = self._start_trace(
+            "query",
+            query,
+            response_mode=response_mode,
+            top_k=top_k,
+            retriever_mode=retriever_mode,
+        )
+        with self._trace_errors(trace, timings, start):
+            query_engine = self.build_query_engine(
+                response_mode=response_mode,
+                top_k=top_k,
+                retriever_mode=retriever_mode,
+                streaming=True,
+                **kwargs,
+            )
+            query_bundle = QueryBundle(query)
+            self.query_timings.append(timings)
+
+            if isinstance(query_engine, CachedQueryEngine):
+                cached = query_engine.lookup(query_bundle)
+                if cached is not None:
+                    timings.cached = True
+                    return QueryStream(
+                        source_nodes=cached.source_nodes,
+                        timings=timings,
+                        tokens=lambda: [cached.response or ""],
+                        start=start,
+                        on_complete=lambda _: self._finish_trace(trace, timings),
+                        on_error=lambda e: self._finish_trace(trace, timings, e),
+                        trace=trace,
+                    )
+
+            with collect_postprocessor_stats() as postprocessor_stats:
+                nodes = query_engine.retrieve(query_bundle)
+        timings.retrieval_seconds = time.perf_counter() - start
+
+        def on_complete(response_txt: str) -> None:
+            if isinstance(query_engine, CachedQueryEngine):
+                query_engine.store(
+                    query_bundle, Response(response=response_txt, source_nodes=nodes)
+                )
+            self._finish_trace(trace, timings)
+
+        return QueryStream(
+            source_nodes=nodes,
+            timings=timings,
+            tokens=lambda: query_engine.synthesize(query_bundle, nodes).response_gen,
+            start=start,
+            on_complete=on_complete,
+            on_error=lambda e: self._finish_trace(trace, timings, e),
+            trace=trace,
+            postprocessor_stats=postprocessor_stats,
+        )
+
+    def stream_chat(
+        self,
+        message: str,
+        chat_mode: str,
+        top_k: int,
+        session_id: str = "default",
+        retriever_mode: str = "vector",
+    ) -> QueryStream:
+        """Answer a chat message streaming its tokens.
+
+        Question condensation and retrieval run before this method returns, and
+        the timings of the turn are recorded like those of `stream_query`.
+
+        Parameters
+        ----------
+        message : str
+            The user message.
+        chat_mode : str
+            The chat mode of the engine ("context", "condense_plus_context", ...).
+        top_k : int
+            The number of chunks retrieved per message.
+        session_id : str, optional
+            The session that owns the chat memory, by default "default".
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+        """
+        start = time.perf_counter()
+        timings = QueryTimings(query=message)
+        trace = self._start_trace(
+            "chat",
+            message,
             chat_mode=chat_mode,
-            verbose=True,
-            system_prompt=self.system_prompt,
-            similarity_top_k=top_k,
-            llm=self.model,
+            top_k=top_k,
+            retriever_mode=retriever_mode,
+        )
+        with self._trace_errors(trace, timings, start):
+            chat_engine = self.build_chat_engine(
+                chat_mode, top_k, session_id, retriever_mode
+            )
+            self.query_timings.append(timings)
+            with collect_postprocessor_stats() as postprocessor_stats:
+                response = chat_engine.stream_chat(message)
+        timings.retrieval_seconds = time.perf_counter() - start
+
+        return QueryStream(
+            source_nodes=response.source_nodes,
+            timings=timings,
+            tokens=lambda: response.response_gen,
+            start=start,
+            on_complete=lambda _: self._finish_trace(trace, timings),
+            on_error=lambda e: self._finish_trace(trace, timings, e),
+            trace=trace,
+            postprocessor_stats=postprocessor_stats,
         )
-        return chat_engine
 
-    def build_query_engine(self, response_mode: str, top_k: int, **kwargs):
-        query_engine = self.index.as_query_engine(
+    async def aquery(
+        self,
+        query: str,
+        response_mode: str,
+        top_k: int,
+        retriever_mode: str = "vector",
+        **kwargs,
+    ) -> RESPONSE_TYPE:
+        """Asynchronously answer a query with a pooled query engine.
+
+        At most the configured number of calls run concurrently per model
+        provider; further calls wait for a free slot (backpressure) and fail
+        with `ProviderBusyError` when too many are already waiting. The stats of
+        the node postprocessors are returned in the "postprocessor_stats" entry
+        of the response metadata.
+
+        Parameters
+        ----------
+        query : str
+            The user query.
+        response_mode : str
+            The response mode of the synthesizer ("tree_summarize", "compact", ...).
+        top_k : int
+            The number of chunks retrieved for the query.
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+        **kwargs
+            Extra arguments for `build_query_engine`, e.g. `node_postprocessors`.
+        """
+        start = time.perf_counter()
+        query_engine = self.build_query_engine(
             response_mode=response_mode,
-            verbose=True,
-            similarity_top_k=top_k,
-            llm=self.model,
+            top_k=top_k,
+            retriever_mode=retriever_mode,
             **kwargs,
         )
-        return query_engine
+        timings = QueryTimings(query=query)
+        async with self.limiter:
+            trace = self._start_trace(
+                "query",
+                query,
+                response_mode=response_mode,
+                top_k=top_k,
+                retriever_mode=retriever_mode,
+            )
+            with self._trace_errors(trace, timings, start):
+                with collect_postprocessor_stats() as postprocessor_stats:
+                    response = await query_engine.aquery(query)
+
+        timings.total_seconds = time.perf_counter() - start
+        self.query_timings.append(timings)
+        self._finish_trace(trace, timings)
+        # Stats of this query only, on a copy: cached responses are shared
+        response = copy.copy(response)
+        response.metadata = {
+            **(response.metadata or {}),
+            "postprocessor_stats": postprocessor_stats,
+        }
+        return response
+
+    async def achat(
+        self,
+        message: str,
+        chat_mode: str,
+        top_k: int,
+        session_id: str = "default",
+        retriever_mode: str = "vector",
+    ) -> str:
+        """Asynchronously answer a chat message with the chat engine of a session.
+
+        Parameters
+        ----------
+        message : str
+            The user message.
+        chat_mode : str
+            The chat mode of the engine ("context", "condense_plus_context", ...).
+        top_k : int
+            The number of chunks retrieved per message.
+        session_id : str, optional
+            The session that owns the chat memory, by default "default".
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+        """
+        start = time.perf_counter()
+        chat_engine = self.build_chat_engine(
+            chat_mode, top_k, session_id, retriever_mode
+        )
+        timings = QueryTimings(query=message)
+        async with self.limiter:
+            trace = self._start_trace(
+                "chat",
+                message,
+                chat_mode=chat_mode,
+                top_k=top_k,
+                retriever_mode=retriever_mode,
+            )
+            with self._trace_errors(trace, timings, start):
+                response = await chat_engine.achat(message)
+
+        timings.total_seconds = time.perf_counter() - start
+        self.query_timings.append(timings)
+        self._finish_trace(trace, timings)
+        return response.response
+
+    async def astream_chat(
+        self,
+        message: str,
+        chat_mode: str,
+        top_k: int,
+        session_id: str = "default",
+        retriever_mode: str = "vector",
+    ) -> AsyncGenerator[str, None]:
+        """Asynchronously stream the answer to a chat message, token by token.
+
+        The provider slot is held until the last token has been received.
+
+        Parameters
+        ----------
+        message : str
+            The user message.
+        chat_mode : str
+            The chat mode of the engine ("context", "condense_plus_context", ...).
+        top_k : int
+            The number of chunks retrieved per message.
+        session_id : str, optional
+            The session that owns the chat memory, by default "default".
+        retriever_mode : str, optional
+            "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+        """
+        start = time.perf_counter()
+        chat_engine = self.build_chat_engine(
+            chat_mode, top_k, session_id, retriever_mode
+        )
+        timings = QueryTimings(query=message)
+        async with self.limiter:
+            trace = self._start_trace(
+                "chat",
+                message,
+                chat_mode=chat_mode,
+                top_k=top_k,
+                retriever_mode=retriever_mode,
+            )
+            with self._trace_errors(trace, timings, start):
+                response = await chat_engine.astream_chat(message)
+                timings.retrieval_seconds = time.perf_counter() - start
+                async for token in response.async_response_gen():
+                    if timings.time_to_first_token is None:
+                        timings.time_to_first_token = time.perf_counter() - start
+                    yield token
+
+        timings.total_seconds = time.perf_counter() - start
+        self.query_timings.append(timings)
+        self._finish_trace(trace, timings)
+
+
+def _provider_llm(model: str) -> LLM:
+    """Build the client of a supported model, with the API key of its provider."""
+    if model not in PROVIDERS:
+        raise ValueError("Invalid model. Choose 'gemini-2.0-flash' or 'gpt-4o-mini'.")
+
+    if model == "gemini-2.0-flash":
+        return GoogleGenAI(
+            model=f"models/{model}", api_key=os.environ["GEMINI_API_KEY"]
+        )
+    # The HTTP clients (and their connection pools) are shared by every RAG
+    return OpenAI(
+        model=model,
+        api_key=os.environ["OPENAI_API_KEY"],
+        http_client=shared_http_client(),
+        async_http_client=shared_async_http_client(),
+        reuse_client=True,
+    )
+
+
+def _lower_keys(config: dict) -> dict:
+    """Turn a config.toml section (UPPERCASE keys) into keyword arguments."""
+    return {key.lower(): value for key, value in config.items()}
+
+
+def _chroma_pages(
+    chroma_collections: list, page_size: int = 1000
+) -> Iterator[list[BaseNode]]:
+    """Read the chunks of ChromaDB collections in pages of `page_size`."""
+    for chroma_collection in chroma_collections:
+        offset = 0
+        while True:
+            page = chroma_collection.get(
+                limit=page_size, offset=offset, include=["documents", "metadatas"]
+            )
+            if not page["ids"]:
+                break
+            yield [
+                TextNode(id_=node_id, text=text, metadata=metadata)
+                for node_id, text, metadata in zip(
+                    page["ids"], page["documents"], page["metadatas"]
+                )
+            ]
+            offset += page_size
+
+
+def _kwargs_key(kwargs: dict) -> tuple:
+    """Build a hashable key from engine keyword arguments.
+
+    Lists (like `node_postprocessors`) are keyed by the repr of their items, so
+    two lists of postprocessors with the same configuration share an engine.
+    """
+    return tuple(
+        (
+            name,
+            (
+                tuple(repr(item) for item in value)
+                if isinstance(value, (list, tuple))
+                else repr(value)
+            ),
+        )
+        for name, value in sorted(kwargs.items())
+    )
 
 
 def main():
@@ -180,6 +1461,18 @@ def main():
     rag = RAG(
         system_prompt="Eres un asistente virtual que ayuda a los usuarios a encontrar información en documentos. ",
         model=config["openai"]["MODEL_NAME"],
+        ingestion_config=config.get("ingestion"),
+        embedding_cache_config=config.get("embedding_cache"),
+        response_cache_config=config.get("response_cache"),
+        concurrency_config=config.get("concurrency"),
+        tracing_config=config.get("tracing"),
+        context_budget_config=config.get("context_budget"),
+        diversity_config=config.get("diversity"),
+        sharding_config=config.get("sharding"),
+        vector_store_config=config.get("vector_store"),
+        document_cache_config=config.get("document_cache"),
+        chat_memory_config=config.get("chat_memory"),
+        router_config=config.get("router"),
     )
 
     rag.create_or_update_rag_index(
@@ -0,0 +1,355 @@
+"""Headless batch runner: answer the questions of a JSONL file with the RAG.
+
+Each input line is a JSON object with a "question" and an optional "id" (the
+line number by default). Each output line holds the answer, its sources, the
+latency and the token counts of one question. The output is appended as the
+answers arrive, so an interrupted run resumes where it stopped: questions
+already answered are skipped and the failed ones are retried.
+
+Example
+-------
+python Example-Projects/Streamlit-RAG-Chat/models/batch.py \\
+    --questions preguntas.jsonl --output respuestas.jsonl \\
+    --data-dir Quick-Examples/data --engine query --mode tree_summarize
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import TypedDict
+
+import toml
+from dotenv import load_dotenv
+
+# Añadir el directorio padre al path para poder importar models
+sys.path.append(str(Path(__file__).parents[1]))
+from models.RAG import PROVIDERS, RAG, RETRIEVER_MODES
+from models.token_budget import count_tokens
+
+
+class BatchQuestion(TypedDict):
+    """Class to store one question of the input file."""
+
+    id: str
+    question: str
+
+
+class BatchAnswer(TypedDict, total=False):
+    """Class to store the answer to one question in the output file."""
+
+    id: str
+    question: str
+    answer: str
+    sources: list[dict]
+    latency_seconds: float
+    # Counted with the local tokenizer of the model: question, context and answer
+    tokens: dict[str, int]
+    engine: str
+    mode: str
+    top_k: int
+    retriever_mode: str
+    error: str
+
+
+def load_questions(path: str) -> list[BatchQuestion]:
+    """Read the questions of a JSONL file, skipping blank lines.
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSONL file with the questions.
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            questions.append(
+                BatchQuestion(
+                    id=str(record.get("id", line_number)),
+                    question=record["question"],
+                )
+            )
+    return questions
+
+
+def answered_ids(path: str) -> set[str]:
+    """Get the ids already answered without error in an output file.
+
+    A truncated last line (e.g. the process was killed while writing it) is
+    ignored, so that question is answered again.
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSONL output file.
+    """
+    if not os.path.exists(path):
+        return set()
+
+    ids = set()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if "error" not in record:
+                ids.add(record["id"])
+    return ids
+
+
+def _source_data(source_nodes) -> list[dict]:
+    return [
+        {
+            "file_name": node.metadata.get("file_name", "Desconocido"),
+            "page_label": node.metadata.get("page_label", "N/A"),
+            "score": node.score,
+        }
+        for node in source_nodes
+    ]
+
+
+class BatchRunner:
+    """Answer many questions concurrently with one RAG.
+
+    `concurrency` workers take questions from a queue, so at most that many
+    questions are in flight. The calls to the model provider also go through
+    the provider limiter of the RAG (concurrency and rate limit).
+
+    Parameters
+    ----------
+    rag : RAG
+        The RAG, with its index already loaded.
+    engine : str
+        The engine used to answer: "query" or "chat".
+    mode : str
+        The response mode of the query engine or the chat mode of the chat engine.
+    top_k : int
+        The number of chunks retrieved per question.
+    concurrency : int, optional
+        The number of questions answered at the same time, by default 8.
+    retriever_mode : str, optional
+        "vector" or "hybrid" (vector + BM25 keyword search), by default "vector".
+    """
+
+    def __init__(
+        self,
+        rag: RAG,
+        engine: str,
+        mode: str,
+        top_k: int,
+        concurrency: int = 8,
+        retriever_mode: str = "vector",
+    ):
+        if engine not in ["query", "chat"]:
+            raise ValueError("Invalid engine. Choose 'query' or 'chat'.")
+
+        self.rag = rag
+        self.engine = engine
+        self.mode = mode
+        self.top_k = top_k
+        self.concurrency = concurrency
+        self.retriever_mode = retriever_mode
+
+    def _count_tokens(self, text: str) -> int:
+        return count_tokens(text, self.rag.model.metadata.model_name)
+
+    async def answer(self, question: BatchQuestion) -> BatchAnswer:
+        """Answer one question, recording the error instead of raising it."""
+        record = BatchAnswer(
+            id=question["id"],
+            question=question["question"],
+            engine=self.engine,
+            mode=self.mode,
+            top_k=self.top_k,
+            retriever_mode=self.retriever_mode,
+        )
+        start = time.perf_counter()
+        try:
+            if self.engine == "query":
+                response = await self.rag.aquery(
+                    question["question"], self.mode, self.top_k, self.retriever_mode
+                )
+                answer = str(response)
+            else:
+                # Every question gets its own chat memory
+                session_id = f"batch-{question['id']}"
+                chat_engine = self.rag.build_chat_engine(
+                    self.mode, self.top_k, session_id, self.retriever_mode
+                )
+                try:
+                    async with self.rag.limiter:
+                        response = await chat_engine.achat(question["question"])
+                finally:
+                    self.rag.end_chat_session(session_id)
+                answer = response.response
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+            record["latency_seconds"] = time.perf_counter() - start
+            return record
+
+        record["latency_seconds"] = time.perf_counter() - start
+        record["answer"] = answer
+        record["sources"] = _source_data(response.source_nodes)
+        record["tokens"] = {
+            "question": self._count_tokens(question["question"]),
+            "context": sum(
+                self._count_tokens(node.get_content()) for node in response.source_nodes
+            ),
+            "answer": self._count_tokens(answer),
+        }
+        return record
+
+    async def run(self, questions: list[BatchQuestion], output_path: str) -> dict:
+        """Answer the questions not yet in the output file and append the answers.
+
+        Parameters
+        ----------
+        questions : list[BatchQuestion]
+            The questions to answer.
+        output_path : str
+            The JSONL file where the answers are appended.
+
+        Returns
+        -------
+        dict
+            The number of questions answered, failed and skipped, and the
+            elapsed time and throughput of the run.
+        """
+        done = answered_ids(output_path)
+        pending = [question for question in questions if question["id"] not in done]
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for question in pending:
+            queue.put_nowait(question)
+
+        stats = {"answered": 0, "failed": 0, "skipped": len(questions) - len(pending)}
+        start = time.perf_counter()
+
+        with open(output_path, "a", encoding="utf-8") as output:
+
+            async def worker():
+                while not queue.empty():
+                    question = queue.get_nowait()
+                    record = await self.answer(question)
+                    # Written and flushed one by one, so a killed run can resume
+                    output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    output.flush()
+                    stats["failed" if "error" in record else "answered"] += 1
+
+            await asyncio.gather(*[worker() for _ in range(self.concurrency)])
+
+        stats["elapsed_seconds"] = time.perf_counter() - start
+        stats["questions_per_second"] = (
+            stats["answered"] / stats["elapsed_seconds"]
+            if stats["elapsed_seconds"]
+            else 0.0
+        )
+        return stats
+
+
+def main():
+    # Load the environment variables (API key)
+    load_dotenv()
+
+    # Load the configuration file
+    config = toml.load(Path(__file__).parents[1] / "config.toml")
+
+    parser = argparse.ArgumentParser(
+        description="Answer the questions of a JSONL file with the RAG."
+    )
+    parser.add_argument("--questions", required=True, help="Input JSONL file.")
+    parser.add_argument("--output", required=True, help="Output JSONL file.")
+    parser.add_argument(
+        "--data-dir", required=True, help="Directory of the documents to index."
+    )
+    parser.add_argument("--vector-store", default=config["chroma"]["VECTOR_STORE"])
+    parser.add_argument("--collection", default=config["chroma"]["CHROMA_COLLECTION"])
+    parser.add_argument(
+        "--model", default=config["openai"]["MODEL_NAME"], choices=list(PROVIDERS)
+    )
+    parser.add_argument("--engine", default="query", choices=["query", "chat"])
+    parser.add_argument(
+        "--mode",
+        default="tree_summarize",
+        help="Response mode (query engine) or chat mode (chat engine).",
+    )
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--retriever", default="vector", choices=RETRIEVER_MODES)
+    parser.add_argument(
+        "--concurrency", type=int, default=8, help="Questions answered at once."
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        help="Concurrent calls to the provider (default: [concurrency] config).",
+    )
+    parser.add_argument(
+        "--requests-per-minute",
+        type=float,
+        help="Rate limit of the calls to the provider.",
+    )
+    args = parser.parse_args()
+
+    # The command line overrides the [concurrency] section of the provider
+    provider = PROVIDERS[args.model]
+    concurrency_config = {
+        name: dict(values) for name, values in config.get("concurrency", {}).items()
+    }
+    provider_config = concurrency_config.setdefault(provider, {})
+    if args.max_concurrency is not None:
+        provider_config["MAX_CONCURRENCY"] = args.max_concurrency
+    if args.requests_per_minute is not None:
+        provider_config["REQUESTS_PER_MINUTE"] = args.requests_per_minute
+    # Every worker may be waiting for the provider at the same time
+    provider_config["MAX_PENDING"] = max(
+        provider_config.get("MAX_PENDING", 0), args.concurrency
+    )
+
+    rag = RAG(
+        system_prompt="Eres un asistente virtual que ayuda a los usuarios a encontrar información en documentos. ",
+        model=args.model,
+        ingestion_config=config.get("ingestion"),
+        embedding_cache_config=config.get("embedding_cache"),
+        response_cache_config=config.get("response_cache"),
+        concurrency_config=concurrency_config,
+        tracing_config=config.get("tracing"),
+        context_budget_config=config.get("context_budget"),
+        diversity_config=config.get("diversity"),
+        sharding_config=config.get("sharding"),
+        vector_store_config=config.get("vector_store"),
+        document_cache_config=config.get("document_cache"),
+        chat_memory_config=config.get("chat_memory"),
+        router_config=config.get("router"),
+    )
+    rag.create_or_update_rag_index(
+        vector_store_path=args.vector_store,
+        chroma_collection_name=args.collection,
+        data_dir=args.data_dir,
+    )
+
+    runner = BatchRunner(
+        rag,
+        engine=args.engine,
+        mode=args.mode,
+        top_k=args.top_k,
+        concurrency=args.concurrency,
+        retriever_mode=args.retriever,
+    )
+    questions = load_questions(args.questions)
+    stats = asyncio.run(runner.run(questions, args.output))
+    print(
+        f"{stats['answered']} respuestas, {stats['failed']} errores, "
+        f"{stats['skipped']} ya respondidas en {stats['elapsed_seconds']:.1f}s "
+        f"({stats['questions_per_second']:.2f} preguntas/s)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from llama_index.core.llms import LLM, ChatMessage, MessageRole
+from llama_index.core.memory import BaseMemory
+from pydantic import Field, PrivateAttr
+
+from models.prompts import CHAT_SUMMARY_PROMPT
+from models.token_budget import count_tokens
+
+# Tokens added to every message for its role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Summaries of every chat memory are written by these threads, off the chat turn
+_summary_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="chat-summary")
+
+
+class SummaryChatMemory(BaseMemory):
+    """Chat memory with a token budget and a rolling summary of older turns.
+
+    The latest messages are kept verbatim up to `token_limit` tokens. When a
+    new message goes over the budget, the oldest turns are folded into the
+    summary: the LLM rewrites the current summary with only the folded
+    messages, so each update costs the same however long the conversation
+    is. Updates run in a background thread, so a chat turn never waits for
+    them; until an update finishes, its folded messages are still sent
+    verbatim. The history sent to the LLM is therefore bounded by the budget
+    plus the summary, and so is the latency of every turn.
+
+    Parameters
+    ----------
+    llm : LLM | None
+        The model that writes the summary. Without it, older turns are dropped.
+    model_name : str
+        The name of the model whose tokenizer counts the messages.
+    token_limit : int, optional
+        The tokens of the latest messages kept verbatim, by default 2000.
+    summary_tokens : int, optional
+        The maximum length of the summary asked to the LLM, by default 400.
+    """
+
+    model_name: str
+    token_limit: int = Field(default=2000)
+    summary_tokens: int = Field(default=400)
+
+    _llm: LLM | None = PrivateAttr(default=None)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    # Latest messages and their token counts, and their running total
+    _recent: deque = PrivateAttr(default_factory=deque)
+    _recent_tokens: int = PrivateAttr(default=0)
+    # Messages folded out of `_recent` that are not in the summary yet
+    _pending: list[ChatMessage] = PrivateAttr(default_factory=list)
+    _summary: str = PrivateAttr(default="")
+    _future: Future | None = PrivateAttr(default=None)
+    # Bumped by `reset`, so an update started before it is discarded
+    _generation: int = PrivateAttr(default=0)
+    _summary_updates: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        llm: LLM | None,
+        model_name: str,
+        token_limit: int = 2000,
+        summary_tokens: int = 400,
+    ):
+        super().__init__(
+            model_name=model_name,
+            token_limit=token_limit,
+            summary_tokens=summary_tokens,
+        )
+        self._llm = llm
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SummaryChatMemory"
+
+    @classmethod
+    def from_defaults(
+        cls,
+        chat_history: list[ChatMessage] | None = None,
+        llm: LLM | None = None,
+        **kwargs: Any,
+    ) -> "SummaryChatMemory":
+        model_name = kwargs.pop("model_name", None) or llm.metadata.model_name
+        memory = cls(llm=llm, model_name=model_name, **kwargs)
+        if chat_history:
+            memory.set(chat_history)
+        return memory
+
+    @property
+    def summary(self) -> str:
+        """The summary of the turns folded out of the verbatim messages."""
+        return self._summary
+
+    def _count(self, message: ChatMessage) -> int:
+        return (
+            count_tokens(message.content or "", self.model_name)
+            + MESSAGE_OVERHEAD_TOKENS
+        )
+
+    def _summary_message(self) -> list[ChatMessage]:
+        if not self._summary:
+            return []
+        return [
+            ChatMessage(
+                role=MessageRole.SYSTEM,
+                content=f"Resumen de la conversación anterior:\n{self._summary}",
+            )
+        ]
+
+    def get(self, input: str | None = None, **kwargs: Any) -> list[ChatMessage]:
+        """Get the history sent to the LLM: summary, pending and latest messages."""
+        with self._lock:
+            return [
+                *self._summary_message(),
+                *self._pending,
+                *(message for message, _ in self._recent),
+            ]
+
+    def get_all(self) -> list[ChatMessage]:
+        return self.get()
+
+    def put(self, message: ChatMessage) -> None:
+        """Add a message, folding the oldest turns if it goes over the budget."""
+        with self._lock:
+            tokens = self._count(message)
+            self._recent.append((message, tokens))
+            self._recent_tokens += tokens
+
+            folded = []
+            # The latest turn is always kept, whatever its length
+            while self._recent_tokens > self.token_limit and len(self._recent) > 2:
+                folded.append(self._pop_oldest())
+                # A turn starts with a user message: fold the rest of it too
+                while (
+                    len(self._recent) > 2
+                    and self._recent[0][0].role != MessageRole.USER
+                ):
+                    folded.append(self._pop_oldest())
+            # Without a model the folded turns are dropped
+            if not folded or self._llm is None:
+                return
+
+            self._pending.extend(folded)
+            if self._future is None or self._future.done():
+                self._future = _summary_executor.submit(
+                    self._update_summary, self._generation
+                )
+
+    def _pop_oldest(self) -> ChatMessage:
+        message, tokens = self._recent.popleft()
+        self._recent_tokens -= tokens
+        return message
+
+    def _update_summary(self, generation: int) -> None:
+        """Fold the pending messages into the summary, until none are left."""
+        while True:
+            with self._lock:
+                if generation != self._generation or not self._pending:
+                    return
+                summary = self._summary
+                folded = list(self._pending)
+
+            prompt = CHAT_SUMMARY_PROMPT.format(
+                max_tokens=self.summary_tokens,
+                summary=summary or "(vacío)",
+                messages="\n".join(
+                    f"{message.role.value}: {message.content}" for message in folded
+                ),
+            )
+            try:
+                summary = self._llm.complete(prompt).text.strip()
+            except Exception as e:
+                # The folded messages are dropped, as a plain buffer would do
+                print(f"Warning: no se pudo resumir el historial del chat ({e}).")
+
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._summary = summary
+                del self._pending[: len(folded)]
+                self._summary_updates += 1
+
+    def wait(self, timeout: float | None = None) -> None:
+        """Wait for the summary update in progress, if any."""
+        future = self._future
+        if future is not None:
+            wait([future], timeout=timeout)
+
+    def set(self, messages: list[ChatMessage]) -> None:
+        self.reset()
+        for message in messages:
+            self.put(message)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._recent.clear()
+            self._recent_tokens = 0
+            self._pending.clear()
+            self._summary = ""
+            self._future = None
+
+    def stats(self) -> dict:
+        """Get the size of the verbatim messages and of the summary."""
+        with self._lock:
+            return {
+                "messages": len(self._recent),
+                "message_tokens": self._recent_tokens,
+                "pending_messages": len(self._pending),
+                "summary_tokens": (
+                    count_tokens(self._summary, self.model_name) if self._summary else 0
+                ),
+                "summary_updates": self._summary_updates,
+            }
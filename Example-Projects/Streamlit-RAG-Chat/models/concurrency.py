@@ -0,0 +1,263 @@
+import asyncio
+import threading
+import time
+import warnings
+import weakref
+
+import chromadb
+import httpx
+
+_http_client = None
+_async_http_client = None
+_http_client_lock = threading.Lock()
+
+# One ChromaDB client per persist directory, shared by every RAG of the process
+_chroma_clients: dict[str, "chromadb.api.API"] = {}
+_chroma_clients_lock = threading.Lock()
+
+# One limiter per model provider, shared by every RAG of the process
+_provider_limiters: dict[str, "ProviderLimiter"] = {}
+_provider_limiters_lock = threading.Lock()
+
+
+class ProviderBusyError(RuntimeError):
+    """Raised when too many requests are already waiting for a model provider."""
+
+
+def shared_http_client() -> httpx.Client:
+    """Get the process-wide HTTP client shared by the LLM clients.
+
+    Reusing one client keeps a single pool of keep-alive connections per
+    provider instead of opening new connections for every RAG instance.
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return _http_client
+
+
+class _LoopTransport(httpx.AsyncBaseTransport):
+    """Async HTTP transport with one connection pool per running event loop.
+
+    Pooled connections belong to the event loop that opened them, and the
+    process runs several loops (e.g. one `asyncio.run` per extracted document).
+    """
+
+    def __init__(self, limits: httpx.Limits):
+        self.limits = limits
+        self._transports: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        loop = asyncio.get_running_loop()
+        transport = self._transports.get(loop)
+        if transport is None:
+            transport = httpx.AsyncHTTPTransport(limits=self.limits)
+            self._transports[loop] = transport
+        return await transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def shared_async_http_client() -> httpx.AsyncClient:
+    """Get the process-wide async HTTP client shared by the LLM clients.
+
+    The async counterpart of `shared_http_client`: the async calls of every
+    RAG instance reuse the keep-alive connections of their event loop.
+    """
+    global _async_http_client
+    with _http_client_lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                transport=_LoopTransport(
+                    httpx.Limits(max_connections=100, max_keepalive_connections=20)
+                ),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+            )
+        return _async_http_client
+
+
+def shared_chroma_client(path: str) -> "chromadb.api.API":
+    """Get the process-wide ChromaDB client of a persist directory.
+
+    Opening a `PersistentClient` loads the settings and system components of
+    the directory, so it is done once per path instead of on every ingest.
+    """
+    with _chroma_clients_lock:
+        if path not in _chroma_clients:
+            _chroma_clients[path] = chromadb.PersistentClient(path=path)
+        return _chroma_clients[path]
+
+
+class ProviderLimiter:
+    """Concurrency limit for the calls made to one model provider.
+
+    At most `max_concurrency` calls run at the same time; the rest wait for a
+    free slot. When `max_pending` calls are already waiting, new calls fail
+    fast with `ProviderBusyError` instead of queueing without bound. With
+    `requests_per_minute`, calls are also spaced evenly to stay under the rate
+    limit of the provider.
+
+    Asyncio primitives belong to one event loop, so a semaphore is kept per
+    running loop and the limit applies to the calls made from each loop.
+    Synchronous calls (`with limiter:`) share a thread semaphore instead.
+
+    Parameters
+    ----------
+    max_concurrency : int, optional
+        The maximum number of calls running at the same time, by default 8.
+    max_pending : int, optional
+        The maximum number of calls waiting for a slot, by default 64.
+    requests_per_minute : float | None, optional
+        The maximum rate of calls, by default None (no rate limit).
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        max_pending: int = 64,
+        requests_per_minute: float | None = None,
+    ):
+        self.max_concurrency = max_concurrency
+        self.max_pending = max_pending
+        self.requests_per_minute = requests_per_minute
+        self._next_call = 0.0
+        self._rate_lock = threading.Lock()
+        self.pending = 0
+        self.running = 0
+        self.rejected = 0
+        self._semaphores: weakref.WeakKeyDictionary = weakref.WeakKeyDictionary()
+        self._thread_semaphore = threading.Semaphore(max_concurrency)
+        self._counts_lock = threading.Lock()
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._semaphores[loop] = semaphore
+        return semaphore
+
+    async def __aenter__(self) -> "ProviderLimiter":
+        semaphore = self._semaphore()
+        if semaphore.locked() and self.pending >= self.max_pending:
+            self.rejected += 1
+            raise ProviderBusyError(
+                f"{self.pending} requests already waiting for the model provider."
+            )
+
+        self.pending += 1
+        try:
+            await semaphore.acquire()
+        finally:
+            self.pending -= 1
+        self.running += 1
+
+        # Reserve the next free call time, then wait for it holding the slot
+        try:
+            await asyncio.sleep(self._rate_delay())
+        except BaseException:
+            # Cancelled while waiting (e.g. a hedged call that lost the race)
+            await self.__aexit__(None, None, None)
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self.running -= 1
+        self._semaphore().release()
+
+    def __enter__(self) -> "ProviderLimiter":
+        if not self._thread_semaphore.acquire(blocking=False):
+            with self._counts_lock:
+                if self.pending >= self.max_pending:
+                    self.rejected += 1
+                    raise ProviderBusyError(
+                        f"{self.pending} requests already waiting for the model provider."
+                    )
+                self.pending += 1
+            try:
+                self._thread_semaphore.acquire()
+            finally:
+                with self._counts_lock:
+                    self.pending -= 1
+        with self._counts_lock:
+            self.running += 1
+
+        time.sleep(self._rate_delay())
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        with self._counts_lock:
+            self.running -= 1
+        self._thread_semaphore.release()
+
+    def _rate_delay(self) -> float:
+        """Reserve the next call time allowed by the rate limit, and get the wait."""
+        if not self.requests_per_minute:
+            return 0.0
+        with self._rate_lock:
+            now = time.monotonic()
+            call_at = max(now, self._next_call)
+            self._next_call = call_at + 60.0 / self.requests_per_minute
+        return call_at - now
+
+    def stats(self) -> dict:
+        """Get the current load of the provider."""
+        return {
+            "running": self.running,
+            "pending": self.pending,
+            "rejected": self.rejected,
+            "max_concurrency": self.max_concurrency,
+        }
+
+
+def get_provider_limiter(
+    provider: str,
+    max_concurrency: int = 8,
+    max_pending: int = 64,
+    requests_per_minute: float | None = None,
+) -> ProviderLimiter:
+    """Get the process-wide limiter of a model provider, creating it on first use.
+
+    The limiter keeps the settings it was created with: asking for it again with
+    other settings warns and returns it unchanged.
+
+    Parameters
+    ----------
+    provider : str
+        The name of the model provider ("openai", "google-genai", ...).
+    max_concurrency : int, optional
+        The maximum number of calls running at the same time, by default 8.
+    max_pending : int, optional
+        The maximum number of calls waiting for a slot, by default 64.
+    requests_per_minute : float | None, optional
+        The maximum rate of calls, by default None (no rate limit).
+    """
+    with _provider_limiters_lock:
+        if provider not in _provider_limiters:
+            _provider_limiters[provider] = ProviderLimiter(
+                max_concurrency=max_concurrency,
+                max_pending=max_pending,
+                requests_per_minute=requests_per_minute,
+            )
+        limiter = _provider_limiters[provider]
+
+    settings = (max_concurrency, max_pending, requests_per_minute)
+    current = (
+        limiter.max_concurrency,
+        limiter.max_pending,
+        limiter.requests_per_minute,
+    )
+    if settings != current:
+        warnings.warn(
+            f"The limiter of {provider!r} already exists with max_concurrency, "
+            f"max_pending and requests_per_minute {current}; {settings} is ignored.",
+            stacklevel=2,
+        )
+    return limiter
@@ -0,0 +1,221 @@
+import hashlib
+import math
+import threading
+from dataclasses import dataclass
+from typing import Callable
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from pydantic import Field, PrivateAttr
+
+from models.streaming import report_postprocessor_stats
+
+
+@dataclass
+class DiversityStats:
+    """Class to store the nodes removed by the diversity filter."""
+
+    nodes_in: int = 0
+    nodes_out: int = 0
+    # Same text, or embedding more similar than the threshold to a kept node
+    duplicates: int = 0
+    # Beyond the maximum number of chunks of one file
+    over_file_cap: int = 0
+    # Left out by the MMR selection
+    not_selected: int = 0
+
+    @property
+    def nodes_removed(self) -> int:
+        return self.nodes_in - self.nodes_out
+
+    def add(self, other: "DiversityStats") -> None:
+        self.nodes_in += other.nodes_in
+        self.nodes_out += other.nodes_out
+        self.duplicates += other.duplicates
+        self.over_file_cap += other.over_file_cap
+        self.not_selected += other.not_selected
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class DiversityPostprocessor(BaseNodePostprocessor):
+    """Node postprocessor that removes redundant chunks from the retrieved nodes.
+
+    Three filters are applied, by decreasing score:
+
+    1. Duplicates: chunks with the same text as a kept chunk, or whose
+       embedding has a cosine similarity of at least `duplicate_threshold`
+       with it (overlapping chunks, re-uploaded files, repeated boilerplate).
+    2. File cap: at most `max_per_file` chunks of the same file, as long as
+       other files provide enough chunks to fill the answer.
+    3. MMR: the engines retrieve `oversample` times `top_k` candidates, and
+       maximal marginal relevance picks `top_k` of them, trading the
+       similarity to the query against the similarity to the chunks already
+       picked (`mmr_lambda` 1 is pure relevance, 0 pure diversity).
+
+    Each engine uses its own copy of the filter, with the `top_k` of the
+    engine (`for_top_k`); the copies share the stats of the filter.
+
+    The chunk embeddings are read from the vector store with
+    `embedding_lookup`; the chunks it does not know are embedded with
+    `embed_model`.
+    """
+
+    embedding_lookup: Callable[[list[str]], dict[str, list[float]]] = Field(
+        description="Get the stored embeddings of chunks by node id."
+    )
+    embed_model: BaseEmbedding | None = Field(
+        default=None, description="Model used to embed chunks without embedding."
+    )
+    duplicate_threshold: float = Field(
+        default=0.95, description="Cosine similarity of near-duplicate chunks."
+    )
+    max_per_file: int | None = Field(
+        default=None, description="Maximum chunks of one file, None for no cap."
+    )
+    mmr_lambda: float = Field(default=0.7, description="Relevance weight of MMR.")
+    oversample: int = Field(
+        default=2, description="Candidates retrieved per chunk kept by MMR."
+    )
+    top_k: int | None = Field(
+        default=None,
+        description="Chunks kept by MMR, None for 1 / oversample of the candidates.",
+    )
+
+    _total: DiversityStats = PrivateAttr(default_factory=DiversityStats)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "DiversityPostprocessor"
+
+    def __repr__(self) -> str:
+        # Used in the engine pool keys: same configuration, same engine
+        return (
+            f"DiversityPostprocessor({self.duplicate_threshold}, "
+            f"{self.max_per_file}, {self.mmr_lambda}, {self.oversample}, "
+            f"{self.top_k})"
+        )
+
+    def for_top_k(self, top_k: int) -> "DiversityPostprocessor":
+        """Get a copy of the filter that keeps `top_k` chunks, sharing its stats."""
+        return self.model_copy(update={"top_k": top_k})
+
+    def _embeddings(self, nodes: list[NodeWithScore]) -> np.ndarray:
+        stored = self.embedding_lookup([node.node.node_id for node in nodes])
+        missing = [node for node in nodes if node.node.node_id not in stored]
+        if missing and self.embed_model is not None:
+            vectors = self.embed_model.get_text_embedding_batch(
+                [node.node.get_content(MetadataMode.EMBED) for node in missing]
+            )
+            stored.update(
+                (node.node.node_id, vector) for node, vector in zip(missing, vectors)
+            )
+
+        dim = len(next(iter(stored.values()))) if stored else 1
+        return _normalize(
+            np.array(
+                [stored.get(node.node.node_id, np.zeros(dim)) for node in nodes],
+                dtype=np.float32,
+            )
+        )
+
+    def _postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle | None = None,
+    ) -> list[NodeWithScore]:
+        stats = DiversityStats(nodes_in=len(nodes))
+        ranking = sorted(
+            range(len(nodes)), key=lambda i: nodes[i].score or 0.0, reverse=True
+        )
+        embeddings = self._embeddings(nodes)
+
+        # 1-2. Duplicates and file cap, keeping the best scored copy
+        kept: list[int] = []
+        over_cap: list[int] = []
+        seen_texts: set[str] = set()
+        per_file: dict[str, int] = {}
+        for i in ranking:
+            text = nodes[i].node.get_content(MetadataMode.NONE)
+            text_hash = hashlib.sha256(text.encode()).hexdigest()
+            if text_hash in seen_texts or (
+                kept
+                and float(np.max(embeddings[kept] @ embeddings[i]))
+                >= self.duplicate_threshold
+            ):
+                stats.duplicates += 1
+                continue
+
+            file_name = nodes[i].node.metadata.get("file_name", "")
+            if self.max_per_file is not None and per_file.get(file_name, 0) >= (
+                self.max_per_file
+            ):
+                over_cap.append(i)
+                seen_texts.add(text_hash)
+                continue
+
+            kept.append(i)
+            seen_texts.add(text_hash)
+            per_file[file_name] = per_file.get(file_name, 0) + 1
+
+        # 3. MMR among the remaining candidates
+        # MMR picks min(top_k, kept) chunks and the file cap backfills up to
+        # `top_k`: fewer candidates than requested (small index, filtered
+        # chunks) must not shrink the answer below `top_k`
+        n_selected = (
+            self.top_k
+            if self.top_k is not None
+            else math.ceil(len(nodes) / self.oversample)
+        )
+        if query_bundle is not None and query_bundle.embedding is not None:
+            query = _normalize(np.asarray(query_bundle.embedding, dtype=np.float32))
+            relevance = {i: float(embeddings[i] @ query) for i in kept}
+        else:
+            # Without the query embedding the retrieval scores measure relevance
+            relevance = {i: nodes[i].score or 0.0 for i in kept}
+
+        selected: list[int] = []
+        candidates = list(kept)
+        while candidates and len(selected) < n_selected:
+            best = max(
+                candidates,
+                key=lambda i: self.mmr_lambda * relevance[i]
+                - (1 - self.mmr_lambda)
+                * (
+                    float(np.max(embeddings[selected] @ embeddings[i]))
+                    if selected
+                    else 0.0
+                ),
+            )
+            selected.append(best)
+            candidates.remove(best)
+        stats.not_selected = len(candidates)
+
+        # The cap only applies while other files can fill the answer
+        n_backfill = max(0, n_selected - len(selected))
+        selected.extend(over_cap[:n_backfill])
+        stats.over_file_cap = len(over_cap) - min(n_backfill, len(over_cap))
+
+        stats.nodes_out = len(selected)
+        with self._lock:
+            self._total.add(stats)
+        report_postprocessor_stats(self.class_name(), stats)
+        # Returned by decreasing score, as retrieved
+        return [nodes[i] for i in sorted(selected, key=ranking.index)]
+
+    def stats(self) -> dict:
+        """Get the nodes removed by the filter since it was created."""
+        with self._lock:
+            return {
+                "nodes_in": self._total.nodes_in,
+                "nodes_removed": self._total.nodes_removed,
+                "duplicates": self._total.duplicates,
+                "over_file_cap": self._total.over_file_cap,
+                "not_selected": self._total.not_selected,
+            }
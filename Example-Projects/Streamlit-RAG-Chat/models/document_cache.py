@@ -0,0 +1,317 @@
+import functools
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Callable, Iterator, TypedDict
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+
+from models.manifest import file_sha256
+
+
+class ParsedPage(TypedDict):
+    """Class to store one parsed page of a document."""
+
+    page: int
+    # Plain text, or Markdown for the "pymupdf4llm" parser
+    text: str
+    metadata: dict
+
+
+def _parse_llama_index(file_path: str) -> list[ParsedPage]:
+    # Same documents as the ingestion got from `SimpleDirectoryReader` before
+    documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+    return [
+        ParsedPage(
+            page=i,
+            text=document.text,
+            metadata={
+                "metadata": document.metadata,
+                "excluded_embed_metadata_keys": document.excluded_embed_metadata_keys,
+                "excluded_llm_metadata_keys": document.excluded_llm_metadata_keys,
+            },
+        )
+        for i, document in enumerate(documents)
+    ]
+
+
+def _parse_pypdf2(file_path: str) -> list[ParsedPage]:
+    import PyPDF2
+
+    with open(file_path, "rb") as f:
+        reader = PyPDF2.PdfReader(f)
+        return [
+            ParsedPage(page=i, text=page.extract_text(), metadata={})
+            for i, page in enumerate(reader.pages)
+        ]
+
+
+def _parse_pymupdf(file_path: str) -> list[ParsedPage]:
+    import pymupdf
+
+    with pymupdf.open(file_path) as document:
+        return [
+            ParsedPage(page=i, text=page.get_text(), metadata={})
+            for i, page in enumerate(document)
+        ]
+
+
+def _parse_pymupdf4llm(file_path: str) -> list[ParsedPage]:
+    import pymupdf4llm
+
+    chunks = pymupdf4llm.to_markdown(file_path, page_chunks=True)
+    return [
+        ParsedPage(page=i, text=chunk["text"], metadata={})
+        for i, chunk in enumerate(chunks)
+    ]
+
+
+# Parsers of the cache: name -> (version, function). Bump the version when a
+# parser or its options change, so documents parsed before are parsed again
+PARSERS: dict[str, tuple[str, Callable[[str], list[ParsedPage]]]] = {
+    "llama-index": ("simple-directory-reader-v1", _parse_llama_index),
+    "pypdf2": ("pypdf2-v1", _parse_pypdf2),
+    "pymupdf": ("pymupdf-v1", _parse_pymupdf),
+    "pymupdf4llm": ("pymupdf4llm-markdown-v1", _parse_pymupdf4llm),
+}
+
+
+class DocumentCache:
+    """Persistent cache of parsed documents keyed by (content hash, parser).
+
+    Each document is parsed once per parser version and its pages are stored
+    zlib-compressed in a SQLite database, one row per page, so callers can
+    read one page at a time instead of the whole document. The ingestion of
+    the RAG ("llama-index" parser), the token counts and the extractions of
+    the notebooks ("pypdf2", "pymupdf", "pymupdf4llm") share it. Documents that
+    yield no pages (e.g. unreadable files) are not cached.
+
+    Within a process a document is parsed by one thread while the others
+    wait for it; two processes parsing the same new document at once both
+    parse it, and the second write replaces the first.
+
+    Parameters
+    ----------
+    path : str
+        The path of the SQLite database file.
+    compression_level : int, optional
+        The zlib compression level of the page texts, by default 6.
+    """
+
+    def __init__(self, path: str, compression_level: int = 6):
+        self.path = path
+        self.compression_level = compression_level
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        # One lock per (file hash, parser): a document is parsed by one thread
+        self._parse_locks: dict[tuple[str, str], threading.Lock] = {}
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS documents (
+                file_hash TEXT NOT NULL,
+                parser TEXT NOT NULL,
+                version TEXT NOT NULL,
+                pages INTEGER NOT NULL,
+                parse_seconds REAL NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (file_hash, parser)
+            );
+            CREATE TABLE IF NOT EXISTS pages (
+                file_hash TEXT NOT NULL,
+                parser TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                text BLOB NOT NULL,
+                metadata TEXT NOT NULL,
+                PRIMARY KEY (file_hash, parser, page)
+            ) WITHOUT ROWID;
+            """)
+
+    def page_count(self, file_hash: str, parser: str = "llama-index") -> int | None:
+        """Get the pages of a cached document, or None if it must be parsed."""
+        version, _ = PARSERS[parser]
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT pages FROM documents "
+                "WHERE file_hash = ? AND parser = ? AND version = ?",
+                (file_hash, parser, version),
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def parse(
+        self, file_path: str, parser: str = "llama-index", file_hash: str | None = None
+    ) -> int:
+        """Parse a document into the cache, unless it is already there.
+
+        Parameters
+        ----------
+        file_path : str
+            The path of the document.
+        parser : str, optional
+            The parser, one of `PARSERS`, by default "llama-index".
+        file_hash : str | None, optional
+            The content hash of the document, computed if not given.
+
+        Returns
+        -------
+        int
+            The number of pages of the document.
+        """
+        if parser not in PARSERS:
+            raise ValueError(f"Invalid parser. Choose one of {list(PARSERS)}.")
+        file_hash = file_hash or file_sha256(file_path)
+
+        with self._lock:
+            parse_lock = self._parse_locks.setdefault(
+                (file_hash, parser), threading.Lock()
+            )
+        with parse_lock:
+            pages = self.page_count(file_hash, parser)
+            if pages is not None:
+                with self._lock:
+                    self.hits += 1
+                return pages
+
+            version, parse_function = PARSERS[parser]
+            start = time.perf_counter()
+            parsed = parse_function(file_path)
+            parse_seconds = time.perf_counter() - start
+            if not parsed:
+                return 0
+
+            with self._lock, self._connection:
+                self.misses += 1
+                self._connection.execute(
+                    "DELETE FROM pages WHERE file_hash = ? AND parser = ?",
+                    (file_hash, parser),
+                )
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (
+                            file_hash,
+                            parser,
+                            page["page"],
+                            zlib.compress(
+                                page["text"].encode("utf-8"), self.compression_level
+                            ),
+                            json.dumps(page["metadata"], ensure_ascii=False),
+                        )
+                        for page in parsed
+                    ],
+                )
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                    (
+                        file_hash,
+                        parser,
+                        version,
+                        len(parsed),
+                        parse_seconds,
+                        time.time(),
+                    ),
+                )
+            return len(parsed)
+
+    def get_page(
+        self, file_hash: str, page: int, parser: str = "llama-index"
+    ) -> ParsedPage | None:
+        """Read one page of a cached document, or None if it is not cached."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT text, metadata FROM pages "
+                "WHERE file_hash = ? AND parser = ? AND page = ?",
+                (file_hash, parser, page),
+            ).fetchone()
+        if row is None:
+            return None
+        return ParsedPage(
+            page=page,
+            text=zlib.decompress(row[0]).decode("utf-8"),
+            metadata=json.loads(row[1]),
+        )
+
+    def iter_pages(
+        self, file_path: str, parser: str = "llama-index", file_hash: str | None = None
+    ) -> Iterator[ParsedPage]:
+        """Iterate over the pages of a document, parsing it first if needed.
+
+        Only one page is decompressed and held in memory at a time.
+        """
+        file_hash = file_hash or file_sha256(file_path)
+        for page in range(self.parse(file_path, parser, file_hash)):
+            yield self.get_page(file_hash, page, parser)
+
+    def read_text(
+        self, file_path: str, parser: str = "llama-index", separator: str = "\n\n"
+    ) -> str:
+        """Get the whole text (or Markdown) of a document, joining its pages."""
+        return separator.join(
+            page["text"] for page in self.iter_pages(file_path, parser)
+        )
+
+    def load_documents(
+        self, file_path: str, file_hash: str | None = None
+    ) -> list[Document]:
+        """Get the LlamaIndex documents of a file, as `SimpleDirectoryReader` does.
+
+        The file metadata (path, name, size, dates) is read again from
+        `file_path`, since the same content may have been cached under another
+        name or path.
+        """
+        file_metadata = default_file_metadata_func(file_path)
+        documents = []
+        for page in self.iter_pages(file_path, "llama-index", file_hash):
+            stored = page["metadata"]
+            metadata = {
+                key: file_metadata.get(key, value)
+                for key, value in stored["metadata"].items()
+            }
+            metadata.update(
+                (key, value)
+                for key, value in file_metadata.items()
+                if key not in metadata
+            )
+            documents.append(
+                Document(
+                    text=page["text"],
+                    metadata=metadata,
+                    excluded_embed_metadata_keys=stored["excluded_embed_metadata_keys"],
+                    excluded_llm_metadata_keys=stored["excluded_llm_metadata_keys"],
+                )
+            )
+        return documents
+
+    def stats(self) -> dict:
+        """Get the hit/miss counters and the size of the cache."""
+        with self._lock:
+            documents, pages = self._connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM documents"
+            ).fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "documents": documents,
+                "pages": pages,
+                "size_bytes": os.path.getsize(self.path),
+            }
+
+
+@functools.lru_cache(maxsize=None)
+def open_document_cache(path: str, compression_level: int = 6) -> DocumentCache:
+    """Get the cache stored at `path`, opened once per process.
+
+    The ingestion workers and the notebooks open the cache by path, so every
+    caller of the same process shares one connection and its parse locks.
+    """
+    return DocumentCache(path, compression_level)
@@ -0,0 +1,216 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+# SQLite limits the number of parameters of a statement, so lookups are chunked
+_MAX_SQL_VARIABLES = 500
+
+
+def embed_model_name(embed_model: BaseEmbedding) -> str:
+    """Get the name that identifies the vectors produced by an embedding model."""
+    return getattr(embed_model, "model_name", None) or type(embed_model).__name__
+
+
+def text_hash(text: str) -> str:
+    """Hash a chunk text after normalizing its unicode form and whitespace."""
+    normalized = re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (embedding model, chunk text hash).
+
+    Vectors are stored as float32 blobs in a SQLite database, so the same chunk
+    is embedded only once no matter how many times it is re-indexed (after
+    cleaning the knowledge base, in another collection, ...). When the cache
+    holds more than `max_entries` vectors, the least recently used are evicted.
+
+    Parameters
+    ----------
+    path : str
+        The path of the SQLite database file.
+    max_entries : int, optional
+        The maximum number of vectors kept in the cache, by default 200000.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # The ingestion pipeline calls the cache from several embed threads
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """)
+        self._connection.execute(
+            "CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)"
+        )
+        self._connection.commit()
+        # Running number of rows, so the eviction does not count the table on
+        # every insert
+        (self._rows,) = self._connection.execute(
+            "SELECT COUNT(*) FROM embeddings"
+        ).fetchone()
+
+    def get_many(self, model: str, texts: list[str]) -> list[list[float] | None]:
+        """Look up the embeddings of a batch of texts.
+
+        Parameters
+        ----------
+        model : str
+            The name of the embedding model.
+        texts : list[str]
+            The texts to look up.
+
+        Returns
+        -------
+        list[list[float] | None]
+            The cached embedding of each text, or None when it is not cached.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = {}
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(hashes), _MAX_SQL_VARIABLES):
+                batch = hashes[start : start + _MAX_SQL_VARIABLES]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                found.update(rows)
+                self._connection.execute(
+                    f"UPDATE embeddings SET last_used = ? "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [now, model, *batch],
+                )
+            self._connection.commit()
+
+            embeddings = [
+                (
+                    np.frombuffer(found[h], dtype=np.float32).tolist()
+                    if h in found
+                    else None
+                )
+                for h in hashes
+            ]
+            hits = sum(embedding is not None for embedding in embeddings)
+            self.hits += hits
+            self.misses += len(embeddings) - hits
+
+        return embeddings
+
+    def put_many(
+        self, model: str, texts: list[str], embeddings: list[list[float]]
+    ) -> None:
+        """Store the embeddings of a batch of texts and evict the oldest if needed.
+
+        Parameters
+        ----------
+        model : str
+            The name of the embedding model.
+        texts : list[str]
+            The embedded texts.
+        embeddings : list[list[float]]
+            The embedding of each text.
+        """
+        now = time.time()
+        # Repeated texts are stored once
+        rows = {
+            text_hash(text): (
+                model,
+                text_hash(text),
+                np.asarray(embedding, dtype=np.float32).tobytes(),
+                now,
+            )
+            for text, embedding in zip(texts, embeddings)
+        }
+        with self._lock:
+            # Only the new rows are counted; the vectors already stored (e.g.
+            # embedded by another thread meanwhile) are just marked as used
+            inserted = self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?, ?)",
+                list(rows.values()),
+            ).rowcount
+            if inserted < len(rows):
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_used = ? "
+                    "WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in rows],
+                )
+            self._rows += inserted
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self) -> None:
+        """Delete the least recently used vectors above `max_entries`."""
+        excess = self._rows - self.max_entries
+        if excess > 0:
+            deleted = self._connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN "
+                "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            ).rowcount
+            self._rows -= deleted
+
+    def embed(
+        self, embed_model: BaseEmbedding, texts: list[str]
+    ) -> tuple[list[list[float]], int]:
+        """Embed a batch of texts, calling the model only for the cache misses.
+
+        Parameters
+        ----------
+        embed_model : BaseEmbedding
+            The embedding model used for the texts that are not cached.
+        texts : list[str]
+            The texts to embed.
+
+        Returns
+        -------
+        tuple[list[list[float]], int]
+            The embedding of each text and the number of cache hits.
+        """
+        model = embed_model_name(embed_model)
+        # Repeated texts of the batch are looked up and embedded once
+        unique_texts = list(dict.fromkeys(texts))
+        found = dict(zip(unique_texts, self.get_many(model, unique_texts)))
+        missing = [text for text, embedding in found.items() if embedding is None]
+
+        if missing:
+            new_embeddings = embed_model.get_text_embedding_batch(missing)
+            found.update(zip(missing, new_embeddings))
+            self.put_many(model, missing, new_embeddings)
+
+        missing_texts = set(missing)
+        cache_hits = sum(text not in missing_texts for text in texts)
+        return [found[text] for text in texts], cache_hits
+
+    def stats(self) -> dict:
+        """Get the hit/miss statistics of the cache since it was opened."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,79 @@
+import threading
+import time
+from typing import Any, Callable, Hashable
+
+
+class EnginePool:
+    """Keyed pool of built query and chat engines.
+
+    Building an engine sets up its retriever, response synthesizer and prompts.
+    The pool keeps every engine built for the current index generation and hands
+    the same instance back for the same key. When the index generation changes
+    (new documents indexed or knowledge base cleaned) the pool is emptied, so
+    engines never serve a stale index.
+    """
+
+    def __init__(self):
+        self._engines: dict[Hashable, Any] = {}
+        self._generation = None
+        self._lock = threading.Lock()
+        self.builds = 0
+        self.reuses = 0
+        self.build_seconds = 0.0
+
+    def get(self, key: Hashable, generation: Hashable, build: Callable[[], Any]) -> Any:
+        """Get the engine of `key`, building it if it is not in the pool.
+
+        Parameters
+        ----------
+        key : Hashable
+            The key of the engine (engine type and configuration, or session).
+        generation : Hashable
+            The generation of the index the engine must be built on.
+        build : Callable[[], Any]
+            The function that builds the engine when it is not pooled.
+        """
+        with self._lock:
+            if generation != self._generation:
+                self._engines.clear()
+                self._generation = generation
+
+            engine = self._engines.get(key)
+            if engine is not None:
+                self.reuses += 1
+                return engine
+
+            start = time.perf_counter()
+            engine = build()
+            self.build_seconds += time.perf_counter() - start
+            self.builds += 1
+
+            self._engines[key] = engine
+            return engine
+
+    def discard(self, key: Hashable) -> None:
+        """Remove an engine from the pool, e.g. when its session ends."""
+        with self._lock:
+            self._engines.pop(key, None)
+
+    def discard_prefix(self, prefix: tuple) -> None:
+        """Remove every engine whose key starts with `prefix`, e.g. a whole session."""
+        with self._lock:
+            for key in [
+                key
+                for key in self._engines
+                if isinstance(key, tuple) and key[: len(prefix)] == prefix
+            ]:
+                del self._engines[key]
+
+    def stats(self) -> dict:
+        """Get the construction cost of the pooled engines and the time saved."""
+        average = self.build_seconds / self.builds if self.builds else 0.0
+        return {
+            "engines": len(self._engines),
+            "builds": self.builds,
+            "reuses": self.reuses,
+            "build_seconds": self.build_seconds,
+            "avg_build_seconds": average,
+            "saved_seconds": average * self.reuses,
+        }
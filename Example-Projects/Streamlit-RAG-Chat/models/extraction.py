@@ -0,0 +1,411 @@
+"""Map-reduce extraction of the sections of a grant form with EXTRACTION_PROMPT.
+
+The form is split into pages, the sections of every page are extracted
+concurrently and the partial results are merged in page order, joining the
+sections continued on the next page ("(Cont.)"). The result of each page is
+cached by its text, so re-running on an edited form only extracts the pages
+that changed.
+
+Example
+-------
+python Example-Projects/Streamlit-RAG-Chat/models/extraction.py \\
+    --file "Example-Projects/Streamlit-RAG-Chat/models/Anexo-III-2023.pdf" \\
+    --output secciones.json
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import toml
+from dotenv import load_dotenv
+from llama_index.core.llms import LLM
+
+# Añadir el directorio padre al path para poder importar models
+sys.path.append(str(Path(__file__).parents[1]))
+from models.concurrency import ProviderLimiter
+from models.document_cache import (
+    PARSERS,
+    DocumentCache,
+    ParsedPage,
+    open_document_cache,
+)
+from models.prompts import EXTRACTION_PART_PROMPT, EXTRACTION_PROMPT
+from models.RAG import RAG
+
+# Identifies the prompts in the page cache: pages extracted with other prompts
+# are extracted again
+PROMPT_VERSION = hashlib.sha256(
+    (EXTRACTION_PROMPT + EXTRACTION_PART_PROMPT).encode("utf-8")
+).hexdigest()[:16]
+
+# "(Cont.)", "(cont)", "(Continuación)" at the end of a section title
+_CONTINUATION = re.compile(r"\(\s*cont(?:\.|inuaci[oó]n)?\s*\)\s*$", re.IGNORECASE)
+
+# Section numbers such as "7.", "7.1.", "a)" at the start of a title
+_NUMBERING = re.compile(r"^\s*(?:\d+(?:\.\d+)*\.?|[a-z]\))\s+", re.IGNORECASE)
+
+# ```json ... ``` fences around the answer of the LLM
+_JSON_FENCE = re.compile(r"```(?:json)?\s*(.*?)```", re.DOTALL)
+
+
+@dataclass
+class ExtractionStats:
+    """Class to store the report of an extraction run."""
+
+    pages: int = 0
+    # Pages whose extraction was read from the page cache
+    cached_pages: int = 0
+    llm_calls: int = 0
+    # Pages whose answer could not be parsed as JSON or whose calls failed,
+    # left out of the result
+    failed_pages: list[int] = field(default_factory=list)
+    elapsed: float = 0.0
+
+    def summary(self) -> str:
+        """Get a one-line human readable report."""
+        return (
+            f"{self.pages} páginas ({self.cached_pages} desde caché, "
+            f"{self.llm_calls} llamadas al LLM, {len(self.failed_pages)} fallidas) "
+            f"en {self.elapsed:.2f}s"
+        )
+
+
+def _clean_name(name: str) -> str:
+    """Remove the continuation mark of a section title."""
+    return _CONTINUATION.sub("", name).strip()
+
+
+def _name_key(name: str) -> str:
+    """Get the key used to recognise the same section in different pages."""
+    name = _NUMBERING.sub("", _clean_name(name))
+    return re.sub(r"\s+", " ", name).strip().casefold()
+
+
+def parse_sections(answer: str) -> list[dict]:
+    """Parse the sections of an LLM answer in the format of `EXTRACTION_PROMPT`.
+
+    Raises
+    ------
+    ValueError
+        If the answer does not contain a JSON object with a "sections" list.
+    """
+    match = _JSON_FENCE.search(answer)
+    text = match.group(1) if match else answer
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        raise ValueError("The answer does not contain a JSON object.")
+
+    sections = json.loads(text[start : end + 1]).get("sections")
+    if not isinstance(sections, list):
+        raise ValueError('The answer has no "sections" list.')
+    return sections
+
+
+def _as_items(subsections) -> list:
+    """Normalize subsections to a list of titles (str) and sections (dict)."""
+    if subsections is None:
+        return []
+    if isinstance(subsections, (str, dict)):
+        return [subsections]
+    return list(subsections)
+
+
+def _merge_items(target: list, items: list) -> None:
+    """Merge subsections into `target`, joining those with the same title."""
+    for item in items:
+        if isinstance(item, dict):
+            key = _name_key(item.get("name", ""))
+            existing = next(
+                (
+                    other
+                    for other in target
+                    if isinstance(other, dict)
+                    and _name_key(other.get("name", "")) == key
+                ),
+                None,
+            )
+            if existing is None:
+                existing = {
+                    "name": _clean_name(item.get("name", "")),
+                    "subsections": [],
+                }
+                target.append(existing)
+            _merge_items(existing["subsections"], _as_items(item.get("subsections")))
+        elif _clean_name(item) not in target:
+            target.append(_clean_name(item))
+
+
+def merge_sections(pages: list[list[dict]]) -> list[dict]:
+    """Merge the sections extracted from each page, in page order.
+
+    A section continued on a later page (its title ends with "(Cont.)", its
+    title is missing, or it repeats the title of an earlier section) is
+    merged into that section, so continuations stay together.
+    """
+    merged: list[dict] = []
+    by_key: dict[str, dict] = {}
+    for sections in pages:
+        for section in sections:
+            name = section.get("name") or ""
+            key = _name_key(name)
+            if not key and merged:
+                # Untitled continuation of the last section of the previous page
+                target = merged[-1]
+            elif key in by_key:
+                target = by_key[key]
+            else:
+                target = {"name": _clean_name(name), "subsections": []}
+                merged.append(target)
+                by_key[key] = target
+            _merge_items(target["subsections"], _as_items(section.get("subsections")))
+    return merged
+
+
+class ExtractionCache:
+    """Persistent cache of the sections extracted from each page.
+
+    Entries are keyed by (model, prompt version, page text hash), so a page
+    is extracted again only if its text, the prompts or the model change.
+
+    Parameters
+    ----------
+    path : str
+        The path of the SQLite database file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("""
+            CREATE TABLE IF NOT EXISTS extractions (
+                key TEXT PRIMARY KEY,
+                sections TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+            """)
+        self._connection.commit()
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(
+            f"{model_name}\0{PROMPT_VERSION}\0{text}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, key: str) -> list[dict] | None:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT sections FROM extractions WHERE key = ?", (key,)
+            ).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def put(self, key: str, sections: list[dict]) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO extractions VALUES (?, ?, ?)",
+                (key, json.dumps(sections, ensure_ascii=False), time.time()),
+            )
+
+
+class FormExtractor:
+    """Extract the section hierarchy of a grant form, page by page.
+
+    Instead of sending the whole form in one prompt, each page is sent with
+    `EXTRACTION_PROMPT` on its own, at most `concurrency` at a time (and
+    within the limits of the provider limiter), and the results are merged
+    with `merge_sections`.
+
+    Parameters
+    ----------
+    llm : LLM
+        The model used to extract the sections.
+    limiter : ProviderLimiter | None, optional
+        The limiter of the model provider, by default None.
+    document_cache : DocumentCache | None, optional
+        The cache of parsed documents the pages are read from, by default None
+        (the pages are parsed without caching them).
+    cache : ExtractionCache | None, optional
+        The cache of the sections of each page, by default None.
+    parser : str, optional
+        The parser of the pages, by default "llama-index".
+    concurrency : int, optional
+        The number of pages extracted at the same time, by default 8.
+    max_retries : int, optional
+        The extra attempts of a page whose answer is not valid JSON or whose
+        call fails (e.g. a provider error), by default 1.
+    """
+
+    def __init__(
+        self,
+        llm: LLM,
+        limiter: ProviderLimiter | None = None,
+        document_cache: DocumentCache | None = None,
+        cache: ExtractionCache | None = None,
+        parser: str = "llama-index",
+        concurrency: int = 8,
+        max_retries: int = 1,
+    ):
+        self.llm = llm
+        self.limiter = limiter
+        self.document_cache = document_cache
+        self.cache = cache
+        self.parser = parser
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.last_stats: ExtractionStats | None = None
+
+    def _pages(self, file_path: str) -> list[ParsedPage]:
+        if self.document_cache is not None:
+            return list(self.document_cache.iter_pages(file_path, self.parser))
+        _, parse_function = PARSERS[self.parser]
+        return parse_function(file_path)
+
+    async def _complete(self, prompt: str) -> str:
+        if self.limiter is None:
+            return (await self.llm.acomplete(prompt)).text
+        async with self.limiter:
+            return (await self.llm.acomplete(prompt)).text
+
+    async def _extract_page(
+        self, page: ParsedPage, semaphore: asyncio.Semaphore, stats: ExtractionStats
+    ) -> list[dict]:
+        key = ExtractionCache.key(self.llm.metadata.model_name, page["text"])
+        if self.cache is not None:
+            sections = self.cache.get(key)
+            if sections is not None:
+                stats.cached_pages += 1
+                return sections
+
+        prompt = EXTRACTION_PROMPT + EXTRACTION_PART_PROMPT.format(text=page["text"])
+        async with semaphore:
+            for _ in range(self.max_retries + 1):
+                stats.llm_calls += 1
+                try:
+                    sections = parse_sections(await self._complete(prompt))
+                    break
+                except Exception:
+                    # Invalid JSON (ValueError) or a provider error: the other
+                    # pages go on
+                    continue
+            else:
+                stats.failed_pages.append(page["page"])
+                return []
+
+        if self.cache is not None:
+            self.cache.put(key, sections)
+        return sections
+
+    async def aextract(self, file_path: str) -> list[dict]:
+        """Extract the sections of a form.
+
+        Parameters
+        ----------
+        file_path : str
+            The path of the form (PDF).
+
+        Returns
+        -------
+        list[dict]
+            The sections, as in the output format of `EXTRACTION_PROMPT`:
+            {"name": ..., "subsections": [title or section, ...]}.
+        """
+        start = time.perf_counter()
+        pages = await asyncio.to_thread(self._pages, file_path)
+        stats = ExtractionStats(pages=len(pages))
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        results = await asyncio.gather(
+            *[self._extract_page(page, semaphore, stats) for page in pages],
+            return_exceptions=True,
+        )
+        for page, result in zip(pages, results):
+            if isinstance(result, Exception):
+                # e.g. the page cache could not be read or written
+                stats.failed_pages.append(page["page"])
+        results = [result for result in results if not isinstance(result, Exception)]
+
+        stats.elapsed = time.perf_counter() - start
+        self.last_stats = stats
+        return merge_sections(results)
+
+    def extract(self, file_path: str) -> list[dict]:
+        """Synchronous version of `aextract`."""
+        return asyncio.run(self.aextract(file_path))
+
+
+def main():
+    # Load the environment variables (API key)
+    load_dotenv()
+
+    # Load the configuration file
+    config = toml.load(Path(__file__).parents[1] / "config.toml")
+    extraction_config = config.get("extraction", {})
+
+    parser = argparse.ArgumentParser(
+        description="Extract the sections of a grant form with EXTRACTION_PROMPT."
+    )
+    parser.add_argument("--file", default=config["test-documents"]["FORMULARIO"])
+    parser.add_argument("--output", help="JSON file (default: standard output).")
+    parser.add_argument("--model", default=config["openai"]["MODEL_NAME"])
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=extraction_config.get("CONCURRENCY", 8),
+        help="Pages extracted at once.",
+    )
+    args = parser.parse_args()
+
+    # The RAG builds the model and its provider limiter; no index is loaded
+    rag = RAG(
+        system_prompt="",
+        model=args.model,
+        concurrency_config=config.get("concurrency"),
+        router_config=config.get("router"),
+    )
+    document_cache_config = config.get("document_cache")
+    extractor = FormExtractor(
+        llm=rag.model,
+        limiter=rag.limiter,
+        document_cache=(
+            open_document_cache(
+                document_cache_config["PATH"],
+                document_cache_config.get("COMPRESSION_LEVEL", 6),
+            )
+            if document_cache_config
+            else None
+        ),
+        cache=(
+            ExtractionCache(extraction_config["CACHE_PATH"])
+            if "CACHE_PATH" in extraction_config
+            else None
+        ),
+        parser=extraction_config.get("PARSER", "llama-index"),
+        concurrency=args.concurrency,
+    )
+
+    sections = extractor.extract(args.file)
+    output = json.dumps({"sections": sections}, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+    print(f"Extracción: {extractor.last_stats.summary()}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
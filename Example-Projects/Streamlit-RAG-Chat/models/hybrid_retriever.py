@@ -0,0 +1,104 @@
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+)
+
+from models.sparse_index import SparseIndex
+
+# Constant of reciprocal-rank fusion: dampens the weight of the first ranks
+RRF_K = 60
+
+
+class HybridRetriever(BaseRetriever):
+    """Retriever that fuses vector search and BM25 keyword search.
+
+    Both searches return `candidates_per_side` chunks, which are merged with
+    reciprocal-rank fusion: a chunk scores the sum of 1 / (RRF_K + rank) over
+    the searches that found it. Exact terms (article numbers, form codes,
+    names) that the embedding misses are found by the keyword side, so a small
+    `top_k` keeps the recall of a larger vector-only one.
+
+    Scores are divided by the best possible fused score (first in both
+    searches), so they range from 0 to 1.
+
+    Parameters
+    ----------
+    vector_retriever : BaseRetriever
+        The vector retriever of the index, returning `candidates_per_side` chunks.
+    sparse_index : SparseIndex
+        The keyword index of the same collection.
+    vector_store : BasePydanticVectorStore
+        The vector store, used to load the chunks found only by keywords.
+    top_k : int
+        The number of fused chunks returned.
+    candidates_per_side : int
+        The number of chunks requested from each search.
+    filters : MetadataFilters | None, optional
+        The filters of the vector retriever, also applied to the chunks found
+        only by keywords, by default None.
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        sparse_index: SparseIndex,
+        vector_store: BasePydanticVectorStore,
+        top_k: int,
+        candidates_per_side: int,
+        filters: MetadataFilters | None = None,
+    ):
+        super().__init__(callback_manager=vector_retriever.callback_manager)
+        self.vector_retriever = vector_retriever
+        self.sparse_index = sparse_index
+        self.vector_store = vector_store
+        self.top_k = top_k
+        self.candidates_per_side = candidates_per_side
+        self.filters = filters
+
+    def _fuse(
+        self, vector_nodes: list[NodeWithScore], sparse_hits: list[tuple[str, float]]
+    ) -> list[NodeWithScore]:
+        nodes = {node.node.node_id: node.node for node in vector_nodes}
+        scores: dict[str, float] = {}
+        for ranking in (
+            [node.node.node_id for node in vector_nodes],
+            [node_id for node_id, _ in sparse_hits],
+        ):
+            for rank, node_id in enumerate(ranking, start=1):
+                scores[node_id] = scores.get(node_id, 0.0) + 1 / (RRF_K + rank)
+
+        # Chunks found only by keywords are loaded from the vector store. The
+        # filters drop some of them, so the ranking is truncated afterwards
+        missing = [node_id for node_id in scores if node_id not in nodes]
+        if missing:
+            for node in self.vector_store.get_nodes(
+                node_ids=missing, filters=self.filters
+            ):
+                nodes[node.node_id] = node
+
+        best = sorted(
+            (node_id for node_id in scores if node_id in nodes),
+            key=scores.get,
+            reverse=True,
+        )[: self.top_k]
+        max_score = 2 / (RRF_K + 1)
+        return [
+            NodeWithScore(node=nodes[node_id], score=scores[node_id] / max_score)
+            for node_id in best
+        ]
+
+    def _retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        vector_nodes = self.vector_retriever.retrieve(query_bundle)
+        sparse_hits = self.sparse_index.search(
+            query_bundle.query_str, self.candidates_per_side
+        )
+        return self._fuse(vector_nodes, sparse_hits)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        vector_nodes = await self.vector_retriever.aretrieve(query_bundle)
+        sparse_hits = self.sparse_index.search(
+            query_bundle.query_str, self.candidates_per_side
+        )
+        return self._fuse(vector_nodes, sparse_hits)
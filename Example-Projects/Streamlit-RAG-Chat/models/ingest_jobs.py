@@ -0,0 +1,238 @@
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, TypedDict
+
+from models.ingestion import IngestCancelledError, IngestStats
+
+# States of a job; the last three are final
+JOB_STATES = ["queued", "running", "succeeded", "failed", "cancelled"]
+FINAL_JOB_STATES = ["succeeded", "failed", "cancelled"]
+
+
+class JobProgress(TypedDict):
+    """Class to store the progress of an ingestion job, as shown in the app."""
+
+    files: int
+    files_parsed: int
+    pages: int
+    chunks: int
+    # Estimated fraction done, from 0 to 1
+    fraction: float
+    elapsed_seconds: float
+    # Estimated seconds left, None until it can be estimated
+    eta_seconds: float | None
+
+
+@dataclass
+class IngestJob:
+    """Class to store one background ingestion job.
+
+    `run` does the ingest: it receives the job, reports the live stats of the
+    ingest with `report` and stops when `cancel_event` is set (see the
+    `progress` and `cancel_event` arguments of `RAG.create_or_update_rag_index`).
+    """
+
+    id: str
+    description: str
+    run: Callable[["IngestJob"], IngestStats | None] = field(repr=False)
+    # Content hashes of the files of the job, kept while it may be retried
+    file_hashes: frozenset[str] = frozenset()
+    state: str = "queued"
+    stats: IngestStats | None = None
+    error: str | None = None
+    attempt: int = 1
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.state in FINAL_JOB_STATES
+
+    def report(self, stats: IngestStats) -> None:
+        """Record the live stats of the ingest (progress callback)."""
+        self.stats = stats
+
+    def progress(self) -> JobProgress:
+        """Get the files, pages and chunks processed so far and the time left."""
+        stats = self.stats or IngestStats()
+        if self.started_at is None:
+            elapsed = 0.0
+        else:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        if self.state == "succeeded":
+            fraction = 1.0
+        else:
+            # Nothing is known before the first report of the ingest
+            fraction = stats.fraction_done if self.stats is not None else 0.0
+        eta = None
+        if self.state == "running" and fraction > 0:
+            eta = elapsed * (1 - fraction) / fraction
+        return JobProgress(
+            files=stats.files,
+            files_parsed=stats.files_parsed,
+            pages=stats.pages,
+            chunks=stats.chunks,
+            fraction=fraction,
+            elapsed_seconds=elapsed,
+            eta_seconds=eta,
+        )
+
+
+class IngestJobQueue:
+    """Local queue of ingestion jobs run by background threads.
+
+    Jobs run in submission order, so a request that submits an ingest returns
+    at once while the app keeps answering queries. The RAG serializes the
+    updates of the index anyway, so one worker is usually enough.
+
+    Parameters
+    ----------
+    workers : int, optional
+        The number of jobs run at the same time, by default 1.
+    max_finished : int, optional
+        The number of finished jobs kept to show their result, by default 50.
+    """
+
+    def __init__(self, workers: int = 1, max_finished: int = 50):
+        self.max_finished = max_finished
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[IngestJob] = queue.Queue()
+        self._workers = [
+            threading.Thread(target=self._work, name=f"ingest-job-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        description: str,
+        run: Callable[[IngestJob], IngestStats | None],
+        file_hashes: frozenset[str] = frozenset(),
+        attempt: int = 1,
+    ) -> IngestJob:
+        """Queue an ingestion job.
+
+        Parameters
+        ----------
+        description : str
+            What the job ingests, e.g. the names of the files.
+        run : Callable[[IngestJob], IngestStats | None]
+            The function that runs the ingest, see `IngestJob`.
+        file_hashes : frozenset[str], optional
+            The content hashes of the files of the job.
+        attempt : int, optional
+            The attempt number, by default 1.
+        """
+        job = IngestJob(
+            id=uuid.uuid4().hex,
+            description=description,
+            run=run,
+            file_hashes=file_hashes,
+            attempt=attempt,
+        )
+        with self._lock:
+            self._jobs[job.id] = job
+            self._trim()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str) -> IngestJob | None:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> list[IngestJob]:
+        """Get the queued, running and latest finished jobs, oldest first."""
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job.
+
+        A queued job is cancelled at once. A running job stops at the next
+        batch of its ingest, and its partial chunks are removed.
+
+        Returns
+        -------
+        bool
+            Whether the job was still queued or running.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job.cancel_event.set()
+            if job.state == "queued":
+                job.state = "cancelled"
+                job.finished_at = time.time()
+            return True
+
+    def retry(self, job_id: str) -> IngestJob | None:
+        """Queue a failed or cancelled job again, as a new job.
+
+        Returns
+        -------
+        IngestJob | None
+            The new job, or None if the job cannot be retried.
+        """
+        job = self.get(job_id)
+        if job is None or job.state not in ["failed", "cancelled"]:
+            return None
+        return self.submit(
+            job.description, job.run, job.file_hashes, attempt=job.attempt + 1
+        )
+
+    def retained_hashes(self) -> set[str]:
+        """Get the content hashes of the jobs that have not succeeded.
+
+        Their uploaded files must be kept: they are still to be ingested, or
+        may be retried.
+        """
+        with self._lock:
+            return {
+                file_hash
+                for job in self._jobs.values()
+                if job.state != "succeeded"
+                for file_hash in job.file_hashes
+            }
+
+    def _trim(self) -> None:
+        """Forget the oldest finished jobs beyond `max_finished`."""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _work(self) -> None:
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if job.state != "queued":
+                    # Cancelled while queued
+                    continue
+                job.state = "running"
+                job.started_at = time.time()
+
+            try:
+                stats = job.run(job)
+            except IngestCancelledError:
+                state = "cancelled"
+            except Exception as e:
+                state = "failed"
+                job.error = f"{type(e).__name__}: {e}"
+            else:
+                state = "succeeded"
+                if stats is not None:
+                    job.stats = stats
+
+            with self._lock:
+                job.state = state
+                job.finished_at = time.time()
+                self._trim()
@@ -0,0 +1,466 @@
+import queue
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+from llama_index.core import Document, SimpleDirectoryReader
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, MetadataMode, TransformComponent
+from llama_index.core.vector_stores.types import BasePydanticVectorStore
+
+from models.document_cache import DocumentCache, open_document_cache
+from models.embedding_cache import EmbeddingCache
+from models.sparse_index import SparseIndex
+
+# Marks the end of the stream of items in a stage queue
+_STOP = object()
+
+
+class IngestCancelledError(RuntimeError):
+    """Raised by `ParallelIngestionPipeline.run` when the ingest is cancelled."""
+
+
+@dataclass
+class IngestStats:
+    """Class to store the throughput report of an ingestion run."""
+
+    files: int = 0
+    # Files parsed and split into chunks so far
+    files_parsed: int = 0
+    pages: int = 0
+    # Chunks produced by the chunk stage so far, and written to the vector store
+    chunks_split: int = 0
+    chunks: int = 0
+    embed_batches: int = 0
+    # Chunks whose embedding was found in the embedding cache
+    cache_hits: int = 0
+    # Files whose parsed pages were found in the document cache
+    parse_cache_hits: int = 0
+    write_batches: int = 0
+    # Busy time of each stage, in seconds, summed over its workers
+    stage_seconds: dict[str, float] = field(
+        default_factory=lambda: {"parse": 0.0, "chunk": 0.0, "embed": 0.0, "write": 0.0}
+    )
+    elapsed: float = 0.0
+    chunks_by_hash: Counter = field(default_factory=Counter)
+
+    @property
+    def pages_per_second(self) -> float:
+        return self.pages / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def fraction_done(self) -> float:
+        """Estimated fraction of the ingest done, from 0 to 1.
+
+        The chunks still to write are only known for the files already parsed,
+        so the written fraction is scaled by the fraction of files parsed.
+        """
+        if not self.files:
+            return 1.0
+        if not self.chunks_split:
+            return 0.0
+        return (self.files_parsed / self.files) * (self.chunks / self.chunks_split)
+
+    def summary(self) -> str:
+        """Get a one-line human readable throughput report."""
+        stages = ", ".join(
+            f"{stage} {seconds:.2f}s" for stage, seconds in self.stage_seconds.items()
+        )
+        return (
+            f"{self.files} archivos, {self.pages} páginas, {self.chunks} fragmentos "
+            f"en {self.elapsed:.2f}s ({self.pages_per_second:.1f} páginas/s, "
+            f"{self.chunks_per_second:.1f} fragmentos/s, "
+            f"{self.cache_hits} embeddings y {self.parse_cache_hits} documentos "
+            f"desde caché) [{stages}]"
+        )
+
+
+def parse_file(
+    file_path: str,
+    file_hash: str,
+    document_cache_path: str | None = None,
+    compression_level: int = 6,
+) -> tuple[list[Document], float, bool]:
+    """Parse a file into LlamaIndex documents (one per page for PDFs).
+
+    It is a module level function so that it can run in a worker process.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the file.
+    file_hash : str
+        The content hash of the file.
+    document_cache_path : str | None, optional
+        The path of a `DocumentCache`; if given, the file is parsed only if it
+        is not cached yet.
+    compression_level : int, optional
+        The zlib compression level of the pages written to the document
+        cache, by default 6.
+
+    Returns
+    -------
+    tuple[list[Document], float, bool]
+        The parsed documents, the seconds spent parsing them and whether they
+        were read from the document cache.
+    """
+    start = time.perf_counter()
+    if document_cache_path is None:
+        documents = SimpleDirectoryReader(input_files=[file_path]).load_data()
+        return documents, time.perf_counter() - start, False
+
+    document_cache = open_document_cache(document_cache_path, compression_level)
+    cached = document_cache.page_count(file_hash) is not None
+    documents = document_cache.load_documents(file_path, file_hash)
+    return documents, time.perf_counter() - start, cached
+
+
+def tag_document(
+    document: Document, file_hash: str, file_path: str | None = None
+) -> None:
+    """Add the content hash to the metadata of a document.
+
+    The hash is used to delete the chunks of a file, so it is excluded from the
+    text sent to the embedding model and to the LLM. So is the file path: it
+    changes with every upload (staging directory), and the embedding cache is
+    keyed by the embedded text. If given, `file_path` replaces the path the
+    document was read from, e.g. a temporary copy.
+    """
+    document.metadata["file_hash"] = file_hash
+    if file_path is not None:
+        document.metadata["file_path"] = file_path
+    for key in ["file_hash", "file_path"]:
+        if key not in document.excluded_embed_metadata_keys:
+            document.excluded_embed_metadata_keys.append(key)
+        if key not in document.excluded_llm_metadata_keys:
+            document.excluded_llm_metadata_keys.append(key)
+
+
+class ParallelIngestionPipeline:
+    """Staged ingestion pipeline: parse -> chunk -> embed -> write.
+
+    Files are parsed in a process pool, chunked, embedded in large batches and
+    written to the vector store in bulk. Stages are connected by bounded queues,
+    so a slow stage applies backpressure to the previous one instead of
+    accumulating the whole corpus in memory.
+
+    Parameters
+    ----------
+    embed_model : BaseEmbedding
+        The embedding model used to embed the chunks.
+    vector_store : BasePydanticVectorStore
+        The vector store where the embedded chunks are written.
+    transformations : list[TransformComponent]
+        The transformations (node parser) used to chunk the documents.
+    parse_workers : int, optional
+        The number of processes that parse files, by default 4.
+    embed_workers : int, optional
+        The number of threads that call the embedding model, by default 2.
+    embed_batch_size : int, optional
+        The number of chunks sent to the embedding model per call, by default 64.
+    write_batch_size : int, optional
+        The number of chunks written to the vector store per call, by default 256.
+    queue_size : int, optional
+        The maximum number of items waiting between two stages, by default 8.
+    embedding_cache : EmbeddingCache | None, optional
+        If given, chunks already embedded with the same model are read from it
+        and only the misses are sent to the embedding model.
+    sparse_index : SparseIndex | None, optional
+        If given, the chunks written to the vector store are also added to this
+        keyword index, which is kept in sync with the collection.
+    document_cache : DocumentCache | None, optional
+        If given, files already parsed are read from it instead of parsed again,
+        and new files are parsed into it.
+    progress : Callable[[IngestStats], None] | None, optional
+        Called with the stats of the run when it starts and every time a file is
+        chunked or a batch is written, from the pipeline threads.
+    cancel_event : threading.Event | None, optional
+        When set, the stages stop and `run` raises `IngestCancelledError`.
+    """
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        vector_store: BasePydanticVectorStore,
+        transformations: list[TransformComponent],
+        parse_workers: int = 4,
+        embed_workers: int = 2,
+        embed_batch_size: int = 64,
+        write_batch_size: int = 256,
+        queue_size: int = 8,
+        embedding_cache: EmbeddingCache | None = None,
+        sparse_index: SparseIndex | None = None,
+        document_cache: DocumentCache | None = None,
+        progress: Callable[[IngestStats], None] | None = None,
+        cancel_event: threading.Event | None = None,
+    ):
+        self.embed_model = embed_model
+        self.vector_store = vector_store
+        self.transformations = transformations
+        self.parse_workers = parse_workers
+        self.embed_workers = embed_workers
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.queue_size = queue_size
+        self.embedding_cache = embedding_cache
+        self.sparse_index = sparse_index
+        self.document_cache = document_cache
+        self.progress = progress
+        self.cancel_event = cancel_event
+
+    def run(
+        self, files: dict[str, str], source_paths: dict[str, str] | None = None
+    ) -> IngestStats:
+        """Ingest files into the vector store.
+
+        Parameters
+        ----------
+        files : dict[str, str]
+            The paths of the files to ingest, mapped to their content hash. The hash
+            is stored in the `file_hash` metadata of every chunk.
+        source_paths : dict[str, str] | None, optional
+            The path stored in the `file_path` metadata of the chunks of each
+            file, by the path it is read from (e.g. in a temporary directory),
+            by default the path it is read from.
+
+        Returns
+        -------
+        IngestStats
+            The throughput report of the run, including the number of chunks
+            written for each content hash.
+
+        Raises
+        ------
+        IngestCancelledError
+            If `cancel_event` is set before the run finishes.
+        """
+        stats = IngestStats(files=len(files))
+        if not files:
+            return stats
+
+        self._stats = stats
+        self._source_paths = source_paths or {}
+        self._lock = threading.Lock()
+        self._failed = threading.Event()
+        self._errors = []
+        self._report()
+
+        parsed = queue.Queue(maxsize=self.queue_size)
+        chunked = queue.Queue(maxsize=self.queue_size)
+        embedded = queue.Queue(maxsize=self.queue_size)
+
+        workers = [
+            threading.Thread(target=self._parse_stage, args=(files, parsed)),
+            threading.Thread(target=self._chunk_stage, args=(parsed, chunked)),
+            *[
+                threading.Thread(target=self._embed_stage, args=(chunked, embedded))
+                for _ in range(self.embed_workers)
+            ],
+            threading.Thread(target=self._write_stage, args=(embedded,)),
+        ]
+
+        start = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        stats.elapsed = time.perf_counter() - start
+
+        if self._errors:
+            raise self._errors[0]
+
+        return stats
+
+    def _stopped(self) -> bool:
+        """Check if a stage failed or the run was cancelled."""
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            if not self._failed.is_set():
+                self._fail(IngestCancelledError("La ingesta fue cancelada."))
+        return self._failed.is_set()
+
+    def _report(self) -> None:
+        if self.progress is not None:
+            self.progress(self._stats)
+
+    def _put(self, stage_queue: queue.Queue, item) -> bool:
+        """Put an item in a bounded queue, giving up if another stage failed."""
+        while not self._stopped():
+            try:
+                stage_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, stage_queue: queue.Queue):
+        """Get an item from a queue, returning `_STOP` if another stage failed."""
+        while not self._stopped():
+            try:
+                return stage_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _fail(self, error: Exception) -> None:
+        with self._lock:
+            self._errors.append(error)
+        self._failed.set()
+
+    def _add_time(self, stage: str, start: float) -> None:
+        with self._lock:
+            self._stats.stage_seconds[stage] += time.perf_counter() - start
+
+    def _parse_stage(self, files: dict[str, str], parsed: queue.Queue) -> None:
+        try:
+            executor = ProcessPoolExecutor(max_workers=self.parse_workers)
+            try:
+                # Bound the files in flight, so parsed documents do not pile up
+                # in memory while the next stages are busy
+                max_in_flight = self.parse_workers + self.queue_size
+                in_flight = deque()
+                # Workers open the document cache by path and compression level, once
+                # per process
+                document_cache_path = (
+                    self.document_cache.path if self.document_cache else None
+                )
+                compression_level = (
+                    self.document_cache.compression_level if self.document_cache else 6
+                )
+                for path, file_hash in files.items():
+                    in_flight.append(
+                        (
+                            path,
+                            executor.submit(
+                                parse_file,
+                                path,
+                                file_hash,
+                                document_cache_path,
+                                compression_level,
+                            ),
+                        )
+                    )
+                    if len(in_flight) >= max_in_flight and not self._forward_parsed(
+                        files, in_flight, parsed
+                    ):
+                        return
+                while in_flight:
+                    if not self._forward_parsed(files, in_flight, parsed):
+                        return
+            finally:
+                # After a failure or a cancel, the files not started are dropped
+                executor.shutdown(cancel_futures=self._failed.is_set())
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(parsed, _STOP)
+
+    def _forward_parsed(
+        self, files: dict[str, str], in_flight: deque, parsed: queue.Queue
+    ) -> bool:
+        """Wait for the oldest file being parsed and pass it to the chunk stage."""
+        path, future = in_flight.popleft()
+        documents, seconds, cached = future.result()
+        with self._lock:
+            self._stats.stage_seconds["parse"] += seconds
+            self._stats.parse_cache_hits += cached
+        return self._put(
+            parsed, (files[path], self._source_paths.get(path), documents)
+        )
+
+    def _chunk_stage(self, parsed: queue.Queue, chunked: queue.Queue) -> None:
+        batch = []
+        try:
+            while (item := self._get(parsed)) is not _STOP:
+                file_hash, source_path, documents = item
+                start = time.perf_counter()
+                for document in documents:
+                    tag_document(document, file_hash, source_path)
+                nodes = run_transformations(documents, self.transformations)
+                self._add_time("chunk", start)
+
+                with self._lock:
+                    self._stats.files_parsed += 1
+                    self._stats.pages += len(documents)
+                    self._stats.chunks_split += len(nodes)
+                self._report()
+
+                batch.extend(nodes)
+                while len(batch) >= self.embed_batch_size:
+                    if not self._put(chunked, batch[: self.embed_batch_size]):
+                        return
+                    batch = batch[self.embed_batch_size :]
+            if batch:
+                self._put(chunked, batch)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.embed_workers):
+                self._put(chunked, _STOP)
+
+    def _embed_stage(self, chunked: queue.Queue, embedded: queue.Queue) -> None:
+        try:
+            while (nodes := self._get(chunked)) is not _STOP:
+                start = time.perf_counter()
+                texts = [
+                    node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes
+                ]
+                if self.embedding_cache is not None:
+                    embeddings, cache_hits = self.embedding_cache.embed(
+                        self.embed_model, texts
+                    )
+                else:
+                    embeddings = self.embed_model.get_text_embedding_batch(texts)
+                    cache_hits = 0
+                for node, embedding in zip(nodes, embeddings):
+                    node.embedding = embedding
+                self._add_time("embed", start)
+
+                with self._lock:
+                    self._stats.embed_batches += 1
+                    self._stats.cache_hits += cache_hits
+                if not self._put(embedded, nodes):
+                    return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(embedded, _STOP)
+
+    def _write_stage(self, embedded: queue.Queue) -> None:
+        pending_stops = self.embed_workers
+        batch: list[BaseNode] = []
+        try:
+            while pending_stops:
+                nodes = self._get(embedded)
+                if nodes is _STOP:
+                    if self._failed.is_set():
+                        return
+                    pending_stops -= 1
+                    continue
+                batch.extend(nodes)
+                if len(batch) >= self.write_batch_size:
+                    self._write(batch)
+                    batch = []
+            if batch:
+                self._write(batch)
+        except Exception as e:
+            self._fail(e)
+
+    def _write(self, nodes: list[BaseNode]) -> None:
+        start = time.perf_counter()
+        self.vector_store.add(nodes)
+        if self.sparse_index is not None:
+            self.sparse_index.add(nodes)
+        self._add_time("write", start)
+
+        self._stats.write_batches += 1
+        self._stats.chunks += len(nodes)
+        self._stats.chunks_by_hash.update(node.metadata["file_hash"] for node in nodes)
+        self._report()
@@ -0,0 +1,189 @@
+import copy
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+from typing import TypedDict
+
+# Bytes read per iteration when hashing a file, so large PDFs are never loaded whole
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+class ManifestEntry(TypedDict):
+    """Class to store the manifest record of one indexed file content."""
+
+    file_names: list[str]
+    signature: str
+    chunks: int
+    bytes: int
+    indexed_at: str
+
+
+class IndexedDocument(TypedDict):
+    """Class to store the summary of one indexed file, as shown in the sidebar."""
+
+    file_name: str
+    chunks: int
+    bytes: int
+    indexed_at: str
+
+
+def file_sha256(file_path: str) -> str:
+    """Compute the SHA-256 hash of a file reading it in blocks.
+
+    Parameters
+    ----------
+    file_path : str
+        The path of the file to hash.
+
+    Returns
+    -------
+    str
+        The hexadecimal digest of the file content.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_path(vector_store_path: str, collection_name: str) -> str:
+    """Get the path of the manifest file of a vector store collection."""
+    return os.path.join(vector_store_path, f"{collection_name}.manifest.json")
+
+
+class IndexManifest:
+    """Content-addressed record of the files indexed in a vector store collection.
+
+    Entries are keyed by the SHA-256 hash of the file content, so a file edited
+    under the same name is detected as changed and identical content uploaded
+    under another name is not embedded twice. Each entry also stores the
+    signature (chunker and embedding model version) used to index it; entries
+    with a different signature are considered stale.
+
+    The manifest also keeps the number of chunks, the size and the indexing date
+    of each file, so listing the knowledge base costs O(files) instead of a scan
+    of every chunk in the collection.
+
+    Parameters
+    ----------
+    path : str
+        The path of the JSON file where the manifest is persisted.
+    signature : str, optional
+        The chunker/embedding-model signature of the current configuration.
+        It can be omitted when the manifest is only read.
+    """
+
+    def __init__(self, path: str, signature: str = ""):
+        self.path = path
+        self.signature = signature
+        self.version = 0
+        self.entries: dict[str, ManifestEntry] = {}
+        self.exists = os.path.exists(path)
+
+        if self.exists:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.version = data.get("version", 0)
+            self.entries = data.get("entries", {})
+
+    def save(self) -> None:
+        """Persist the manifest atomically and bump its version."""
+        self.version += 1
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": self.version, "entries": self.entries},
+                f,
+                ensure_ascii=False,
+                indent=2,
+            )
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+    def copy(self) -> "IndexManifest":
+        """Get an independent copy, to be modified while readers use this one."""
+        manifest = copy.copy(self)
+        manifest.entries = copy.deepcopy(self.entries)
+        return manifest
+
+    def hash_for_name(self, file_name: str) -> str | None:
+        """Return the content hash currently indexed under `file_name`, if any."""
+        for file_hash, entry in self.entries.items():
+            if file_name in entry["file_names"]:
+                return file_hash
+        return None
+
+    def is_current(self, file_hash: str) -> bool:
+        """Check if a content hash is indexed with the current signature."""
+        entry = self.entries.get(file_hash)
+        return entry is not None and entry["signature"] == self.signature
+
+    def add(
+        self, file_hash: str, file_name: str, chunks: int = 0, size: int = 0
+    ) -> None:
+        """Record that `file_name` is indexed with content `file_hash`.
+
+        Parameters
+        ----------
+        file_hash : str
+            The content hash of the file.
+        file_name : str
+            The name of the file.
+        chunks : int, optional
+            The number of chunks stored for this content. Ignored when the content
+            is already indexed under another name.
+        size : int, optional
+            The size of the file in bytes.
+        """
+        entry = self.entries.get(file_hash)
+        if entry is None or entry["signature"] != self.signature:
+            entry = {
+                "file_names": [],
+                "signature": self.signature,
+                "chunks": chunks,
+                "bytes": size,
+                "indexed_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            }
+            self.entries[file_hash] = entry
+        if file_name not in entry["file_names"]:
+            entry["file_names"].append(file_name)
+
+    def remove_name(self, file_name: str) -> str | None:
+        """Remove `file_name` from the manifest.
+
+        Returns
+        -------
+        str | None
+            The content hash whose chunks are no longer referenced by any file
+            name and must be deleted from the vector store, or None.
+        """
+        file_hash = self.hash_for_name(file_name)
+        if file_hash is None:
+            return None
+
+        entry = self.entries[file_hash]
+        entry["file_names"].remove(file_name)
+        if not entry["file_names"]:
+            del self.entries[file_hash]
+            return file_hash
+        return None
+
+    def file_names(self) -> set:
+        """Return every file name recorded in the manifest."""
+        return {name for entry in self.entries.values() for name in entry["file_names"]}
+
+    def documents(self) -> list[IndexedDocument]:
+        """Return one summary per indexed file name, sorted by name."""
+        documents = [
+            {
+                "file_name": name,
+                "chunks": entry.get("chunks", 0),
+                "bytes": entry.get("bytes", 0),
+                "indexed_at": entry.get("indexed_at", ""),
+            }
+            for entry in self.entries.values()
+            for name in entry["file_names"]
+        ]
+        return sorted(documents, key=lambda document: document["file_name"])
@@ -0,0 +1,687 @@
+import json
+import os
+import sqlite3
+import threading
+import warnings
+from typing import Any, Iterator
+
+import numpy as np
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.core.vector_stores.utils import (
+    metadata_dict_to_node,
+    node_to_metadata_dict,
+)
+from pydantic import Field, PrivateAttr
+
+# Storage types of the embeddings: 2 or 1 bytes per dimension instead of 4
+VECTOR_DTYPES = {"float16": np.float16, "int8": np.int8}
+
+# Bytes of embeddings dequantized per matrix product during a search
+SEARCH_BLOCK_BYTES = 32 * 1024 * 1024
+
+# Deleted rows tolerated before the arrays are compacted
+COMPACT_MIN_ROWS = 4096
+
+# Training points of the coarse partition per list
+IVF_SAMPLES_PER_LIST = 64
+
+# Metadata keys kept in their own indexed columns of the side table
+_COLUMNS = ["ref_doc_id", "file_hash", "file_name"]
+
+# SQLite operators of the supported metadata filters
+_SQL_OPERATORS = {
+    FilterOperator.EQ: "=",
+    FilterOperator.NE: "!=",
+    FilterOperator.GT: ">",
+    FilterOperator.LT: "<",
+    FilterOperator.GTE: ">=",
+    FilterOperator.LTE: "<=",
+    FilterOperator.IN: "IN",
+    FilterOperator.NIN: "NOT IN",
+}
+
+# Node ids per SQL statement, below the SQLite limit of variables
+_SQL_BATCH = 500
+
+
+def mmap_store_path(vector_store_path: str, collection_name: str) -> str:
+    """Get the directory of a memory-mapped collection inside the vector store path."""
+    return os.path.join(vector_store_path, f"{collection_name}.mmap")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _filter_sql(filters: MetadataFilters) -> tuple[str, list]:
+    """Translate metadata filters into a WHERE clause of the side table."""
+    clauses = []
+    params: list = []
+    for metadata_filter in filters.filters:
+        if isinstance(metadata_filter, MetadataFilters):
+            clause, clause_params = _filter_sql(metadata_filter)
+            clauses.append(f"({clause})")
+            params.extend(clause_params)
+            continue
+
+        operator = _SQL_OPERATORS.get(metadata_filter.operator)
+        if operator is None:
+            raise NotImplementedError(
+                f"Filter operator {metadata_filter.operator} is not supported."
+            )
+        if metadata_filter.key in _COLUMNS:
+            column = metadata_filter.key
+        else:
+            column = "json_extract(metadata, ?)"
+            params.append(f'$."{metadata_filter.key}"')
+
+        if operator in ["IN", "NOT IN"]:
+            values = list(metadata_filter.value)
+            clauses.append(f"{column} {operator} ({', '.join('?' * len(values))})")
+            params.extend(values)
+        else:
+            clauses.append(f"{column} {operator} ?")
+            params.append(metadata_filter.value)
+
+    if not clauses:
+        return "1", []
+    if filters.condition == FilterCondition.NOT:
+        return f"NOT ({' AND '.join(clauses)})", params
+    separator = " OR " if filters.condition == FilterCondition.OR else " AND "
+    return separator.join(clauses), params
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Local vector store of quantized embeddings in memory-mapped files.
+
+    The embeddings are normalized and stored as float16, or as int8 with one
+    float32 scale per row, in flat files that are memory-mapped instead of
+    loaded: opening the store costs the same whatever the size of the corpus,
+    and only the pages touched by the searches are kept in memory. The node
+    texts and metadata live in a SQLite side table indexed by row number,
+    node id, file hash and file name.
+
+    Searches are exact by default: the query is scored against blocks of rows
+    with a NumPy matrix product and the best rows are kept with
+    `argpartition`. With `ivf_lists` the rows are also partitioned around
+    k-means centroids (IVF) once the collection reaches `ivf_min_rows`, and
+    only the `nprobe` lists closest to the query are scored. The partition is
+    trained again every time the collection doubles.
+
+    Deleted rows are only marked as dead until they outnumber the live ones,
+    when the files are compacted.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the store, created if needed.
+    dtype : str, optional
+        "int8" or "float16", by default "int8". An existing store keeps the
+        type it was created with.
+    ivf_lists : int, optional
+        The number of lists of the coarse partition, by default 0 (exact search).
+    nprobe : int, optional
+        The number of lists scored per query, by default 8.
+    ivf_min_rows : int, optional
+        The rows below which the search stays exact, by default 50000.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = False
+
+    path: str
+    dtype: str = Field(default="int8")
+    ivf_lists: int = Field(default=0)
+    nprobe: int = Field(default=8)
+    ivf_min_rows: int = Field(default=50000)
+
+    _lock: threading.RLock = PrivateAttr(default_factory=threading.RLock)
+    _connection: sqlite3.Connection = PrivateAttr()
+    _dim: int | None = PrivateAttr(default=None)
+    # Rows written, dead or alive, and rows the files can hold
+    _rows: int = PrivateAttr(default=0)
+    _capacity: int = PrivateAttr(default=0)
+    _count: int = PrivateAttr(default=0)
+    _vectors: np.memmap | None = PrivateAttr(default=None)
+    _scales: np.memmap | None = PrivateAttr(default=None)
+    _alive: np.memmap | None = PrivateAttr(default=None)
+    # IVF list of every row, and the normalized centroids of the lists
+    _lists: np.memmap | None = PrivateAttr(default=None)
+    _centroids: np.ndarray | None = PrivateAttr(default=None)
+    _ivf_rows: int = PrivateAttr(default=0)
+    # Bumped when rows are renumbered or deleted, so a search that ran meanwhile
+    # is run again instead of returning rows that are gone
+    _generation: int = PrivateAttr(default=0)
+
+    def __init__(
+        self,
+        path: str,
+        dtype: str = "int8",
+        ivf_lists: int = 0,
+        nprobe: int = 8,
+        ivf_min_rows: int = 50000,
+    ):
+        if dtype not in VECTOR_DTYPES:
+            raise ValueError("Invalid dtype. Choose 'int8' or 'float16'.")
+
+        super().__init__(
+            path=path,
+            dtype=dtype,
+            ivf_lists=ivf_lists,
+            nprobe=nprobe,
+            ivf_min_rows=ivf_min_rows,
+        )
+        os.makedirs(path, exist_ok=True)
+
+        self._connection = sqlite3.connect(
+            os.path.join(path, "metadata.sqlite3"), check_same_thread=False
+        )
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS info (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                node_id TEXT NOT NULL UNIQUE,
+                ref_doc_id TEXT,
+                file_hash TEXT,
+                file_name TEXT,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_ref_doc_id ON chunks (ref_doc_id);
+            CREATE INDEX IF NOT EXISTS chunks_file_hash ON chunks (file_hash);
+            CREATE INDEX IF NOT EXISTS chunks_file_name ON chunks (file_name);
+            """)
+
+        info = dict(self._connection.execute("SELECT key, value FROM info"))
+        if "dim" in info:
+            if info["dtype"] != dtype:
+                warnings.warn(
+                    f"The store {path} uses {info['dtype']} instead of {dtype}; "
+                    "clear the knowledge base to change it.",
+                    stacklevel=2,
+                )
+                self.dtype = info["dtype"]
+            self._rows = int(info["rows"])
+            self._ivf_rows = int(info.get("ivf_rows", 0))
+            self._count = self._connection.execute(
+                "SELECT COUNT(*) FROM chunks"
+            ).fetchone()[0]
+            self._open_arrays(int(info["dim"]), int(info["capacity"]))
+
+            centroids_path = os.path.join(path, "ivf_centroids.npy")
+            if os.path.exists(centroids_path):
+                centroids = np.load(centroids_path)
+                if len(centroids) == self.ivf_lists:
+                    self._centroids = centroids
+            if self._centroids is None:
+                self._ivf_rows = 0
+            self._maybe_train_ivf()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._connection
+
+    def _map(self, name: str, dtype, shape: tuple) -> np.memmap:
+        """Memory-map an array file, growing it to `shape` if it is smaller."""
+        file_path = os.path.join(self.path, name)
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        with open(file_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        return np.memmap(file_path, dtype=dtype, mode="r+", shape=shape)
+
+    def _open_arrays(self, dim: int, capacity: int) -> None:
+        self._dim = dim
+        self._capacity = capacity
+        self._vectors = self._map(
+            "vectors.bin", VECTOR_DTYPES[self.dtype], (capacity, dim)
+        )
+        self._scales = (
+            self._map("scales.bin", np.float32, (capacity,))
+            if self.dtype == "int8"
+            else None
+        )
+        self._alive = self._map("alive.bin", np.uint8, (capacity,))
+        self._lists = self._map("ivf_lists.bin", np.int32, (capacity,))
+
+    def _flush(self) -> None:
+        for array in [self._vectors, self._scales, self._alive, self._lists]:
+            if array is not None:
+                array.flush()
+
+    def _save_info(self) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO info VALUES (?, ?)",
+                [
+                    ("dim", str(self._dim)),
+                    ("dtype", self.dtype),
+                    ("rows", str(self._rows)),
+                    ("capacity", str(self._capacity)),
+                    ("ivf_rows", str(self._ivf_rows)),
+                ],
+            )
+
+    def _reserve(self, n_rows: int) -> None:
+        """Grow the files (doubling them) until `n_rows` more rows fit."""
+        if self._rows + n_rows <= self._capacity:
+            return
+        capacity = max(1024, 2 * self._capacity, self._rows + n_rows)
+        self._flush()
+        # Searches in flight keep reading the previous (smaller) mappings
+        self._open_arrays(self._dim, capacity)
+
+    def _write_vectors(self, start: int, embeddings: np.ndarray) -> None:
+        end = start + len(embeddings)
+        if self.dtype == "int8":
+            scales = np.abs(embeddings).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self._vectors[start:end] = np.round(embeddings / scales[:, None])
+            self._scales[start:end] = scales
+        else:
+            self._vectors[start:end] = embeddings
+
+    @staticmethod
+    def _dequantize(vectors: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+        dequantized = vectors.astype(np.float32)
+        if scales is not None:
+            dequantized *= scales[:, None]
+        return dequantized
+
+    def _read_vectors(self, rows: np.ndarray) -> np.ndarray:
+        return self._dequantize(
+            self._vectors[rows],
+            self._scales[rows] if self._scales is not None else None,
+        )
+
+    def _block_rows(self) -> int:
+        return max(1024, SEARCH_BLOCK_BYTES // (4 * (self._dim or 1)))
+
+    def _rows_where(self, where: str, params: list) -> list[int]:
+        return [
+            row
+            for (row,) in self._connection.execute(
+                f"SELECT row FROM chunks WHERE {where}", params
+            )
+        ]
+
+    def _rows_of_ids(self, node_ids: list[str]) -> list[int]:
+        rows = []
+        for i in range(0, len(node_ids), _SQL_BATCH):
+            batch = node_ids[i : i + _SQL_BATCH]
+            rows.extend(
+                self._rows_where(f"node_id IN ({', '.join('?' * len(batch))})", batch)
+            )
+        return rows
+
+    def _nodes_of_rows(self, rows: list[int]) -> dict[int, BaseNode]:
+        nodes = {}
+        for i in range(0, len(rows), _SQL_BATCH):
+            batch = rows[i : i + _SQL_BATCH]
+            for row, text, metadata in self._connection.execute(
+                "SELECT row, text, metadata FROM chunks "
+                f"WHERE row IN ({', '.join('?' * len(batch))})",
+                batch,
+            ):
+                nodes[row] = metadata_dict_to_node(json.loads(metadata), text)
+        return nodes
+
+    def add(self, nodes: list[BaseNode], **add_kwargs: Any) -> list[str]:
+        """Append chunks, replacing those with the same node id."""
+        if not nodes:
+            return []
+        embeddings = _normalize(
+            np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        )
+        records = [
+            (
+                node.node_id,
+                node.ref_doc_id,
+                node.metadata.get("file_hash"),
+                node.metadata.get("file_name"),
+                node.get_content(metadata_mode=MetadataMode.NONE),
+                json.dumps(
+                    node_to_metadata_dict(node, remove_text=True, flat_metadata=False),
+                    ensure_ascii=False,
+                ),
+            )
+            for node in nodes
+        ]
+
+        with self._lock:
+            if self._dim is None:
+                self._open_arrays(embeddings.shape[1], 0)
+            elif embeddings.shape[1] != self._dim:
+                raise ValueError(
+                    f"Embedding dimension {embeddings.shape[1]} does not match "
+                    f"the store ({self._dim})."
+                )
+            self._delete_rows(self._rows_of_ids([node.node_id for node in nodes]))
+
+            start = self._rows
+            self._reserve(len(nodes))
+            self._write_vectors(start, embeddings)
+            if self._centroids is not None:
+                self._lists[start : start + len(nodes)] = np.argmax(
+                    embeddings @ self._centroids.T, axis=1
+                )
+            self._alive[start : start + len(nodes)] = 1
+            self._flush()
+
+            self._rows += len(nodes)
+            self._count += len(nodes)
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [(start + i, *record) for i, record in enumerate(records)],
+                )
+            self._save_info()
+            self._maybe_train_ivf()
+
+        return [node.node_id for node in nodes]
+
+    def _delete_rows(self, rows: list[int]) -> None:
+        if not rows:
+            return
+        with self._connection:
+            for i in range(0, len(rows), _SQL_BATCH):
+                batch = rows[i : i + _SQL_BATCH]
+                self._connection.execute(
+                    f"DELETE FROM chunks WHERE row IN ({', '.join('?' * len(batch))})",
+                    batch,
+                )
+        self._alive[rows] = 0
+        self._alive.flush()
+        self._count -= len(rows)
+        self._generation += 1
+
+    def _delete_where(self, where: str, params: list) -> None:
+        with self._lock:
+            self._delete_rows(self._rows_where(where, params))
+            if self._rows - self._count > max(COMPACT_MIN_ROWS, self._count):
+                self.compact()
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._delete_where("ref_doc_id = ?", [ref_doc_id])
+
+    def delete_nodes(
+        self,
+        node_ids: list[str] | None = None,
+        filters: MetadataFilters | None = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        where, params = _filter_sql(filters) if filters else ("1", [])
+        if node_ids is None:
+            self._delete_where(where, params)
+            return
+        for i in range(0, len(node_ids), _SQL_BATCH):
+            batch = node_ids[i : i + _SQL_BATCH]
+            self._delete_where(
+                f"({where}) AND node_id IN ({', '.join('?' * len(batch))})",
+                [*params, *batch],
+            )
+
+    def clear(self) -> None:
+        """Remove every chunk and truncate the files."""
+        with self._lock:
+            with self._connection:
+                self._connection.execute("DELETE FROM chunks")
+                self._connection.execute("DELETE FROM info")
+            self._vectors = self._scales = self._alive = self._lists = None
+            for name in os.listdir(self.path):
+                if name.endswith((".bin", ".npy")):
+                    os.remove(os.path.join(self.path, name))
+            self._dim = None
+            self._rows = self._capacity = self._count = self._ivf_rows = 0
+            self._centroids = None
+            self._generation += 1
+
+    def compact(self) -> None:
+        """Rewrite the files without the deleted rows, renumbering the live ones."""
+        with self._lock:
+            keep = np.flatnonzero(self._alive[: self._rows])
+            capacity = max(1024, len(keep))
+            block = self._block_rows()
+            arrays = {
+                "vectors.bin": self._vectors,
+                "scales.bin": self._scales,
+                "alive.bin": self._alive,
+                "ivf_lists.bin": self._lists,
+            }
+            for name, array in arrays.items():
+                if array is None:
+                    continue
+                tmp_name = f"{name}.tmp"
+                if os.path.exists(os.path.join(self.path, tmp_name)):
+                    os.remove(os.path.join(self.path, tmp_name))
+                target = self._map(tmp_name, array.dtype, (capacity, *array.shape[1:]))
+                for i in range(0, len(keep), block):
+                    rows = keep[i : i + block]
+                    target[i : i + len(rows)] = array[rows]
+                target.flush()
+                del target
+                # Searches in flight keep reading the replaced files
+                os.replace(
+                    os.path.join(self.path, tmp_name), os.path.join(self.path, name)
+                )
+
+            # Rows only move down, so renumbering them in order never collides
+            with self._connection:
+                self._connection.executemany(
+                    "UPDATE chunks SET row = ? WHERE row = ?",
+                    [(new, int(old)) for new, old in enumerate(keep) if new != old],
+                )
+            self._rows = len(keep)
+            self._generation += 1
+            self._open_arrays(self._dim, capacity)
+            self._save_info()
+
+    def _maybe_train_ivf(self) -> None:
+        """Train the IVF lists when the collection reaches or doubles its size."""
+        if not self.ivf_lists or self._count < max(self.ivf_min_rows, self.ivf_lists):
+            return
+        if self._centroids is not None and self._count < 2 * self._ivf_rows:
+            return
+
+        rng = np.random.default_rng(0)
+        alive_rows = np.flatnonzero(self._alive[: self._rows])
+        sample = np.sort(
+            rng.choice(
+                alive_rows,
+                size=min(len(alive_rows), self.ivf_lists * IVF_SAMPLES_PER_LIST),
+                replace=False,
+            )
+        )
+        points = _normalize(self._read_vectors(sample))
+
+        # Spherical k-means: centroids are normalized, points go to the closest
+        centroids = points[rng.choice(len(points), self.ivf_lists, replace=False)]
+        for _ in range(10):
+            assignment = np.argmax(points @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, points)
+            counts = np.bincount(assignment, minlength=self.ivf_lists)
+            # Empty lists keep their previous centroid
+            sums[counts == 0] = centroids[counts == 0]
+            centroids = _normalize(sums)
+
+        block = self._block_rows()
+        for start in range(0, self._rows, block):
+            end = min(start + block, self._rows)
+            self._lists[start:end] = np.argmax(
+                self._dequantize(
+                    self._vectors[start:end],
+                    self._scales[start:end] if self._scales is not None else None,
+                )
+                @ centroids.T,
+                axis=1,
+            )
+        self._lists.flush()
+
+        np.save(os.path.join(self.path, "ivf_centroids.npy"), centroids)
+        self._centroids = centroids
+        self._ivf_rows = self._count
+        self._save_info()
+
+    def _search(
+        self,
+        arrays: tuple,
+        query: np.ndarray,
+        top_k: int,
+        candidates: np.ndarray | None,
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Score rows against a normalized query and keep the best `top_k`.
+
+        All the rows are scored in contiguous blocks, or only `candidates` (row
+        numbers) when given. `arrays` are the (vectors, scales, alive, rows)
+        taken under the lock, so writes can go on during the search.
+        """
+        vectors, scales, alive, n_rows = arrays
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        block = self._block_rows()
+
+        n_candidates = n_rows if candidates is None else len(candidates)
+        for start in range(0, n_candidates, block):
+            end = min(start + block, n_candidates)
+            rows = (
+                np.arange(start, end) if candidates is None else candidates[start:end]
+            )
+            index = slice(start, end) if candidates is None else rows
+            # int8 rows are scaled after the product: one multiply per row
+            scores = vectors[index].astype(np.float32) @ query
+            if scales is not None:
+                scores *= scales[index]
+            scores[alive[index] == 0] = -np.inf
+
+            rows = np.concatenate([best_rows, rows])
+            scores = np.concatenate([best_scores, scores])
+            if len(scores) > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+                rows, scores = rows[top], scores[top]
+            best_rows, best_scores = rows, scores
+
+        order = np.argsort(-best_scores)
+        order = order[np.isfinite(best_scores[order])]
+        return best_rows[order], best_scores[order]
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Get the chunks most similar (cosine) to the query embedding."""
+        query_embedding = _normalize(
+            np.asarray(query.query_embedding, dtype=np.float32)
+        )
+        with self._lock:
+            if self._dim is None or not query.similarity_top_k:
+                return VectorStoreQueryResult(nodes=[], similarities=[], ids=[])
+            generation = self._generation
+            arrays = (self._vectors, self._scales, self._alive, self._rows)
+            candidates = None
+            if query.filters is not None or query.node_ids:
+                where, params = (
+                    _filter_sql(query.filters) if query.filters else ("1", [])
+                )
+                rows = self._rows_where(where, params)
+                if query.node_ids:
+                    rows = sorted(set(rows) & set(self._rows_of_ids(query.node_ids)))
+                candidates = np.asarray(rows, dtype=np.int64)
+            elif self._centroids is not None:
+                probes = np.argsort(self._centroids @ query_embedding)[-self.nprobe :]
+                candidates = np.flatnonzero(np.isin(self._lists[: self._rows], probes))
+
+        rows, scores = self._search(
+            arrays, query_embedding, query.similarity_top_k, candidates
+        )
+
+        with self._lock:
+            if generation != self._generation:
+                # Deleted or compacted meanwhile: the rows may be gone or renumbered
+                return self.query(query, **kwargs)
+            nodes = self._nodes_of_rows([int(row) for row in rows])
+        hits = [
+            (nodes[int(row)], float(score))
+            for row, score in zip(rows, scores)
+            if int(row) in nodes
+        ]
+        return VectorStoreQueryResult(
+            nodes=[node for node, _ in hits],
+            similarities=[score for _, score in hits],
+            ids=[node.node_id for node, _ in hits],
+        )
+
+    def get_nodes(
+        self,
+        node_ids: list[str] | None = None,
+        filters: MetadataFilters | None = None,
+    ) -> list[BaseNode]:
+        with self._lock:
+            where, params = _filter_sql(filters) if filters else ("1", [])
+            rows = self._rows_where(where, params)
+            if node_ids is not None:
+                rows = sorted(set(rows) & set(self._rows_of_ids(node_ids)))
+            nodes = self._nodes_of_rows(rows)
+        return [nodes[row] for row in rows]
+
+    def get_embeddings(self, node_ids: list[str]) -> dict[str, list[float]]:
+        """Get the stored (dequantized) embeddings of chunks by node id."""
+        with self._lock:
+            if self._dim is None:
+                return {}
+            found = {}
+            for i in range(0, len(node_ids), _SQL_BATCH):
+                batch = node_ids[i : i + _SQL_BATCH]
+                found.update(
+                    self._connection.execute(
+                        "SELECT node_id, row FROM chunks "
+                        f"WHERE node_id IN ({', '.join('?' * len(batch))})",
+                        batch,
+                    )
+                )
+            rows = np.asarray(list(found.values()), dtype=np.int64)
+            vectors = self._read_vectors(rows)
+        return {node_id: vector.tolist() for node_id, vector in zip(found, vectors)}
+
+    def iter_nodes(self, page_size: int = 1000) -> Iterator[list[BaseNode]]:
+        """Iterate over every chunk, in pages of `page_size` nodes."""
+        last_row = -1
+        while True:
+            with self._lock:
+                page = self._connection.execute(
+                    "SELECT row, text, metadata FROM chunks WHERE row > ? "
+                    "ORDER BY row LIMIT ?",
+                    (last_row, page_size),
+                ).fetchall()
+            if not page:
+                return
+            yield [
+                metadata_dict_to_node(json.loads(metadata), text)
+                for _, text, metadata in page
+            ]
+            last_row = page[-1][0]
+
+    def count(self) -> int:
+        """Get the number of stored chunks."""
+        return self._count
+
+    def close(self) -> None:
+        """Flush and unmap the files and close the side table."""
+        with self._lock:
+            self._flush()
+            self._vectors = self._scales = self._alive = self._lists = None
+            self._connection.close()
@@ -94,4 +94,29 @@ EXTRACTION_PROMPT = """
     - NÚMERO DE EXPEDIENTE
     - NÚMERO DE PROGRAMA
     ...
-    """
\ No newline at end of file
+    """
+
+EXTRACTION_PART_PROMPT = """
+    El siguiente documento es solo una página de un formulario más largo: extrae únicamente las secciones
+    que aparecen en ella. Si la página empieza con subsecciones de una sección cuyo título no aparece
+    en la página, agrúpalas en una sección con el nombre "(Cont.)".
+    Responde únicamente con el JSON, con el formato de salida esperado.
+
+    **Documento:**
+    ```
+    {text}
+    ```
+    """
+
+CHAT_SUMMARY_PROMPT = """
+    Eres un asistente que resume conversaciones. Actualiza el resumen de la conversación entre un usuario
+    y un asistente con los nuevos mensajes, conservando los datos, nombres, cifras y preguntas pendientes
+    que puedan ser necesarios para continuarla. Escribe el resumen en el idioma de la conversación y en
+    como máximo {max_tokens} tokens. Responde únicamente con el resumen actualizado.
+
+    **Resumen actual:**
+    {summary}
+
+    **Nuevos mensajes:**
+    {messages}
+    """
@@ -0,0 +1,274 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+from llama_index.core.base.base_query_engine import BaseQueryEngine
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.response.schema import RESPONSE_TYPE, Response
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a query for the exact tier: lowercase and collapsed whitespace."""
+    return re.sub(r"\s+", " ", query).strip().lower()
+
+
+class ResponseCache:
+    """Two-tier cache of query engine responses.
+
+    The exact tier matches the normalized text of the query. The semantic tier
+    matches queries whose embedding has a cosine similarity of at least
+    `similarity_threshold` with a cached one. Both tiers only match entries
+    of the same scope (index version and engine settings: response mode,
+    `top_k`, postprocessors, ...), so an answer is never served from a
+    different knowledge base or engine configuration.
+
+    Entries expire after `ttl_seconds` and the least recently used are evicted
+    when there are more than `max_entries`.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        The maximum number of cached responses, by default 256.
+    ttl_seconds : float, optional
+        The time to live of a cached response, by default 3600.
+    similarity_threshold : float, optional
+        The minimum cosine similarity for a semantic match, by default 0.95.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 256,
+        ttl_seconds: float = 3600,
+        similarity_threshold: float = 0.95,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.similarity_threshold = similarity_threshold
+
+        # key -> (created_at, unit query embedding or None, response)
+        self._entries: OrderedDict[tuple, tuple[float, Any, RESPONSE_TYPE]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+
+    def get_exact(self, scope: tuple, query: str) -> RESPONSE_TYPE | None:
+        """Get a cached response whose normalized query is the same.
+
+        Parameters
+        ----------
+        scope : tuple
+            The (index version, response mode, top_k, retriever mode) of the engine.
+        query : str
+            The user query.
+        """
+        key = (*scope, normalize_query(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or self._expired(entry):
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[2]
+
+    def get_similar(
+        self, scope: tuple, query_embedding: list[float]
+    ) -> RESPONSE_TYPE | None:
+        """Get the cached response of the most similar query above the threshold.
+
+        Parameters
+        ----------
+        scope : tuple
+            The (index version, response mode, top_k, retriever mode) of the engine.
+        query_embedding : list[float]
+            The embedding of the user query.
+        """
+        vector = _unit(query_embedding)
+        with self._lock:
+            self._purge_expired()
+            candidates = [
+                (key, entry)
+                for key, entry in self._entries.items()
+                if key[:-1] == scope and entry[1] is not None
+            ]
+            if not candidates:
+                self.misses += 1
+                return None
+
+            similarities = np.stack([entry[1] for _, entry in candidates]) @ vector
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.similarity_threshold:
+                self.misses += 1
+                return None
+
+            key, entry = candidates[best]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return entry[2]
+
+    def put(
+        self,
+        scope: tuple,
+        query: str,
+        query_embedding: list[float] | None,
+        response: RESPONSE_TYPE,
+    ) -> None:
+        """Cache the response of a query.
+
+        Parameters
+        ----------
+        scope : tuple
+            The (index version, response mode, top_k, retriever mode) of the engine.
+        query : str
+            The user query.
+        query_embedding : list[float] | None
+            The embedding of the query, used by the semantic tier.
+        response : RESPONSE_TYPE
+            The response, including its source nodes.
+        """
+        key = (*scope, normalize_query(query))
+        vector = _unit(query_embedding) if query_embedding is not None else None
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        """Drop every cached response, e.g. when new documents are indexed."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        """Get the hit/miss statistics of the cache."""
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": (
+                (self.exact_hits + self.semantic_hits) / lookups if lookups else 0.0
+            ),
+        }
+
+    def _expired(self, entry: tuple) -> bool:
+        return time.monotonic() - entry[0] > self.ttl_seconds
+
+    def _purge_expired(self) -> None:
+        for key in [
+            key for key, entry in self._entries.items() if self._expired(entry)
+        ]:
+            del self._entries[key]
+
+
+def _unit(embedding: list[float]) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class CachedQueryEngine(BaseQueryEngine):
+    """Query engine that serves repeated and near-duplicate queries from a cache.
+
+    The exact tier is checked first, without embedding the query. On a miss the
+    query is embedded once: the embedding is used for the semantic tier and is
+    then passed to the wrapped engine, so retrieval does not embed it again.
+
+    Parameters
+    ----------
+    query_engine : BaseQueryEngine
+        The wrapped query engine.
+    cache : ResponseCache
+        The response cache shared by every engine of the RAG.
+    embed_model : BaseEmbedding
+        The embedding model of the index.
+    scope : tuple
+        The index version and the settings (response mode, top_k, retriever
+        mode, other engine arguments) of the wrapped engine.
+    """
+
+    def __init__(
+        self,
+        query_engine: BaseQueryEngine,
+        cache: ResponseCache,
+        embed_model: BaseEmbedding,
+        scope: tuple,
+    ):
+        super().__init__(callback_manager=query_engine.callback_manager)
+        self.query_engine = query_engine
+        self.cache = cache
+        self.embed_model = embed_model
+        self.scope = scope
+
+    def _get_prompt_modules(self) -> dict:
+        return {"query_engine": self.query_engine}
+
+    def lookup(self, query_bundle: QueryBundle) -> RESPONSE_TYPE | None:
+        """Look up a query in both tiers of the cache.
+
+        On an exact miss the query is embedded and the embedding is stored in the
+        query bundle, so the retrieval that follows a miss reuses it.
+        """
+        response = self.cache.get_exact(self.scope, query_bundle.query_str)
+        if response is not None:
+            return response
+
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self.embed_model.get_query_embedding(
+                query_bundle.query_str
+            )
+        return self.cache.get_similar(self.scope, query_bundle.embedding)
+
+    async def alookup(self, query_bundle: QueryBundle) -> RESPONSE_TYPE | None:
+        """Asynchronously look up a query in both tiers of the cache."""
+        response = self.cache.get_exact(self.scope, query_bundle.query_str)
+        if response is not None:
+            return response
+
+        if query_bundle.embedding is None:
+            query_bundle.embedding = await self.embed_model.aget_query_embedding(
+                query_bundle.query_str
+            )
+        return self.cache.get_similar(self.scope, query_bundle.embedding)
+
+    def store(self, query_bundle: QueryBundle, response: Response) -> None:
+        """Cache the complete response of a query."""
+        self.cache.put(
+            self.scope, query_bundle.query_str, query_bundle.embedding, response
+        )
+
+    def retrieve(self, query_bundle: QueryBundle) -> list[NodeWithScore]:
+        return self.query_engine.retrieve(query_bundle)
+
+    def synthesize(
+        self, query_bundle: QueryBundle, nodes: list[NodeWithScore], **kwargs
+    ) -> RESPONSE_TYPE:
+        return self.query_engine.synthesize(query_bundle, nodes, **kwargs)
+
+    def _query(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        response = self.lookup(query_bundle)
+        if response is not None:
+            return response
+
+        response = self.query_engine.query(query_bundle)
+        # A streaming response can only be consumed once, so it is not cached here
+        if isinstance(response, Response):
+            self.store(query_bundle, response)
+        return response
+
+    async def _aquery(self, query_bundle: QueryBundle) -> RESPONSE_TYPE:
+        response = await self.alookup(query_bundle)
+        if response is not None:
+            return response
+
+        response = await self.query_engine.aquery(query_bundle)
+        if isinstance(response, Response):
+            self.store(query_bundle, response)
+        return response
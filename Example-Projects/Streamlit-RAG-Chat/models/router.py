@@ -0,0 +1,645 @@
+import asyncio
+import contextlib
+import inspect
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterator, Sequence, TypeVar
+
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    ChatResponseGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.llms import LLM
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from pydantic import Field, PrivateAttr
+
+from models.concurrency import ProviderLimiter
+
+T = TypeVar("T")
+
+# Synchronous calls of every router run in these threads, so a slow provider
+# can be hedged and abandoned without blocking the caller
+_route_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-route")
+# The tokens of synchronous streams are read in these threads, so a stalled
+# stream times out. They are separate from the route threads, which may all be
+# waiting for the limiter slots held by the streams.
+_stream_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-stream")
+
+# Returned by `next` at the end of a stream
+_END = object()
+
+
+class RouteTimeoutError(TimeoutError):
+    """Raised when a provider does not answer within the timeout of the router."""
+
+
+@dataclass
+class Route:
+    """Class to store one model provider of the router and its latest calls."""
+
+    name: str
+    llm: LLM
+    # The limiter of the provider, shared with the other users of the provider
+    limiter: ProviderLimiter | None = None
+    # (finished at, seconds, ok) of the latest calls
+    calls: deque = field(default_factory=lambda: deque(maxlen=500), repr=False)
+    # The route is only used as a last resort until then, after too many errors
+    open_until: float = 0.0
+    # Calls hedged to this route, and calls answered by it
+    hedges: int = 0
+    wins: int = 0
+
+
+@dataclass
+class _Attempt:
+    """One call of the router to one route."""
+
+    route: Route
+    future: Future | None = None
+    submitted_at: float = field(default_factory=time.monotonic)
+    # Set once the call holds a limiter slot, when it is sent to the provider
+    started_at: float | None = None
+    # Set when the router stops waiting for the call; its outcome is ignored
+    abandoned: bool = False
+
+
+@dataclass
+class _OpenStream:
+    """A stream of one route that has yielded its first item.
+
+    It holds the limiter slot of the route until it is exhausted or closed.
+    """
+
+    route: Route
+    first: Any
+    rest: Any
+    # Releases the limiter slot (a coroutine function for asynchronous streams)
+    release: Callable[[], Any]
+    closed: bool = False
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            if hasattr(self.rest, "close"):
+                self.rest.close()
+            self.release()
+
+    async def aclose(self) -> None:
+        if not self.closed:
+            self.closed = True
+            if hasattr(self.rest, "aclose"):
+                await self.rest.aclose()
+            await self.release()
+
+    def __del__(self) -> None:
+        # A synchronous stream dropped before it is read still frees its slot
+        if not inspect.iscoroutinefunction(self.release):
+            self.close()
+
+
+def _first(stream: Iterator[T]) -> tuple[T | None, Iterator[T]]:
+    """Wait for the first item of a stream, so streams race on time to first token."""
+    stream = iter(stream)
+    return next(stream, None), stream
+
+
+async def _afirst(stream: Awaitable[AsyncIterator[T]]) -> tuple[T | None, Any]:
+    stream = await stream
+    try:
+        return await stream.__anext__(), stream
+    except StopAsyncIteration:
+        return None, stream
+
+
+def _close_stream(future: Future) -> None:
+    """Close the stream of an abandoned call, if it opened one."""
+    if not future.cancelled() and future.exception() is None:
+        result = future.result()
+        if isinstance(result, _OpenStream):
+            result.close()
+
+
+class RouterLLM(LLM):
+    """LLM that sends each request to the fastest healthy of several providers.
+
+    The latency and errors of every call are kept per route over a rolling
+    window. Each request goes first to the healthy route with the lowest
+    median latency (routes without calls yet are tried first, in the given
+    order). If it has not answered by the `hedge_quantile` latency of that
+    route (its usual p95), the request is also sent to the next route and the
+    first answer wins. The slower call is abandoned: asynchronous calls are
+    cancelled, synchronous calls only if they have not started yet (a running
+    thread cannot be interrupted, so its answer is ignored), and the stream of
+    the slower route is closed. A call that fails or takes longer than
+    `timeout` falls back to the next route at once. A route whose error rate
+    over the window goes above `max_error_rate` is left out for
+    `cooldown_seconds`.
+
+    Latencies and timeouts are measured from the moment a call gets the
+    limiter slot of its provider. A call still waiting for a slot after
+    `timeout` is given up too, but it is not counted as an error of the
+    route, since the provider was never called.
+
+    Streams race on their first token; after it, each token must arrive
+    within `timeout` or the stream fails with `RouteTimeoutError`. A stream
+    holds the limiter slot of its route until it is exhausted or closed.
+
+    Every call goes through the limiter of its provider, so the router keeps
+    to the concurrency and rate limits of each of them.
+
+    Parameters
+    ----------
+    routes : list[Route]
+        The providers, in order of preference while their latency is unknown.
+    hedge_quantile : float, optional
+        The latency quantile after which a request is hedged, by default 0.95.
+    initial_hedge_delay : float, optional
+        The hedge delay of a route with fewer than `min_samples` calls, by
+        default 2.0 seconds.
+    min_hedge_delay : float, optional
+        The minimum hedge delay, by default 0.05 seconds.
+    timeout : float, optional
+        The seconds a route has to answer before falling back, by default 30.0.
+    window_seconds : float, optional
+        The rolling window of the latency and error stats, by default 300.0.
+    min_samples : int, optional
+        The calls of a route needed to trust its stats, by default 5.
+    max_error_rate : float, optional
+        The error rate above which a route is left out, by default 0.5.
+    cooldown_seconds : float, optional
+        The seconds a route with too many errors is left out, by default 30.0.
+    hedge : bool, optional
+        Whether slow requests are hedged, by default True.
+    """
+
+    hedge_quantile: float = Field(default=0.95)
+    initial_hedge_delay: float = Field(default=2.0)
+    min_hedge_delay: float = Field(default=0.05)
+    timeout: float = Field(default=30.0)
+    window_seconds: float = Field(default=300.0)
+    min_samples: int = Field(default=5)
+    max_error_rate: float = Field(default=0.5)
+    cooldown_seconds: float = Field(default=30.0)
+    hedge: bool = Field(default=True)
+
+    _routes: list[Route] = PrivateAttr(default_factory=list)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, routes: list[Route], **kwargs: Any):
+        if not routes:
+            raise ValueError("The router needs at least one route.")
+        super().__init__(**kwargs)
+        self._routes = list(routes)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RouterLLM"
+
+    @property
+    def routes(self) -> list[Route]:
+        return self._routes
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        # The first route counts the tokens; the context fits every route
+        primary = self._routes[0].llm.metadata
+        return primary.model_copy(
+            update={
+                "context_window": min(
+                    route.llm.metadata.context_window for route in self._routes
+                ),
+                "num_output": min(
+                    route.llm.metadata.num_output for route in self._routes
+                ),
+            }
+        )
+
+    # Route stats
+
+    def _window(self, route: Route, now: float) -> list[tuple[float, float, bool]]:
+        return [call for call in route.calls if now - call[0] <= self.window_seconds]
+
+    def _latency(
+        self,
+        route: Route,
+        quantile: float,
+        now: float,
+        min_samples: int = 1,
+        latest: int | None = None,
+    ) -> float | None:
+        """Get a latency quantile of the successful calls of a route in the window.
+
+        With `latest`, only that many of the latest calls are used.
+        """
+        latencies = [seconds for _, seconds, ok in self._window(route, now) if ok]
+        latencies = sorted(latencies[-latest:] if latest else latencies)
+        if len(latencies) < max(1, min_samples):
+            return None
+        return latencies[min(len(latencies) - 1, int(quantile * len(latencies)))]
+
+    def _error_rate(self, route: Route, now: float) -> float:
+        calls = self._window(route, now)
+        return sum(not ok for _, _, ok in calls) / len(calls) if calls else 0.0
+
+    def _record(self, route: Route, seconds: float, ok: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            route.calls.append((now, seconds, ok))
+            if (
+                not ok
+                and len(self._window(route, now)) >= self.min_samples
+                and self._error_rate(route, now) > self.max_error_rate
+            ):
+                # The window starts again when the route is back
+                route.open_until = now + self.cooldown_seconds
+                route.calls.clear()
+
+    def _plan(self) -> list[Route]:
+        """Get the routes in the order they are tried for the next request.
+
+        Healthy routes go first, by the median latency of their latest calls,
+        so a route that slows down loses its turn after a few calls.
+        """
+        with self._lock:
+            now = time.monotonic()
+            return [
+                route
+                for _, _, _, route in sorted(
+                    (
+                        route.open_until > now,
+                        self._latency(route, 0.5, now, latest=self.min_samples) or 0.0,
+                        i,
+                        route,
+                    )
+                    for i, route in enumerate(self._routes)
+                )
+            ]
+
+    def _hedge_delay(self, route: Route) -> float:
+        with self._lock:
+            latency = self._latency(
+                route, self.hedge_quantile, time.monotonic(), self.min_samples
+            )
+        if latency is None:
+            latency = self.initial_hedge_delay
+        return max(self.min_hedge_delay, min(latency, self.timeout))
+
+    def _count(self, route: Route, counter: str) -> None:
+        with self._lock:
+            setattr(route, counter, getattr(route, counter) + 1)
+
+    def stats(self) -> list[dict]:
+        """Get the latency, error rate and health of every route over the window."""
+        with self._lock:
+            now = time.monotonic()
+            return [
+                {
+                    "name": route.name,
+                    "calls": len(self._window(route, now)),
+                    "p50_seconds": self._latency(route, 0.5, now),
+                    "p95_seconds": self._latency(route, 0.95, now),
+                    "error_rate": self._error_rate(route, now),
+                    "healthy": route.open_until <= now,
+                    "hedges": route.hedges,
+                    "wins": route.wins,
+                }
+                for route in self._routes
+            ]
+
+    # Synchronous routing
+
+    def _deadline(self, attempt: _Attempt) -> float:
+        """Get when a call times out, waiting for a slot or for the provider."""
+        return (attempt.started_at or attempt.submitted_at) + self.timeout
+
+    def _attempt(
+        self, attempt: _Attempt, call: Callable[[LLM], T], stream: bool = False
+    ) -> T:
+        route = attempt.route
+        with contextlib.ExitStack() as slot:
+            if route.limiter is not None:
+                slot.enter_context(route.limiter)
+            if attempt.abandoned:
+                # The router gave up while the call waited for the slot
+                raise RouteTimeoutError(f"{route.name} had no free slot in time.")
+            start = time.monotonic()
+            attempt.started_at = start
+            try:
+                result = call(route.llm)
+            except Exception:
+                if not attempt.abandoned:
+                    self._record(route, time.monotonic() - start, False)
+                raise
+            if not attempt.abandoned:
+                self._record(route, time.monotonic() - start, True)
+            if stream:
+                # The slot is kept until the stream is exhausted or closed
+                return _OpenStream(route, *result, release=slot.pop_all().close)
+        return result
+
+    def _abandon(self, attempt: _Attempt, timed_out: bool = False) -> None:
+        attempt.abandoned = True
+        attempt.future.add_done_callback(_close_stream)
+        started_at = attempt.started_at
+        if attempt.future.cancel() or started_at is None:
+            # It was still queued or waiting for a slot: the route was never called
+            return
+        # A call that lost the race took at least this long
+        self._record(attempt.route, time.monotonic() - started_at, ok=not timed_out)
+
+    def _run(self, call: Callable[[LLM], T], stream: bool = False) -> T:
+        """Run a call on the routes, hedging and falling back as needed.
+
+        With `stream`, `call` returns the first item and the rest of a stream
+        (`_first`), and the stream of the route that answers first is returned.
+        """
+        routes = self._plan()
+        attempts: list[_Attempt] = []
+        last_error: Exception | None = None
+
+        def start() -> float:
+            attempt = _Attempt(route=routes[len(attempts)])
+            attempt.future = _route_executor.submit(
+                self._attempt, attempt, call, stream
+            )
+            attempts.append(attempt)
+            return time.monotonic() + self._hedge_delay(attempt.route)
+
+        hedge_at = start()
+        while True:
+            running = [attempt for attempt in attempts if not attempt.abandoned]
+            can_hedge = self.hedge and len(attempts) < len(routes)
+            deadlines = [hedge_at] if can_hedge else []
+            deadlines += [self._deadline(attempt) for attempt in running]
+            wait(
+                [attempt.future for attempt in running],
+                timeout=max(0.0, min(deadlines) - time.monotonic()),
+                return_when=FIRST_COMPLETED,
+            )
+
+            now = time.monotonic()
+            failed = False
+            for attempt in running:
+                if attempt.future.done():
+                    attempt.abandoned = True
+                    try:
+                        result = attempt.future.result()
+                    except Exception as e:
+                        last_error = e
+                        failed = True
+                        continue
+                    self._count(attempt.route, "wins")
+                    for other in running:
+                        if not other.abandoned:
+                            self._abandon(other)
+                    return result
+                if now >= self._deadline(attempt):
+                    reached_provider = attempt.started_at is not None
+                    self._abandon(attempt, timed_out=True)
+                    last_error = RouteTimeoutError(
+                        f"{attempt.route.name} did not answer in {self.timeout}s."
+                        if reached_provider
+                        else f"{attempt.route.name} had no free slot in {self.timeout}s."
+                    )
+                    failed = True
+
+            running = [attempt for attempt in attempts if not attempt.abandoned]
+            if len(attempts) == len(routes):
+                if not running:
+                    raise last_error
+            elif failed:
+                # A call failed: fall back to the next route at once, even if
+                # a hedged call is still running
+                hedge_at = start()
+            elif can_hedge and now >= hedge_at:
+                self._count(routes[len(attempts)], "hedges")
+                hedge_at = start()
+
+    def _stream(self, stream: _OpenStream) -> Iterator:
+        """Yield the items of the stream that won the race, then free its slot."""
+        route = stream.route
+        pending: Future | None = None
+        try:
+            if stream.first is not None:
+                yield stream.first
+            while True:
+                pending = _stream_executor.submit(next, stream.rest, _END)
+                start = time.monotonic()
+                try:
+                    item = pending.result(timeout=self.timeout)
+                except Exception:
+                    self._record(route, time.monotonic() - start, False)
+                    if pending.done():
+                        raise
+                    raise RouteTimeoutError(
+                        f"{route.name} sent no token in {self.timeout}s."
+                    )
+                if item is _END:
+                    return
+                yield item
+        finally:
+            if pending is None or pending.done():
+                stream.close()
+            else:
+                # The stalled token is still being read: close the stream after it
+                pending.add_done_callback(lambda _: stream.close())
+
+    # Asynchronous routing
+
+    async def _aattempt(
+        self,
+        attempt: _Attempt,
+        call: Callable[[LLM], Awaitable[T]],
+        stream: bool = False,
+    ) -> T:
+        route = attempt.route
+        async with contextlib.AsyncExitStack() as slot:
+            if route.limiter is not None:
+                try:
+                    await asyncio.wait_for(
+                        slot.enter_async_context(route.limiter), self.timeout
+                    )
+                except asyncio.TimeoutError:
+                    # The provider was never called: not an error of the route
+                    raise RouteTimeoutError(
+                        f"{route.name} had no free slot in {self.timeout}s."
+                    )
+            start = time.monotonic()
+            attempt.started_at = start
+            try:
+                result = await asyncio.wait_for(call(route.llm), self.timeout)
+            except asyncio.TimeoutError:
+                self._record(route, self.timeout, False)
+                raise RouteTimeoutError(
+                    f"{route.name} did not answer in {self.timeout}s."
+                )
+            except Exception:
+                self._record(route, time.monotonic() - start, False)
+                raise
+            self._record(route, time.monotonic() - start, True)
+            if stream:
+                # The slot is kept until the stream is exhausted or closed
+                return _OpenStream(route, *result, release=slot.pop_all().aclose)
+        return result
+
+    async def _arun(
+        self, call: Callable[[LLM], Awaitable[T]], stream: bool = False
+    ) -> T:
+        """Asynchronous version of `_run`."""
+        routes = self._plan()
+        tasks: dict[asyncio.Task, _Attempt] = {}
+        started = 0
+        last_error: Exception | None = None
+
+        def start() -> float:
+            nonlocal started
+            attempt = _Attempt(route=routes[started])
+            started += 1
+            task = asyncio.create_task(self._aattempt(attempt, call, stream))
+            tasks[task] = attempt
+            return time.monotonic() + self._hedge_delay(attempt.route)
+
+        hedge_at = start()
+        try:
+            while tasks:
+                can_hedge = self.hedge and started < len(routes)
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=(
+                        max(0.0, hedge_at - time.monotonic()) if can_hedge else None
+                    ),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if not done:
+                    self._count(routes[started], "hedges")
+                    hedge_at = start()
+                    continue
+
+                failed = False
+                for task in done:
+                    attempt = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        last_error = e
+                        failed = True
+                        continue
+                    self._count(attempt.route, "wins")
+                    return result
+
+                if failed and started < len(routes):
+                    # A call failed: fall back to the next route at once, even
+                    # if a hedged call is still running
+                    hedge_at = start()
+            raise last_error
+        finally:
+            for task, attempt in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    if attempt.started_at is not None:
+                        # A call that lost the race took at least this long
+                        self._record(
+                            attempt.route, time.monotonic() - attempt.started_at, True
+                        )
+                elif not task.cancelled() and task.exception() is None:
+                    # Answered in the same round as the winner
+                    result = task.result()
+                    if isinstance(result, _OpenStream):
+                        await result.aclose()
+
+    async def _astream(self, stream: _OpenStream) -> AsyncIterator:
+        """Asynchronous version of `_stream`."""
+        route = stream.route
+        try:
+            if stream.first is not None:
+                yield stream.first
+            while True:
+                start = time.monotonic()
+                try:
+                    item = await asyncio.wait_for(stream.rest.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    return
+                except asyncio.TimeoutError:
+                    self._record(route, self.timeout, False)
+                    raise RouteTimeoutError(
+                        f"{route.name} sent no token in {self.timeout}s."
+                    )
+                except Exception:
+                    self._record(route, time.monotonic() - start, False)
+                    raise
+                yield item
+        finally:
+            await stream.aclose()
+
+    # LLM interface
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        return self._run(lambda llm: llm.chat(messages, **kwargs))
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        return self._run(lambda llm: llm.complete(prompt, formatted, **kwargs))
+
+    @llm_chat_callback()
+    def stream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseGen:
+        return self._stream(
+            self._run(lambda llm: _first(llm.stream_chat(messages, **kwargs)), True)
+        )
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        return self._stream(
+            self._run(
+                lambda llm: _first(llm.stream_complete(prompt, formatted, **kwargs)),
+                True,
+            )
+        )
+
+    @llm_chat_callback()
+    async def achat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        return await self._arun(lambda llm: llm.achat(messages, **kwargs))
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        return await self._arun(lambda llm: llm.acomplete(prompt, formatted, **kwargs))
+
+    @llm_chat_callback()
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        return self._astream(
+            await self._arun(
+                lambda llm: _afirst(llm.astream_chat(messages, **kwargs)), True
+            )
+        )
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        return self._astream(
+            await self._arun(
+                lambda llm: _afirst(llm.astream_complete(prompt, formatted, **kwargs)),
+                True,
+            )
+        )
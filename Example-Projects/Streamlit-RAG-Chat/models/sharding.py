@@ -0,0 +1,238 @@
+import hashlib
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryResult,
+)
+from llama_index.vector_stores.chroma import ChromaVectorStore
+from pydantic import Field, PrivateAttr
+
+# Ways of assigning a chunk to a shard
+SHARD_STRATEGIES = ["hash", "source", "time"]
+
+# Separates the collection name from the shard suffix: "<collection>--<shard>"
+SHARD_SEPARATOR = "--"
+
+# The shards of every store are queried in these threads, so reopening the
+# index does not leave a pool of idle threads behind
+_shard_executor = ThreadPoolExecutor(thread_name_prefix="shard-query")
+
+
+def shard_collection_names(client, collection_name: str) -> list[str]:
+    """Get the names of the existing shards of a collection, sorted.
+
+    Parameters
+    ----------
+    client : chromadb.api.API
+        The ChromaDB client.
+    collection_name : str
+        The name of the sharded collection.
+    """
+    prefix = f"{collection_name}{SHARD_SEPARATOR}"
+    names = [
+        collection if isinstance(collection, str) else collection.name
+        for collection in client.list_collections()
+    ]
+    return sorted(name for name in names if name.startswith(prefix))
+
+
+class ShardedVectorStore(BasePydanticVectorStore):
+    """Vector store spread over several ChromaDB collections (shards).
+
+    Chunks are written to the shard chosen by `strategy`:
+
+    - "hash": `num_shards` shards, by the content hash of the file, so every
+      chunk of a file lands in the same shard and the shards stay balanced.
+    - "source": one shard per value of the `source_key` metadata (e.g. the
+      file type).
+    - "time": one shard per month of ingestion, so large new ingests never
+      touch the shards of older documents.
+
+    Queries fan out to the loaded shards in parallel and their top-k results
+    are merged by similarity. With `load_shards` only some shards are queried
+    (and kept in memory); writes and deletes always reach every shard. It is a
+    regular LlamaIndex vector store, so `VectorStoreIndex.from_vector_store`
+    and both engine builders work on it unchanged.
+
+    Parameters
+    ----------
+    client : chromadb.api.API
+        The ChromaDB client where the shards are stored.
+    collection_name : str
+        The name of the sharded collection, used as prefix of the shards.
+    strategy : str, optional
+        "hash", "source" or "time", by default "hash".
+    num_shards : int, optional
+        The number of shards of the "hash" strategy, by default 4.
+    source_key : str, optional
+        The metadata key of the "source" strategy, by default "file_type".
+    load_shards : list[str] | None, optional
+        The suffixes of the shards to query (e.g. ["00", "01"]), by default all.
+    """
+
+    stores_text: bool = True
+    flat_metadata: bool = True
+
+    collection_name: str
+    strategy: str = Field(default="hash")
+    num_shards: int = Field(default=4)
+    source_key: str = Field(default="file_type")
+    load_shards: list[str] | None = Field(default=None)
+
+    _client: Any = PrivateAttr()
+    _stores: dict[str, ChromaVectorStore] = PrivateAttr(default_factory=dict)
+
+    def __init__(
+        self,
+        client: Any,
+        collection_name: str,
+        strategy: str = "hash",
+        num_shards: int = 4,
+        source_key: str = "file_type",
+        load_shards: list[str] | None = None,
+    ):
+        if strategy not in SHARD_STRATEGIES:
+            raise ValueError("Invalid strategy. Choose 'hash', 'source' or 'time'.")
+
+        super().__init__(
+            collection_name=collection_name,
+            strategy=strategy,
+            num_shards=num_shards,
+            source_key=source_key,
+            load_shards=load_shards or None,
+        )
+        self._client = client
+
+        suffixes = [
+            name.removeprefix(f"{collection_name}{SHARD_SEPARATOR}")
+            for name in shard_collection_names(client, collection_name)
+        ]
+        if strategy == "hash":
+            suffixes = [f"{i:02d}" for i in range(num_shards)]
+        for suffix in suffixes:
+            if self.load_shards is None or suffix in self.load_shards:
+                self._store(suffix)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ShardedVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return self._client
+
+    def _store(self, suffix: str) -> ChromaVectorStore:
+        """Get the vector store of a shard, creating the collection if needed."""
+        if suffix not in self._stores:
+            collection = self._client.get_or_create_collection(
+                f"{self.collection_name}{SHARD_SEPARATOR}{suffix}"
+            )
+            self._stores[suffix] = ChromaVectorStore(chroma_collection=collection)
+        return self._stores[suffix]
+
+    def _all_stores(self) -> list[ChromaVectorStore]:
+        """Open every shard, including those not loaded for queries."""
+        for name in shard_collection_names(self._client, self.collection_name):
+            self._store(name.removeprefix(f"{self.collection_name}{SHARD_SEPARATOR}"))
+        return list(self._stores.values())
+
+    def _loaded_stores(self) -> list[ChromaVectorStore]:
+        return [
+            store
+            for suffix, store in self._stores.items()
+            if self.load_shards is None or suffix in self.load_shards
+        ]
+
+    def collections(self) -> list:
+        """Get the ChromaDB collections of every shard."""
+        return [store.client for store in self._all_stores()]
+
+    def shard_for(self, node: BaseNode) -> str:
+        """Get the suffix of the shard where a chunk is written."""
+        if self.strategy == "hash":
+            key = node.metadata.get("file_hash") or node.metadata.get("file_name", "")
+            digest = hashlib.sha256(key.encode()).hexdigest()
+            return f"{int(digest, 16) % self.num_shards:02d}"
+        if self.strategy == "source":
+            value = str(node.metadata.get(self.source_key) or "unknown")
+            # Collection names only allow letters, digits, "-", "_" and "."
+            return re.sub(r"[^a-zA-Z0-9]+", "-", value).strip("-").lower() or "unknown"
+        return datetime.now(timezone.utc).strftime("%Y%m")
+
+    def add(self, nodes: list[BaseNode], **add_kwargs: Any) -> list[str]:
+        """Write chunks to their shards."""
+        by_shard: dict[str, list[BaseNode]] = defaultdict(list)
+        for node in nodes:
+            by_shard[self.shard_for(node)].append(node)
+
+        ids = []
+        for suffix, shard_nodes in by_shard.items():
+            ids.extend(self._store(suffix).add(shard_nodes, **add_kwargs))
+        return ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        for store in self._all_stores():
+            store.delete(ref_doc_id, **delete_kwargs)
+
+    def delete_nodes(
+        self,
+        node_ids: list[str] | None = None,
+        filters: MetadataFilters | None = None,
+        **delete_kwargs: Any,
+    ) -> None:
+        for store in self._all_stores():
+            store.delete_nodes(node_ids=node_ids, filters=filters, **delete_kwargs)
+
+    def clear(self) -> None:
+        for store in self._all_stores():
+            store.clear()
+
+    def get_nodes(
+        self,
+        node_ids: list[str] | None = None,
+        filters: MetadataFilters | None = None,
+    ) -> list[BaseNode]:
+        nodes = []
+        for store in self._loaded_stores():
+            nodes.extend(store.get_nodes(node_ids=node_ids, filters=filters))
+        return nodes
+
+    def get_embeddings(self, node_ids: list[str]) -> dict[str, list[float]]:
+        """Get the stored embeddings of chunks by node id."""
+        embeddings = {}
+        for store in self._loaded_stores():
+            result = store.client.get(ids=node_ids, include=["embeddings"])
+            embeddings.update(zip(result["ids"], result["embeddings"]))
+        return embeddings
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        """Query the loaded shards in parallel and merge their top-k results."""
+        stores = self._loaded_stores()
+        results = list(
+            _shard_executor.map(lambda store: store.query(query, **kwargs), stores)
+        )
+
+        hits = sorted(
+            (
+                (similarity, node, node_id)
+                for result in results
+                for node, similarity, node_id in zip(
+                    result.nodes, result.similarities, result.ids
+                )
+            ),
+            key=lambda hit: hit[0],
+            reverse=True,
+        )[: query.similarity_top_k]
+        return VectorStoreQueryResult(
+            nodes=[node for _, node, _ in hits],
+            similarities=[similarity for similarity, _, _ in hits],
+            ids=[node_id for _, _, node_id in hits],
+        )
@@ -0,0 +1,205 @@
+import heapq
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+
+from llama_index.core.schema import BaseNode, MetadataMode
+
+# Words too common in Spanish to help ranking
+STOPWORDS = set(
+    "a al algo ante como con contra cual cuando de del desde donde durante e el "
+    "ella ellas ellos en entre era es esa ese eso esta este esto fue ha hay la "
+    "las le les lo los mas me mi muy no nos o para pero por que se sea ser si "
+    "sin sobre su sus te tu un una uno unos y ya".split()
+)
+
+# Words, numbers and codes such as "8-2019", "12.3" or "iii_blanco"
+_TOKEN_PATTERN = re.compile(r"\w+(?:[./-]\w+)*")
+
+
+def sparse_index_path(vector_store_path: str, chroma_collection_name: str) -> str:
+    """Get the path of the keyword index stored next to a ChromaDB collection."""
+    return os.path.join(vector_store_path, f"{chroma_collection_name}.sparse.sqlite3")
+
+
+def tokenize(text: str) -> list[str]:
+    """Split a text into lowercase, accent-free search terms.
+
+    Codes made of several parts (article numbers, dates, form codes) are kept
+    whole and also split into their parts, so "8-2019" matches both the exact
+    code and the year.
+    """
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+
+    terms = []
+    for match in _TOKEN_PATTERN.findall(text):
+        parts = re.split(r"[./-]", match)
+        if len(parts) > 1:
+            terms.append(match)
+        terms.extend(part for part in parts if part and part not in STOPWORDS)
+    return terms
+
+
+def node_search_text(node: BaseNode) -> str:
+    """Get the text of a chunk indexed for keyword search: its text and file name."""
+    return (
+        f"{node.metadata.get('file_name', '')}\n{node.get_content(MetadataMode.NONE)}"
+    )
+
+
+class SparseIndex:
+    """Inverted index of the chunks of a collection, ranked with BM25.
+
+    It lives in a SQLite file next to the ChromaDB collection and is updated
+    with the same chunks (added and deleted by file hash or file name), so it
+    is maintained incrementally instead of being rebuilt on every ingest.
+
+    Parameters
+    ----------
+    path : str
+        The path of the SQLite file.
+    k1 : float, optional
+        The BM25 term frequency saturation, by default 1.2.
+    b : float, optional
+        The BM25 length normalization, by default 0.75.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                node_id TEXT PRIMARY KEY,
+                file_hash TEXT,
+                file_name TEXT,
+                length INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS chunks_file_hash ON chunks (file_hash);
+            CREATE INDEX IF NOT EXISTS chunks_file_name ON chunks (file_name);
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                node_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (term, node_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_node_id ON postings (node_id);
+            """)
+        # (number of chunks, average length), refreshed after every change
+        self._stats: tuple[int, float] | None = None
+
+    def add(self, nodes: list[BaseNode]) -> None:
+        """Index chunks, replacing those with the same node id."""
+        chunks = []
+        postings = []
+        for node in nodes:
+            terms = Counter(tokenize(node_search_text(node)))
+            chunks.append(
+                (
+                    node.node_id,
+                    node.metadata.get("file_hash"),
+                    node.metadata.get("file_name"),
+                    sum(terms.values()),
+                )
+            )
+            postings.extend((term, node.node_id, tf) for term, tf in terms.items())
+
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM postings WHERE node_id = ?",
+                [(chunk[0],) for chunk in chunks],
+            )
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?)", chunks
+            )
+            self._connection.executemany(
+                "INSERT INTO postings VALUES (?, ?, ?)", postings
+            )
+            self._stats = None
+
+    def delete(self, key: str, value: str) -> None:
+        """Remove the chunks whose `key` ("file_hash" or "file_name") is `value`."""
+        if key not in ["file_hash", "file_name"]:
+            raise ValueError("Chunks can only be deleted by file_hash or file_name.")
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM postings WHERE node_id IN "
+                f"(SELECT node_id FROM chunks WHERE {key} = ?)",
+                (value,),
+            )
+            self._connection.execute(f"DELETE FROM chunks WHERE {key} = ?", (value,))
+            self._stats = None
+
+    def clear(self) -> None:
+        """Remove every chunk."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM postings")
+            self._connection.execute("DELETE FROM chunks")
+            self._stats = None
+
+    def count(self) -> int:
+        """Get the number of indexed chunks."""
+        return self._collection_stats()[0]
+
+    def _collection_stats(self) -> tuple[int, float]:
+        with self._lock:
+            if self._stats is None:
+                n_chunks, average_length = self._connection.execute(
+                    "SELECT COUNT(*), AVG(length) FROM chunks"
+                ).fetchone()
+                self._stats = (n_chunks, average_length or 0.0)
+            return self._stats
+
+    def search(self, query: str, top_k: int) -> list[tuple[str, float]]:
+        """Get the `top_k` chunks with the highest BM25 score for a query.
+
+        Parameters
+        ----------
+        query : str
+            The user query.
+        top_k : int
+            The number of chunks to return.
+
+        Returns
+        -------
+        list[tuple[str, float]]
+            The (node id, score) pairs, best first.
+        """
+        terms = set(tokenize(query))
+        n_chunks, average_length = self._collection_stats()
+        if not terms or not n_chunks:
+            return []
+
+        scores: dict[str, float] = {}
+        with self._lock:
+            for term in terms:
+                rows = self._connection.execute(
+                    "SELECT p.node_id, p.tf, c.length FROM postings p "
+                    "JOIN chunks c ON c.node_id = p.node_id WHERE p.term = ?",
+                    (term,),
+                ).fetchall()
+                if not rows:
+                    continue
+
+                idf = math.log(1 + (n_chunks - len(rows) + 0.5) / (len(rows) + 0.5))
+                for node_id, tf, length in rows:
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[node_id] = scores.get(node_id, 0.0) + idf * tf * (
+                        self.k1 + 1
+                    ) / (tf + norm)
+
+        return heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,100 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Callable, Generator, Iterable
+
+from llama_index.core.schema import NodeWithScore
+
+if TYPE_CHECKING:
+    from models.tracing import QueryTrace
+
+# Stats of the node postprocessors of the query running in the current thread /
+# asyncio task, by postprocessor class name
+_postprocessor_stats: ContextVar[dict[str, Any] | None] = ContextVar(
+    "postprocessor_stats", default=None
+)
+
+
+def report_postprocessor_stats(name: str, stats: Any) -> None:
+    """Add the stats of a node postprocessor to those of the running query.
+
+    Postprocessors are shared by the engines of every session, so their stats
+    are returned with each answer instead of being kept on the postprocessor.
+    Does nothing outside `collect_postprocessor_stats`.
+    """
+    collected = _postprocessor_stats.get()
+    if collected is not None:
+        collected[name] = stats
+
+
+@contextmanager
+def collect_postprocessor_stats() -> Generator[dict[str, Any], None, None]:
+    """Collect the stats reported by the node postprocessors inside the block."""
+    collected: dict[str, Any] = {}
+    token = _postprocessor_stats.set(collected)
+    try:
+        yield collected
+    finally:
+        _postprocessor_stats.reset(token)
+
+
+@dataclass
+class QueryTimings:
+    """Class to store the latency of one query."""
+
+    query: str
+    retrieval_seconds: float = 0.0
+    # Seconds from the start of the query to the first token of the answer
+    time_to_first_token: float | None = None
+    total_seconds: float = 0.0
+    cached: bool = False
+
+
+@dataclass
+class QueryStream:
+    """Class to store a streamed answer: its sources are available before its tokens.
+
+    `tokens` starts the synthesis and returns its token generator. It is only
+    called when `response_gen` is first iterated, so the sources can be rendered
+    before synthesis starts. While the tokens are yielded, the time to first
+    token and the total latency are recorded in `timings`, measured from `start`.
+    """
+
+    source_nodes: list[NodeWithScore]
+    timings: QueryTimings
+    tokens: Callable[[], Iterable[str]]
+    start: float
+    # Called with the full answer once every token has been yielded
+    on_complete: Callable[[str], None] | None = None
+    # Called with the exception if the synthesis fails or the stream is closed
+    # before its last token
+    on_error: Callable[[BaseException], None] | None = None
+    # Per-stage trace of the query, complete once every token has been yielded
+    trace: "QueryTrace | None" = None
+    # Stats of the node postprocessors, by class name (e.g. "DiversityPostprocessor")
+    postprocessor_stats: dict[str, Any] = field(default_factory=dict)
+    response_txt: str = ""
+    response_gen: Generator[str, None, None] = field(init=False)
+
+    def __post_init__(self):
+        self.response_gen = self._timed_tokens()
+
+    def _timed_tokens(self) -> Generator[str, None, None]:
+        chunks = []
+        try:
+            for token in self.tokens():
+                if self.timings.time_to_first_token is None:
+                    self.timings.time_to_first_token = time.perf_counter() - self.start
+                chunks.append(token)
+                yield token
+        except BaseException as e:
+            self.timings.total_seconds = time.perf_counter() - self.start
+            if self.on_error is not None:
+                self.on_error(e)
+            raise
+
+        self.timings.total_seconds = time.perf_counter() - self.start
+        self.response_txt = "".join(chunks)
+        if self.on_complete is not None:
+            self.on_complete(self.response_txt)
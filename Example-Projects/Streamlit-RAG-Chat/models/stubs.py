@@ -0,0 +1,191 @@
+import asyncio
+import hashlib
+import math
+import random
+import re
+import time
+from typing import Any, Sequence
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.base.llms.generic_utils import (
+    completion_response_to_chat_response,
+)
+from llama_index.core.base.llms.types import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CompletionResponseAsyncGen,
+    CompletionResponseGen,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
+from llama_index.core.llms.custom import CustomLLM
+
+
+class StubLLMError(RuntimeError):
+    """Error injected by `StubLLM` to simulate a failing provider."""
+
+
+class StubLLM(CustomLLM):
+    """Local LLM for tests and benchmarks, without network calls.
+
+    It answers with a fixed text after a configurable delay, streaming it word
+    by word, and fails with `StubLLMError` with probability `error_rate`. The
+    async methods sleep with `asyncio.sleep`, so concurrent calls overlap like
+    real HTTP requests do.
+    """
+
+    model_name: str = "stub-llm"
+    answer: str = "Respuesta generada localmente a partir de los documentos."
+    delay: float = 0.0
+    # Delay between two streamed tokens
+    token_delay: float = 0.0
+    error_rate: float = 0.0
+    context_window: int = 32768
+    calls: int = 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StubLLM"
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=self.context_window,
+            num_output=256,
+            model_name=self.model_name,
+            is_chat_model=False,
+        )
+
+    def _start(self) -> None:
+        self.calls += 1
+        if self.error_rate and random.random() < self.error_rate:
+            raise StubLLMError(f"{self.model_name} failed (injected error).")
+
+    def _tokens(self) -> list[str]:
+        return [f"{word} " for word in self.answer.split()]
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        time.sleep(self.delay)
+        self._start()
+        return CompletionResponse(text=self.answer)
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        time.sleep(self.delay)
+        self._start()
+
+        def gen() -> CompletionResponseGen:
+            text = ""
+            for token in self._tokens():
+                time.sleep(self.token_delay)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_completion_callback()
+    async def acomplete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        await asyncio.sleep(self.delay)
+        self._start()
+        return CompletionResponse(text=self.answer)
+
+    @llm_completion_callback()
+    async def astream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseAsyncGen:
+        await asyncio.sleep(self.delay)
+        self._start()
+
+        async def gen() -> CompletionResponseAsyncGen:
+            text = ""
+            for token in self._tokens():
+                await asyncio.sleep(self.token_delay)
+                text += token
+                yield CompletionResponse(text=text, delta=token)
+
+        return gen()
+
+    @llm_chat_callback()
+    async def achat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        prompt = self.messages_to_prompt(messages)
+        completion_response = await self.acomplete(prompt, formatted=True, **kwargs)
+        return completion_response_to_chat_response(completion_response)
+
+    @llm_chat_callback()
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        prompt = self.messages_to_prompt(messages)
+        completion_response_gen = await self.astream_complete(
+            prompt, formatted=True, **kwargs
+        )
+
+        async def gen() -> ChatResponseAsyncGen:
+            text = ""
+            async for completion_response in completion_response_gen:
+                text += completion_response.delta
+                yield ChatResponse(
+                    message=ChatMessage(role="assistant", content=text),
+                    delta=completion_response.delta,
+                )
+
+        return gen()
+
+
+class StubEmbedding(BaseEmbedding):
+    """Deterministic local embedding model, without network calls.
+
+    Words are lowercased and hashed into `embed_dim` signed buckets (the hashing
+    trick), so texts sharing words get similar vectors and retrieval results
+    are meaningful and reproducible. An optional `delay` simulates the latency
+    of a remote embedding API per call.
+    """
+
+    model_name: str = "stub-embedding"
+    embed_dim: int = 256
+    delay: float = 0.0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "StubEmbedding"
+
+    def _vector(self, text: str) -> list[float]:
+        vector = [0.0] * self.embed_dim
+        for word in re.findall(r"\w+", text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.embed_dim
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _get_query_embedding(self, query: str) -> list[float]:
+        time.sleep(self.delay)
+        return self._vector(query)
+
+    def _get_text_embedding(self, text: str) -> list[float]:
+        time.sleep(self.delay)
+        return self._vector(text)
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        # A batch costs one call, like a remote embedding API
+        time.sleep(self.delay)
+        return [self._vector(text) for text in texts]
+
+    async def _aget_query_embedding(self, query: str) -> list[float]:
+        await asyncio.sleep(self.delay)
+        return self._vector(query)
+
+    async def _aget_text_embedding(self, text: str) -> list[float]:
+        await asyncio.sleep(self.delay)
+        return self._vector(text)
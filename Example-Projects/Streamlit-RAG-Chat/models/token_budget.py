@@ -0,0 +1,204 @@
+import threading
+import warnings
+from dataclasses import dataclass
+from functools import lru_cache
+
+import tiktoken
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore, QueryBundle
+from pydantic import Field, PrivateAttr
+
+from models.streaming import report_postprocessor_stats
+
+# Encoding of the models without a local tokenizer
+DEFAULT_ENCODING = "cl100k_base"
+# Characters per token of the estimate used when no encoding can be loaded
+CHARS_PER_TOKEN = 4
+
+
+class _CharacterEncoding:
+    """Estimate of a tokenizer: one token every `CHARS_PER_TOKEN` characters.
+
+    It has the `encode`/`decode` interface of `tiktoken.Encoding`, so texts can
+    still be counted and truncated when no encoding file is available.
+    """
+
+    def encode(self, text: str, **kwargs) -> list[str]:
+        return [
+            text[i : i + CHARS_PER_TOKEN] for i in range(0, len(text), CHARS_PER_TOKEN)
+        ]
+
+    def decode(self, tokens: list[str]) -> str:
+        return "".join(tokens)
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model_name: str) -> tiktoken.Encoding | _CharacterEncoding:
+    """Get the local tokenizer of a model.
+
+    OpenAI models use their own tiktoken encoding. Models without a local
+    tokenizer (e.g. Gemini) are estimated with `DEFAULT_ENCODING`, which
+    usually stays within a few percent of the provider count. If no encoding
+    can be loaded (e.g. no network to download it), the tokens are estimated
+    from the characters.
+
+    Parameters
+    ----------
+    model_name : str
+        The name of the model, e.g. "gpt-4o-mini" or "models/gemini-2.0-flash".
+    """
+    try:
+        return tiktoken.encoding_for_model(model_name.removeprefix("models/"))
+    except KeyError:
+        pass
+    except Exception as e:
+        # The encoding file could not be downloaded (e.g. no network)
+        warnings.warn(f"Tokenizer of {model_name} unavailable ({e}).")
+    try:
+        return tiktoken.get_encoding(DEFAULT_ENCODING)
+    except Exception as e:
+        warnings.warn(
+            f"Tokenizer {DEFAULT_ENCODING} unavailable ({e}); token counts are "
+            f"estimated as {CHARS_PER_TOKEN} characters per token."
+        )
+        return _CharacterEncoding()
+
+
+@lru_cache(maxsize=50_000)
+def count_tokens(text: str, model_name: str) -> int:
+    """Count the tokens of a text locally, caching the counts of repeated texts.
+
+    Parameters
+    ----------
+    text : str
+        The text to count.
+    model_name : str
+        The name of the model whose tokenizer is used.
+    """
+    return len(get_encoding(model_name).encode(text, disallowed_special=()))
+
+
+@dataclass
+class PackingStats:
+    """Class to store what the context packer did with the retrieved nodes."""
+
+    nodes_in: int = 0
+    nodes_out: int = 0
+    nodes_truncated: int = 0
+    tokens_in: int = 0
+    tokens_out: int = 0
+
+    @property
+    def nodes_dropped(self) -> int:
+        return self.nodes_in - self.nodes_out
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_in - self.tokens_out
+
+    def add(self, other: "PackingStats") -> None:
+        self.nodes_in += other.nodes_in
+        self.nodes_out += other.nodes_out
+        self.nodes_truncated += other.nodes_truncated
+        self.tokens_in += other.tokens_in
+        self.tokens_out += other.tokens_out
+
+
+class TokenBudgetPacker(BaseNodePostprocessor):
+    """Node postprocessor that fits the retrieved nodes into a token budget.
+
+    Nodes are taken by decreasing score while they fit in the budget. The
+    first node that does not fit is truncated to the remaining tokens if at
+    least `min_node_tokens` remain, and dropped otherwise; smaller nodes further
+    down the ranking can still use what is left. The kept nodes are returned in
+    their original order.
+
+    The prompt sent to the LLM is thus bounded whatever the `top_k`, and so is
+    the number of `refine` calls.
+    """
+
+    token_budget: int = Field(description="Maximum tokens of retrieved context.")
+    model_name: str = Field(description="Model whose tokenizer counts the tokens.")
+    min_node_tokens: int = Field(
+        default=64, description="Smallest useful truncated node."
+    )
+
+    _total: PackingStats = PrivateAttr(default_factory=PackingStats)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "TokenBudgetPacker"
+
+    def __repr__(self) -> str:
+        # Used in the engine pool keys: same configuration, same engine
+        return (
+            f"TokenBudgetPacker({self.token_budget}, {self.model_name!r}, "
+            f"{self.min_node_tokens})"
+        )
+
+    def _count(self, text: str) -> int:
+        return count_tokens(text, self.model_name)
+
+    def _postprocess_nodes(
+        self,
+        nodes: list[NodeWithScore],
+        query_bundle: QueryBundle | None = None,
+    ) -> list[NodeWithScore]:
+        stats = PackingStats(nodes_in=len(nodes))
+        remaining = self.token_budget
+        packed: dict[int, NodeWithScore] = {}
+
+        ranking = sorted(
+            range(len(nodes)), key=lambda i: nodes[i].score or 0.0, reverse=True
+        )
+        for i in ranking:
+            node = nodes[i]
+            tokens = self._count(node.node.get_content(MetadataMode.LLM))
+            stats.tokens_in += tokens
+
+            if tokens <= remaining:
+                packed[i] = node
+                remaining -= tokens
+                stats.tokens_out += tokens
+                continue
+
+            # Keep the beginning of the text (the metadata is always sent)
+            text_tokens = self._count(node.node.get_content(MetadataMode.NONE))
+            available = remaining - (tokens - text_tokens)
+            if available < self.min_node_tokens:
+                continue
+
+            encoding = get_encoding(self.model_name)
+            truncated = node.node.model_copy()
+            truncated.set_content(
+                encoding.decode(
+                    encoding.encode(
+                        node.node.get_content(MetadataMode.NONE),
+                        disallowed_special=(),
+                    )[:available]
+                )
+            )
+            packed[i] = NodeWithScore(node=truncated, score=node.score)
+            used = self._count(truncated.get_content(MetadataMode.LLM))
+            remaining = max(0, remaining - used)
+            stats.tokens_out += used
+            stats.nodes_truncated += 1
+
+        stats.nodes_out = len(packed)
+        with self._lock:
+            self._total.add(stats)
+        report_postprocessor_stats(self.class_name(), stats)
+        return [packed[i] for i in sorted(packed)]
+
+    def stats(self) -> dict:
+        """Get the tokens saved by the packer since it was created."""
+        with self._lock:
+            return {
+                "nodes_in": self._total.nodes_in,
+                "nodes_dropped": self._total.nodes_dropped,
+                "nodes_truncated": self._total.nodes_truncated,
+                "tokens_in": self._total.tokens_in,
+                "tokens_out": self._total.tokens_out,
+                "tokens_saved": self._total.tokens_saved,
+            }
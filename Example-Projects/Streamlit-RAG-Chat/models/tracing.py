@@ -0,0 +1,278 @@
+import json
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar, Token
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any
+
+from llama_index.core import Settings
+from llama_index.core.callbacks import CBEventType
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+from models.streaming import QueryTimings
+
+# Trace of the query or chat turn running in the current thread / asyncio task
+_current_trace: ContextVar["QueryTrace | None"] = ContextVar(
+    "current_trace", default=None
+)
+
+# Stage recorded for each LlamaIndex event type; other events are ignored
+STAGES = {
+    CBEventType.RETRIEVE: "retrieve",
+    CBEventType.EMBEDDING: "embedding",
+    CBEventType.RERANKING: "postprocess",
+    CBEventType.SYNTHESIZE: "synthesize",
+    CBEventType.LLM: "llm",
+}
+
+_handler = None
+_handler_lock = threading.Lock()
+
+
+@dataclass
+class StageStats:
+    """Class to store the cost of one stage of a query."""
+
+    seconds: float = 0.0
+    calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+
+@dataclass
+class QueryTrace:
+    """Class to store the per-stage timings and token counts of one query or chat turn.
+
+    The stages are "retrieve" (including "embedding" of the query and the
+    "vector_store" search), "postprocess", "synthesize" and "llm". LLM calls
+    made by a chat engine before retrieving (question condensation) are
+    recorded as "condense", and the query embedding computed by the response
+    cache before retrieving as "cache_lookup".
+    """
+
+    kind: str
+    query: str
+    settings: dict
+    started_at: str = field(default_factory=lambda: datetime.now().isoformat())
+    stages: dict[str, StageStats] = field(default_factory=dict)
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retrieval_seconds: float = 0.0
+    time_to_first_token: float | None = None
+    total_seconds: float = 0.0
+    cached: bool = False
+    # The exception that ended the query, if it failed
+    error: str | None = None
+
+    def stage(self, name: str) -> StageStats:
+        return self.stages.setdefault(name, StageStats())
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class TraceHandler(BaseCallbackHandler):
+    """LlamaIndex callback handler that adds each event to the active `QueryTrace`.
+
+    Events are attributed through a context variable, so concurrent queries
+    (threads or asyncio tasks) never mix their stages. Events fired while no
+    trace is active, e.g. during ingestion, are ignored.
+    """
+
+    def __init__(self):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self._token_counter = TokenCounter()
+        # event id -> (trace, stage, start)
+        self._open_events: dict[str, tuple[QueryTrace, str, float]] = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: dict[str, Any] | None = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        trace = _current_trace.get()
+        if trace is None or event_type not in STAGES:
+            return event_id
+
+        stage = STAGES[event_type]
+        with self._lock:
+            # A chat engine calls the LLM before retrieving to condense the question
+            if (
+                stage == "llm"
+                and trace.kind == "chat"
+                and "retrieve" not in trace.stages
+            ):
+                stage = "condense"
+            # The response cache embeds the query before retrieval starts
+            if stage == "embedding" and not any(
+                open_trace is trace and open_stage == "retrieve"
+                for open_trace, open_stage, _ in self._open_events.values()
+            ):
+                stage = "cache_lookup"
+            if stage == "retrieve":
+                # Nested retrievers (e.g. the hybrid one) count their time once
+                if any(
+                    open_trace is trace and open_stage == "retrieve"
+                    for open_trace, open_stage, _ in self._open_events.values()
+                ):
+                    return event_id
+                trace.stage("retrieve")
+            self._open_events[event_id] = (trace, stage, time.perf_counter())
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: dict[str, Any] | None = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            event = self._open_events.pop(event_id, None)
+        if event is None:
+            return
+
+        trace, stage_name, start = event
+        stage = trace.stage(stage_name)
+        stage.seconds += time.perf_counter() - start
+        stage.calls += 1
+
+        if event_type == CBEventType.LLM and payload:
+            counts = get_llm_token_counts(self._token_counter, payload, event_id)
+            stage.prompt_tokens += counts.prompt_token_count
+            stage.completion_tokens += counts.completion_token_count
+            trace.llm_calls += 1
+            trace.prompt_tokens += counts.prompt_token_count
+            trace.completion_tokens += counts.completion_token_count
+
+    def start_trace(self, trace_id: str | None = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: str | None = None,
+        trace_map: dict[str, list[str]] | None = None,
+    ) -> None:
+        pass
+
+
+def install_trace_handler() -> TraceHandler:
+    """Add the process-wide `TraceHandler` to the global LlamaIndex callback manager.
+
+    The indexes, retrievers, synthesizers and models of every RAG report their
+    events to `Settings.callback_manager`. The handler is only installed when
+    tracing is enabled, so it costs nothing otherwise.
+    """
+    global _handler
+    with _handler_lock:
+        if _handler is None:
+            _handler = TraceHandler()
+        if _handler not in Settings.callback_manager.handlers:
+            Settings.callback_manager.add_handler(_handler)
+        return _handler
+
+
+class Tracer:
+    """Record a `QueryTrace` for every query and chat turn of a RAG.
+
+    The latest traces are kept in memory and, when `path` is set, appended to
+    a JSONL file for offline analysis.
+
+    Parameters
+    ----------
+    max_traces : int, optional
+        The number of traces kept in memory, by default 200.
+    path : str | None, optional
+        The JSONL file where every trace is appended, by default None.
+    """
+
+    def __init__(self, max_traces: int = 200, path: str | None = None):
+        install_trace_handler()
+        self.traces: deque[QueryTrace] = deque(maxlen=max_traces)
+        self.path = path
+        self._lock = threading.Lock()
+        # id of each open trace -> token to restore the previous current trace
+        self._context_tokens: dict[int, Token] = {}
+
+    def start(self, kind: str, query: str, **settings) -> QueryTrace:
+        """Start the trace of a query or chat turn in the current context.
+
+        Parameters
+        ----------
+        kind : str
+            "query" or "chat".
+        query : str
+            The user query or message.
+        **settings
+            The engine settings of the query, e.g. response mode and `top_k`.
+        """
+        trace = QueryTrace(kind=kind, query=query, settings=settings)
+        token = _current_trace.set(trace)
+        with self._lock:
+            self._context_tokens[id(trace)] = token
+        return trace
+
+    def finish(
+        self,
+        trace: QueryTrace,
+        timings: QueryTimings,
+        error: BaseException | None = None,
+    ) -> None:
+        """Close a trace with the end-to-end timings of its query and store it.
+
+        Parameters
+        ----------
+        trace : QueryTrace
+            The trace returned by `start`.
+        timings : QueryTimings
+            The timings of the query.
+        error : BaseException | None, optional
+            The exception that ended the query, if it failed, by default None.
+        """
+        with self._lock:
+            token = self._context_tokens.pop(id(trace), None)
+        if _current_trace.get() is trace:
+            try:
+                _current_trace.reset(token)
+            except (TypeError, ValueError, RuntimeError):
+                # Finished in another context than the one it started in (e.g.
+                # a stream read by another task)
+                _current_trace.set(None)
+
+        if error is not None:
+            trace.error = f"{type(error).__name__}: {error}"
+        trace.retrieval_seconds = timings.retrieval_seconds
+        trace.time_to_first_token = timings.time_to_first_token
+        trace.total_seconds = timings.total_seconds
+        trace.cached = timings.cached
+
+        # Time of the Chroma search: retrieval minus the query embedding
+        if "retrieve" in trace.stages:
+            trace.stage("vector_store").seconds = max(
+                0.0,
+                trace.stages["retrieve"].seconds
+                - trace.stages.get("embedding", StageStats()).seconds,
+            )
+
+        with self._lock:
+            self.traces.append(trace)
+            if self.path is not None:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(trace.to_dict(), ensure_ascii=False) + "\n")
+
+    def export_jsonl(self) -> str:
+        """Get the traces kept in memory as JSONL."""
+        with self._lock:
+            return "".join(
+                json.dumps(trace.to_dict(), ensure_ascii=False) + "\n"
+                for trace in self.traces
+            )
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import BinaryIO, Iterable, Iterator, TypedDict
+
+# Bytes copied per iteration, so uploads are never held twice in memory
+UPLOAD_BLOCK_SIZE = 1024 * 1024
+
+
+class StoredUpload(TypedDict):
+    """Class to store the result of saving one uploaded file."""
+
+    file_name: str
+    file_hash: str
+    size: int
+    # False when the same content was already ingested under this name
+    changed: bool
+
+
+class UploadStore:
+    """Content-addressed store of the uploaded documents.
+
+    Each upload is streamed to disk in blocks while it is hashed, and kept as
+    `blobs/<sha256>`: identical uploads (even under different names) share one
+    file, and uploading a file again does not write it again. The store also
+    remembers the content last ingested under each file name (`commit`), so
+    only new or changed files have to be ingested.
+
+    Ingestion reads the files through a staging directory of hard links with
+    the original file names, removed as soon as the ingest finishes; the
+    chunks record the path of the blob instead (`blob_paths`). Uploads
+    can be pinned until the job that ingests them is registered, so a garbage
+    collection running meanwhile (e.g. at the end of another job) keeps them.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the store.
+    block_size : int, optional
+        The bytes copied per iteration, by default `UPLOAD_BLOCK_SIZE`.
+    """
+
+    def __init__(self, path: str, block_size: int = UPLOAD_BLOCK_SIZE):
+        self.path = path
+        self.block_size = block_size
+        self.blobs_path = os.path.join(path, "blobs")
+        self.refs_path = os.path.join(path, "refs.json")
+        os.makedirs(self.blobs_path, exist_ok=True)
+
+        self._lock = threading.Lock()
+        # content hash -> number of pins not yet released
+        self._pins: Counter[str] = Counter()
+        # file name -> content hash of the last ingested upload with that name
+        self.refs: dict[str, str] = {}
+        if os.path.exists(self.refs_path):
+            with open(self.refs_path, "r", encoding="utf-8") as f:
+                self.refs = json.load(f)
+
+    def _save_refs(self) -> None:
+        tmp_path = f"{self.refs_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.refs, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.refs_path)
+
+    def blob_path(self, file_hash: str) -> str:
+        """Get the path of the stored content with hash `file_hash`."""
+        return os.path.join(self.blobs_path, file_hash)
+
+    def put(self, file_name: str, file: BinaryIO, pin: bool = False) -> StoredUpload:
+        """Stream an uploaded file into the store.
+
+        Parameters
+        ----------
+        file_name : str
+            The name of the uploaded file.
+        file : BinaryIO
+            The uploaded file, read from its beginning in blocks.
+        pin : bool, optional
+            Whether to keep the content from garbage collection until `unpin`,
+            by default False.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        file.seek(0)
+        with tempfile.NamedTemporaryFile(dir=self.path, delete=False) as tmp:
+            for block in iter(lambda: file.read(self.block_size), b""):
+                digest.update(block)
+                tmp.write(block)
+                size += len(block)
+        file_hash = digest.hexdigest()
+
+        with self._lock:
+            if os.path.exists(self.blob_path(file_hash)):
+                os.remove(tmp.name)
+            else:
+                os.replace(tmp.name, self.blob_path(file_hash))
+            if pin:
+                self._pins[file_hash] += 1
+
+            changed = self.refs.get(file_name) != file_hash
+
+        return StoredUpload(
+            file_name=file_name, file_hash=file_hash, size=size, changed=changed
+        )
+
+    def commit(self, uploads: Iterable[StoredUpload]) -> None:
+        """Remember the content of each upload under its name, once it is ingested.
+
+        Until then the upload stays "changed", so a failed or cancelled ingest
+        is ingested again when the file is uploaded again.
+        """
+        with self._lock:
+            for upload in uploads:
+                self.refs[upload["file_name"]] = upload["file_hash"]
+            self._save_refs()
+
+    def blob_paths(self, uploads: Iterable[StoredUpload]) -> dict[str, str]:
+        """Get the stored path of each upload by file name.
+
+        Unlike the staging directory, the blob of an indexed content is kept, so
+        it is the path recorded in the chunks (`file_path` metadata).
+        """
+        return {
+            upload["file_name"]: self.blob_path(upload["file_hash"])
+            for upload in uploads
+        }
+
+    def unpin(self, file_hashes: Iterable[str]) -> None:
+        """Release one pin of each content hash, pinned by `put`."""
+        with self._lock:
+            self._pins.subtract(file_hashes)
+            self._pins = +self._pins
+
+    def forget(self, file_name: str) -> None:
+        """Stop tracking `file_name`; its content is removed by the next collection."""
+        with self._lock:
+            if self.refs.pop(file_name, None) is not None:
+                self._save_refs()
+
+    @contextmanager
+    def staging(self, uploads: list[StoredUpload]) -> Iterator[str]:
+        """Expose stored uploads under their file names in a temporary directory.
+
+        Parameters
+        ----------
+        uploads : list[StoredUpload]
+            The uploads to expose, e.g. only the new or changed ones.
+
+        Yields
+        ------
+        str
+            The path of the directory, deleted on exit.
+        """
+        staging_dir = tempfile.mkdtemp(dir=self.path, prefix="staging-")
+        try:
+            for upload in uploads:
+                target = os.path.join(staging_dir, upload["file_name"])
+                try:
+                    os.link(self.blob_path(upload["file_hash"]), target)
+                except OSError:
+                    # File systems without hard links
+                    shutil.copyfile(self.blob_path(upload["file_hash"]), target)
+            yield staging_dir
+        finally:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+
+    def collect_garbage(self, referenced_hashes: set[str]) -> int:
+        """Delete the stored contents that are no longer referenced.
+
+        File names whose content is not referenced are forgotten too, so they
+        are ingested again if they are uploaded again. Pinned contents are kept.
+
+        Parameters
+        ----------
+        referenced_hashes : set[str]
+            The content hashes still in use, e.g. those of the knowledge base.
+
+        Returns
+        -------
+        int
+            The number of bytes freed.
+        """
+        freed = 0
+        with self._lock:
+            referenced_hashes = referenced_hashes | set(self._pins)
+            stale_names = [
+                name
+                for name, file_hash in self.refs.items()
+                if file_hash not in referenced_hashes
+            ]
+            for name in stale_names:
+                del self.refs[name]
+            if stale_names:
+                self._save_refs()
+
+            for file_hash in os.listdir(self.blobs_path):
+                if file_hash not in referenced_hashes:
+                    path = self.blob_path(file_hash)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+        return freed
@@ -0,0 +1,15 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+# The tests import `models` like the app and the benchmarks do
+sys.path.append(str(Path(__file__).parents[1]))
+
+import models.concurrency  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def fresh_provider_limiters(monkeypatch):
+    # The limiters are shared by the process; each test sets its own
+    monkeypatch.setattr(models.concurrency, "_provider_limiters", {})
@@ -0,0 +1,30 @@
+from models.RAG import RAG
+from models.stubs import StubEmbedding, StubLLM
+
+
+def test_chat_history_survives_an_ingest(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "alma.txt").write_text("El alma y la razón gobiernan la vida. " * 20)
+    rag = RAG(
+        "sys",
+        embed_model=StubEmbedding(),
+        llm=StubLLM(),
+        vector_store_config={"BACKEND": "mmap"},
+    )
+    vector_store_path = str(tmp_path / "vector_store")
+    rag.create_or_update_rag_index(vector_store_path, "col", str(data_dir))
+
+    engine = rag.build_chat_engine("context", 2, session_id="s1")
+    engine.chat("¿Qué gobierna la vida?")
+
+    # Another session uploads a file: the engines are rebuilt, not the memory
+    (data_dir / "virtud.txt").write_text("La virtud es el hábito de obrar bien. " * 20)
+    rag.create_or_update_rag_index(vector_store_path, "col", str(data_dir))
+    new_engine = rag.build_chat_engine("context", 2, session_id="s1")
+
+    assert new_engine is not engine
+    assert [message.content for message in new_engine.chat_history][0] == (
+        "¿Qué gobierna la vida?"
+    )
+    assert len(rag.build_chat_engine("context", 2, session_id="s2").chat_history) == 0
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from models.concurrency import (
+    ProviderBusyError,
+    ProviderLimiter,
+    get_provider_limiter,
+)
+from models.RAG import RAG
+from models.stubs import StubEmbedding, StubLLM
+
+
+async def limited_call(limiter: ProviderLimiter, peak: list[int], seconds: float):
+    async with limiter:
+        peak[0] = max(peak[0], limiter.running)
+        await asyncio.sleep(seconds)
+
+
+def test_max_concurrency_async():
+    limiter = ProviderLimiter(max_concurrency=3)
+    peak = [0]
+
+    async def main():
+        await asyncio.gather(*[limited_call(limiter, peak, 0.05) for _ in range(10)])
+
+    start = time.perf_counter()
+    asyncio.run(main())
+
+    assert peak[0] == 3
+    # 10 calls, 3 at a time: 4 rounds
+    assert time.perf_counter() - start >= 0.2
+    assert limiter.running == 0 and limiter.pending == 0
+
+
+def test_max_concurrency_threads():
+    limiter = ProviderLimiter(max_concurrency=2)
+    peak = [0]
+    lock = threading.Lock()
+
+    def call():
+        with limiter:
+            with lock:
+                peak[0] = max(peak[0], limiter.running)
+            time.sleep(0.05)
+
+    threads = [threading.Thread(target=call) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] == 2
+    assert limiter.running == 0 and limiter.pending == 0
+
+
+def test_max_pending_rejects_extra_calls():
+    limiter = ProviderLimiter(max_concurrency=1, max_pending=2)
+
+    async def main():
+        return await asyncio.gather(
+            *[limited_call(limiter, [0], 0.05) for _ in range(5)],
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    # One call runs, two wait, the other two fail fast
+    assert sum(isinstance(result, ProviderBusyError) for result in results) == 2
+    assert limiter.rejected == 2
+
+
+def test_max_pending_rejects_extra_calls_threads():
+    limiter = ProviderLimiter(max_concurrency=1, max_pending=1)
+    release = threading.Event()
+    errors = []
+
+    def call():
+        try:
+            with limiter:
+                release.wait()
+        except ProviderBusyError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.02)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 2
+    assert limiter.rejected == 2
+
+
+def test_requests_per_minute_spaces_calls():
+    # 600 requests per minute: one every 0.1 seconds
+    limiter = ProviderLimiter(max_concurrency=8, requests_per_minute=600)
+    started = []
+
+    async def call():
+        async with limiter:
+            started.append(time.monotonic())
+
+    async def main():
+        await asyncio.gather(*[call() for _ in range(4)])
+
+    asyncio.run(main())
+
+    gaps = [b - a for a, b in zip(sorted(started), sorted(started)[1:])]
+    assert all(gap >= 0.09 for gap in gaps)
+
+
+def test_provider_limiter_is_shared_and_warns_on_other_settings():
+    limiter = get_provider_limiter("test-provider", max_concurrency=2)
+
+    assert get_provider_limiter("test-provider", max_concurrency=2) is limiter
+    with pytest.warns(UserWarning, match="test-provider"):
+        assert get_provider_limiter("test-provider", max_concurrency=5) is limiter
+    assert limiter.max_concurrency == 2
+
+
+def test_concurrent_aquery_with_stub_llm(tmp_path):
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    for i in range(3):
+        (data_dir / f"doc{i}.txt").write_text(
+            f"Documento {i}. El alma y la razón gobiernan la vida. " * 20
+        )
+    llm = StubLLM(delay=0.2)
+    rag = RAG(
+        "sys",
+        embed_model=StubEmbedding(),
+        llm=llm,
+        concurrency_config={"StubLLM": {"MAX_CONCURRENCY": 4, "MAX_PENDING": 8}},
+        # The local vector store, so the test does not depend on the ChromaDB version
+        vector_store_config={"BACKEND": "mmap"},
+    )
+    rag.create_or_update_rag_index(str(tmp_path / "vector_store"), "col", str(data_dir))
+    peak = [0]
+
+    async def monitor():
+        while True:
+            peak[0] = max(peak[0], rag.limiter.running)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        sampler = asyncio.create_task(monitor())
+        try:
+            return await asyncio.gather(
+                *[
+                    rag.aquery(f"pregunta {i} sobre el alma", "compact", 2)
+                    for i in range(8)
+                ]
+            )
+        finally:
+            sampler.cancel()
+
+    start = time.perf_counter()
+    responses = asyncio.run(main())
+    seconds = time.perf_counter() - start
+
+    assert all(str(response) == llm.answer for response in responses)
+    assert all(response.source_nodes for response in responses)
+    # 8 queries of 0.2 seconds, 4 at a time: about 0.4 seconds, not 1.6
+    assert seconds < 1.2
+    assert peak[0] == 4
+    assert rag.limiter.running == 0
+    assert len(rag.query_timings) == 8
@@ -0,0 +1,69 @@
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.vector_stores import SimpleVectorStore
+
+from models.embedding_cache import EmbeddingCache
+from models.ingestion import ParallelIngestionPipeline
+from models.stubs import StubEmbedding
+
+
+class RecordingEmbedding(StubEmbedding):
+    """Stub embedding model that records the batches it embeds."""
+
+    batches: list[list[str]] = []
+
+    def _get_text_embeddings(self, texts: list[str]) -> list[list[float]]:
+        self.batches.append(list(texts))
+        return super()._get_text_embeddings(texts)
+
+
+def ingest(cache: EmbeddingCache, file_path: str) -> None:
+    pipeline = ParallelIngestionPipeline(
+        embed_model=StubEmbedding(),
+        vector_store=SimpleVectorStore(),
+        transformations=[SentenceSplitter(chunk_size=64, chunk_overlap=0)],
+        parse_workers=1,
+        embedding_cache=cache,
+    )
+    pipeline.run({file_path: "hash"})
+
+
+def test_same_content_from_another_directory_is_a_hit(tmp_path):
+    text = "El alma y la razón gobiernan la vida. " * 20
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    for staging in ["staging-a", "staging-b"]:
+        (tmp_path / staging).mkdir()
+        (tmp_path / staging / "doc.txt").write_text(text)
+
+    ingest(cache, str(tmp_path / "staging-a" / "doc.txt"))
+    misses = cache.misses
+    ingest(cache, str(tmp_path / "staging-b" / "doc.txt"))
+
+    assert misses > 0
+    assert cache.misses == misses
+    assert cache.hits == misses
+
+
+def test_repeated_texts_are_embedded_and_stored_once(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"))
+    embed_model = RecordingEmbedding()
+
+    embeddings, hits = cache.embed(embed_model, ["a", "b", "a"])
+
+    assert embed_model.batches == [["a", "b"]]
+    assert embeddings[0] == embeddings[2]
+    assert hits == 0
+    assert cache._rows == 2
+
+
+def test_row_count_ignores_stored_vectors_and_evicts_the_oldest(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    cache = EmbeddingCache(path, max_entries=4)
+    cache.put_many("m", ["a", "b", "c"], [[0.1]] * 3)
+    # Storing the same vectors again adds no rows
+    cache.put_many("m", ["a", "b", "c"], [[0.1]] * 3)
+    assert cache._rows == 3
+
+    cache.put_many("m", ["d", "e"], [[0.2]] * 2)
+    assert cache._rows == 4
+    assert cache.get_many("m", ["e"]) != [None]
+    assert EmbeddingCache(path, max_entries=4)._rows == 4
@@ -0,0 +1,179 @@
+import numpy as np
+import pytest
+from llama_index.core.schema import NodeRelationship, RelatedNodeInfo, TextNode
+from llama_index.core.vector_stores.types import (
+    FilterCondition,
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+)
+
+from models.mmap_store import MmapVectorStore
+
+DIM = 8
+
+
+def make_nodes(n: int, file_hash: str = "hash-a", seed: int = 0) -> list[TextNode]:
+    rng = np.random.default_rng(seed)
+    return [
+        TextNode(
+            id_=f"{file_hash}-{i}",
+            text=f"Fragmento {i} de {file_hash}",
+            embedding=rng.normal(size=DIM).tolist(),
+            metadata={
+                "file_hash": file_hash,
+                "file_name": f"{file_hash}.txt",
+                "page": i,
+            },
+            relationships={
+                NodeRelationship.SOURCE: RelatedNodeInfo(node_id=f"doc-{file_hash}")
+            },
+        )
+        for i in range(n)
+    ]
+
+
+def query_ids(store: MmapVectorStore, node: TextNode, top_k: int = 1, **kwargs):
+    result = store.query(
+        VectorStoreQuery(
+            query_embedding=node.embedding, similarity_top_k=top_k, **kwargs
+        )
+    )
+    return result.ids
+
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_add_query_and_reopen(tmp_path, dtype):
+    nodes = make_nodes(20)
+    store = MmapVectorStore(str(tmp_path / "store"), dtype=dtype)
+    store.add(nodes)
+
+    for node in nodes:
+        assert query_ids(store, node) == [node.node_id]
+    result = store.query(
+        VectorStoreQuery(query_embedding=nodes[3].embedding, similarity_top_k=5)
+    )
+    assert result.similarities[0] == pytest.approx(1, abs=0.01)
+    assert result.similarities == sorted(result.similarities, reverse=True)
+    assert result.nodes[0].text == nodes[3].text
+    assert result.nodes[0].metadata["page"] == 3
+    store.close()
+
+    reopened = MmapVectorStore(str(tmp_path / "store"), dtype=dtype)
+    assert reopened.count() == 20
+    assert query_ids(reopened, nodes[7]) == [nodes[7].node_id]
+    embedding = reopened.get_embeddings([nodes[7].node_id])[nodes[7].node_id]
+    expected = np.asarray(nodes[7].embedding) / np.linalg.norm(nodes[7].embedding)
+    assert np.allclose(embedding, expected, atol=0.02)
+
+
+def test_reopening_with_another_dtype_warns_and_keeps_the_stored_one(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"), dtype="int8")
+    store.add(make_nodes(3))
+    store.close()
+
+    with pytest.warns(UserWarning, match="int8 instead of float16"):
+        reopened = MmapVectorStore(str(tmp_path / "store"), dtype="float16")
+    assert reopened.dtype == "int8"
+    assert reopened.count() == 3
+
+
+def test_add_replaces_nodes_with_the_same_id(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"))
+    nodes = make_nodes(5)
+    store.add(nodes)
+    replacement = make_nodes(1, seed=1)[0]
+    store.add([replacement])
+
+    assert store.count() == 5
+    assert query_ids(store, replacement) == [replacement.node_id]
+    assert store.get_nodes([replacement.node_id])[0].text == replacement.text
+
+
+def test_delete_and_compact(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"))
+    kept = make_nodes(10, "hash-a")
+    deleted = make_nodes(10, "hash-b", seed=1)
+    store.add(kept + deleted)
+
+    store.delete("doc-hash-b")
+    store.delete_nodes([kept[0].node_id])
+
+    assert store.count() == 9
+    assert deleted[0].node_id not in query_ids(store, deleted[0], top_k=20)
+    assert kept[0].node_id not in query_ids(store, kept[0], top_k=20)
+
+    store.compact()
+
+    assert store._rows == 9
+    for node in kept[1:]:
+        assert query_ids(store, node) == [node.node_id]
+    assert [node.node_id for page in store.iter_nodes() for node in page] == [
+        node.node_id for node in kept[1:]
+    ]
+    store.close()
+
+    reopened = MmapVectorStore(str(tmp_path / "store"))
+    assert reopened.count() == 9
+    assert query_ids(reopened, kept[5]) == [kept[5].node_id]
+
+
+def test_metadata_filters(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"))
+    nodes_a = make_nodes(5, "hash-a")
+    nodes_b = make_nodes(5, "hash-b", seed=1)
+    store.add(nodes_a + nodes_b)
+
+    only_b = MetadataFilters(filters=[MetadataFilter(key="file_hash", value="hash-b")])
+    ids = query_ids(store, nodes_a[0], top_k=10, filters=only_b)
+    assert sorted(ids) == sorted(node.node_id for node in nodes_b)
+
+    # "page" is not a column of the side table: it is read from the JSON metadata
+    pages = MetadataFilters(
+        filters=[
+            MetadataFilter(key="file_name", value="hash-a.txt"),
+            MetadataFilter(key="page", value=[1, 3], operator=FilterOperator.IN),
+        ]
+    )
+    assert sorted(node.node_id for node in store.get_nodes(filters=pages)) == [
+        nodes_a[1].node_id,
+        nodes_a[3].node_id,
+    ]
+
+    either = MetadataFilters(
+        filters=[
+            MetadataFilter(key="page", value=4, operator=FilterOperator.GTE),
+            MetadataFilter(key="page", value=0),
+        ],
+        condition=FilterCondition.OR,
+    )
+    assert len(store.get_nodes(filters=either)) == 4
+
+    store.delete_nodes(filters=only_b)
+    assert store.count() == 5
+    assert store.get_nodes(filters=only_b) == []
+
+
+def test_ivf_search_finds_the_exact_neighbours(tmp_path):
+    nodes = make_nodes(200)
+    store = MmapVectorStore(
+        str(tmp_path / "store"), ivf_lists=4, nprobe=4, ivf_min_rows=100
+    )
+    store.add(nodes)
+
+    assert store._centroids is not None
+    for node in nodes[:20]:
+        assert query_ids(store, node) == [node.node_id]
+
+
+def test_clear_empties_the_store(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "store"))
+    nodes = make_nodes(5)
+    store.add(nodes)
+    store.clear()
+
+    assert store.count() == 0
+    assert query_ids(store, nodes[0]) == []
+    store.add(nodes[:2])
+    assert query_ids(store, nodes[1]) == [nodes[1].node_id]
@@ -0,0 +1,46 @@
+from llama_index.core.postprocessor import SimilarityPostprocessor
+
+from models.RAG import RAG
+from models.stubs import StubEmbedding, StubLLM
+
+
+def make_rag(tmp_path) -> RAG:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "alma.txt").write_text("El alma y la razón gobiernan la vida. " * 20)
+    rag = RAG(
+        "sys",
+        embed_model=StubEmbedding(),
+        llm=StubLLM(),
+        vector_store_config={"BACKEND": "mmap"},
+        response_cache_config={"MAX_ENTRIES": 16},
+    )
+    rag.create_or_update_rag_index(str(tmp_path / "vector_store"), "col", str(data_dir))
+    return rag
+
+
+def test_repeated_query_is_answered_from_the_cache(tmp_path):
+    rag = make_rag(tmp_path)
+    engine = rag.build_query_engine("compact", 2)
+
+    engine.query("¿Qué gobierna la vida?")
+    engine.query("¿qué gobierna  la vida?")
+
+    assert rag.response_cache.exact_hits == 1
+    assert rag.model.calls == 1
+
+
+def test_engines_with_other_postprocessors_do_not_share_answers(tmp_path):
+    rag = make_rag(tmp_path)
+    plain = rag.build_query_engine("compact", 2)
+    filtered = rag.build_query_engine(
+        "compact",
+        2,
+        node_postprocessors=[SimilarityPostprocessor(similarity_cutoff=0.99)],
+    )
+
+    plain.query("¿Qué gobierna la vida?")
+    filtered.query("¿Qué gobierna la vida?")
+
+    assert rag.response_cache.exact_hits == 0
+    assert rag.response_cache.misses == 2
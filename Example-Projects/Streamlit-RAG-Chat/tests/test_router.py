@@ -0,0 +1,314 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import models.router as router_module
+from models.concurrency import ProviderLimiter
+from models.router import Route, RouterLLM, RouteTimeoutError
+from models.stubs import StubLLM, StubLLMError
+
+
+def make_router(delays: list[float], **kwargs) -> RouterLLM:
+    """Build a router over stub providers "A", "B", ... with the given delays."""
+    routes = [
+        Route(
+            name,
+            StubLLM(model_name=name, answer=f"soy {name}", delay=delay),
+            ProviderLimiter(max_concurrency=4),
+        )
+        for name, delay in zip("ABC", delays)
+    ]
+    settings = {
+        "initial_hedge_delay": 0.1,
+        "min_hedge_delay": 0.01,
+        "timeout": 2.0,
+        "min_samples": 3,
+        "cooldown_seconds": 0.5,
+        **kwargs,
+    }
+    return RouterLLM(routes=routes, **settings)
+
+
+def route_stats(router: RouterLLM, name: str) -> dict:
+    return next(stats for stats in router.stats() if stats["name"] == name)
+
+
+def timed(call):
+    start = time.perf_counter()
+    result = call()
+    return result, time.perf_counter() - start
+
+
+def test_fast_primary_answers_without_hedging():
+    router = make_router([0.01, 0.01])
+
+    assert router.complete("x").text == "soy A"
+    assert route_stats(router, "A")["wins"] == 1
+    assert route_stats(router, "B")["hedges"] == 0
+    assert router.routes[1].llm.calls == 0
+
+
+def test_slow_request_is_hedged_to_next_route():
+    router = make_router([1.0, 0.02])
+
+    response, seconds = timed(lambda: router.complete("x"))
+
+    assert response.text == "soy B"
+    assert seconds < 0.6
+    assert route_stats(router, "B")["hedges"] == 1
+    assert route_stats(router, "B")["wins"] == 1
+
+
+def test_slowest_route_loses_its_turn():
+    router = make_router([0.01, 0.05])
+    for _ in range(3):
+        router.complete("x")
+
+    router.routes[0].llm.delay = 0.3
+    answers = [router.complete("x").text for _ in range(6)]
+
+    # The latest calls of A are slower than B, so B goes first
+    assert answers[-1] == "soy B"
+
+
+def test_failing_route_falls_back_at_once():
+    router = make_router([0.01, 0.01], hedge=False)
+    router.routes[0].llm.error_rate = 1.0
+
+    response, seconds = timed(lambda: router.complete("x"))
+
+    assert response.text == "soy B"
+    assert seconds < 0.3
+    assert route_stats(router, "A")["error_rate"] == 1.0
+
+
+def test_all_routes_failing_raise_the_last_error():
+    router = make_router([0.01, 0.01])
+    for route in router.routes:
+        route.llm.error_rate = 1.0
+
+    with pytest.raises(StubLLMError):
+        router.complete("x")
+
+
+def test_timed_out_route_falls_back():
+    router = make_router([1.0, 0.01], hedge=False, timeout=0.2)
+
+    response, seconds = timed(lambda: router.complete("x"))
+
+    assert response.text == "soy B"
+    assert 0.2 <= seconds < 0.6
+    assert route_stats(router, "A")["error_rate"] == 1.0
+
+
+def test_every_route_timing_out_raises_route_timeout():
+    router = make_router([1.0, 1.0], hedge=False, timeout=0.1)
+
+    with pytest.raises(RouteTimeoutError):
+        router.complete("x")
+
+
+def test_queued_calls_are_cancelled(monkeypatch):
+    # The only route thread is busy, so the calls stay queued until they time out
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(router_module, "_route_executor", executor)
+    busy = threading.Event()
+    executor.submit(busy.wait)
+    router = make_router([0.01, 0.01], hedge=False, timeout=0.1)
+
+    with pytest.raises(RouteTimeoutError):
+        router.complete("x")
+    busy.set()
+    executor.shutdown(wait=True)
+
+    # Neither provider was called
+    assert [route.llm.calls for route in router.routes] == [0, 0]
+    assert route_stats(router, "A")["calls"] == 0
+
+
+def test_route_with_too_many_errors_cools_down():
+    router = make_router([0.01, 0.01], hedge=False, max_error_rate=0.5)
+    primary = router.routes[0].llm
+    primary.error_rate = 1.0
+    for _ in range(3):
+        assert router.complete("x").text == "soy B"
+    assert not route_stats(router, "A")["healthy"]
+
+    calls = primary.calls
+    assert router.complete("x").text == "soy B"
+    # A is left out while it cools down
+    assert primary.calls == calls
+
+    primary.error_rate = 0.0
+    time.sleep(0.6)
+    assert route_stats(router, "A")["healthy"]
+    assert router.complete("x").text == "soy A"
+
+
+def test_stream_holds_the_limiter_slot_until_exhausted():
+    router = make_router([0.5, 0.02])
+    primary, secondary = router.routes
+    secondary.llm.token_delay = 0.02
+
+    stream = router.stream_complete("x")
+    first = next(stream)
+    assert first.delta == "soy "
+    assert secondary.limiter.running == 1
+
+    # The losing stream of A is closed as soon as it opens
+    time.sleep(0.6)
+    assert primary.limiter.running == 0
+    assert secondary.limiter.running == 1
+
+    assert "".join(chunk.delta for chunk in stream) == "B "
+    assert secondary.limiter.running == 0
+
+
+def test_stalled_stream_times_out():
+    router = make_router([0.01], timeout=0.2)
+    route = router.routes[0]
+
+    stream = router.stream_complete("x")
+    next(stream)
+    route.llm.token_delay = 0.5
+    with pytest.raises(RouteTimeoutError):
+        list(stream)
+
+    # The slot is freed once the stalled token arrives
+    time.sleep(0.5)
+    assert route.limiter.running == 0
+
+
+def test_async_hedge_cancels_the_loser():
+    router = make_router([1.0, 0.02])
+
+    async def main():
+        response = await router.acomplete("x")
+        await asyncio.sleep(0.05)
+        return response
+
+    response, seconds = timed(lambda: asyncio.run(main()))
+
+    assert response.text == "soy B"
+    assert seconds < 0.6
+    # The call of A was cancelled before it answered
+    assert router.routes[0].llm.calls == 0
+    assert router.routes[0].limiter.running == 0
+
+
+def test_async_failing_route_falls_back():
+    router = make_router([0.01, 0.01], hedge=False)
+    router.routes[0].llm.error_rate = 1.0
+
+    response = asyncio.run(router.acomplete("x"))
+
+    assert response.text == "soy B"
+    assert route_stats(router, "A")["error_rate"] == 1.0
+
+
+def test_async_timed_out_route_falls_back():
+    router = make_router([1.0, 0.01], hedge=False, timeout=0.2)
+
+    response, seconds = timed(lambda: asyncio.run(router.acomplete("x")))
+
+    assert response.text == "soy B"
+    assert seconds < 0.6
+
+
+def test_async_route_with_too_many_errors_cools_down():
+    router = make_router([0.01, 0.01], hedge=False, max_error_rate=0.5)
+    primary = router.routes[0].llm
+    primary.error_rate = 1.0
+
+    async def main():
+        return [(await router.acomplete("x")).text for _ in range(4)]
+
+    assert asyncio.run(main()) == ["soy B"] * 4
+    # Three errors open the circuit: the fourth call skips A
+    assert primary.calls == 3
+
+
+def test_async_stream_holds_the_limiter_slot_until_exhausted():
+    router = make_router([0.01])
+    route = router.routes[0]
+
+    async def main():
+        stream = await router.astream_complete("x")
+        await stream.__anext__()
+        running = route.limiter.running
+        rest = [chunk.delta async for chunk in stream]
+        return running, rest
+
+    running, rest = asyncio.run(main())
+
+    assert running == 1
+    assert rest == ["A "]
+    assert route.limiter.running == 0
+
+
+def test_waiting_for_a_local_slot_is_not_a_provider_error():
+    router = make_router([0.01, 0.01], hedge=False, timeout=0.2)
+    primary = router.routes[0]
+    primary.limiter = ProviderLimiter(max_concurrency=1)
+
+    with primary.limiter:
+        response, seconds = timed(lambda: router.complete("x"))
+    time.sleep(0.05)
+
+    assert response.text == "soy B"
+    assert seconds < 0.4
+    # The provider of A was never called, and the wait is not counted against it
+    assert primary.llm.calls == 0
+    assert route_stats(router, "A")["calls"] == 0
+    assert route_stats(router, "A")["healthy"]
+
+
+def test_latency_is_measured_from_the_limiter_slot():
+    router = make_router([0.01], timeout=0.5)
+    route = router.routes[0]
+    route.limiter = ProviderLimiter(max_concurrency=1)
+
+    route.limiter.__enter__()
+    threading.Timer(0.3, route.limiter.__exit__, args=(None, None, None)).start()
+    assert router.complete("x").text == "soy A"
+
+    assert route_stats(router, "A")["p50_seconds"] < 0.1
+
+
+def test_failure_falls_back_at_once_while_a_hedge_runs():
+    router = make_router([1.0, 0.01, 0.01], initial_hedge_delay=0.3)
+    router.routes[1].llm.error_rate = 1.0
+
+    response, seconds = timed(lambda: router.complete("x"))
+
+    # B is hedged at 0.3s and fails: C starts then, not at the next hedge time
+    assert response.text == "soy C"
+    assert seconds < 0.5
+
+
+def test_async_waiting_for_a_local_slot_is_not_a_provider_error():
+    router = make_router([0.01, 0.01], hedge=False, timeout=0.2)
+    primary = router.routes[0]
+    primary.limiter = ProviderLimiter(max_concurrency=1)
+
+    async def main():
+        async with primary.limiter:
+            return await router.acomplete("x")
+
+    assert asyncio.run(main()).text == "soy B"
+    assert primary.llm.calls == 0
+    assert route_stats(router, "A")["calls"] == 0
+    assert primary.limiter.running == 0
+
+
+def test_async_failure_falls_back_at_once_while_a_hedge_runs():
+    router = make_router([1.0, 0.01, 0.01], initial_hedge_delay=0.3)
+    router.routes[1].llm.error_rate = 1.0
+
+    response, seconds = timed(lambda: asyncio.run(router.acomplete("x")))
+
+    assert response.text == "soy C"
+    assert seconds < 0.5
@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+
+from models.RAG import RAG
+from models.stubs import StubEmbedding, StubLLM, StubLLMError
+from models.tracing import _current_trace
+
+
+@pytest.fixture
+def rag(tmp_path) -> RAG:
+    data_dir = tmp_path / "data"
+    data_dir.mkdir()
+    (data_dir / "alma.txt").write_text("El alma y la razón gobiernan la vida. " * 20)
+    rag = RAG(
+        "sys",
+        embed_model=StubEmbedding(),
+        llm=StubLLM(),
+        vector_store_config={"BACKEND": "mmap"},
+        tracing_config={"ENABLED": True},
+    )
+    rag.create_or_update_rag_index(str(tmp_path / "vector_store"), "col", str(data_dir))
+    return rag
+
+
+def test_streamed_query_is_traced(rag):
+    stream = rag.stream_query("¿Qué gobierna la vida?", "compact", 2)
+    answer = "".join(stream.response_gen)
+
+    trace = rag.tracer.traces[-1]
+    assert answer.strip() == rag.model.answer
+    assert trace.error is None
+    assert "retrieve" in trace.stages and "llm" in trace.stages
+    assert _current_trace.get() is None
+
+
+def test_failed_query_is_traced_and_cleared(rag):
+    rag.model.error_rate = 1.0
+
+    with pytest.raises(StubLLMError):
+        asyncio.run(rag.aquery("¿Qué gobierna la vida?", "compact", 2))
+
+    trace = rag.tracer.traces[-1]
+    assert trace.error.startswith("StubLLMError")
+    assert "retrieve" in trace.stages
+    assert trace.total_seconds > 0
+
+
+def test_failed_stream_is_traced_and_cleared(rag):
+    rag.model.error_rate = 1.0
+
+    stream = rag.stream_query("¿Qué gobierna la vida?", "compact", 2)
+    with pytest.raises(StubLLMError):
+        list(stream.response_gen)
+
+    assert rag.tracer.traces[-1].error.startswith("StubLLMError")
+    assert _current_trace.get() is None
+
+
+def test_failed_retrieval_is_traced_and_cleared(rag):
+    with pytest.raises(ValueError):
+        rag.stream_query("¿Qué gobierna la vida?", "compact", 2, retriever_mode="x")
+
+    assert rag.tracer.traces[-1].error.startswith("ValueError")
+    assert _current_trace.get() is None
@@ -0,0 +1,50 @@
+import asyncio
+import io
+import os
+
+from models.RAG import RAG
+from models.stubs import StubEmbedding, StubLLM
+from models.upload_store import UploadStore
+
+
+def test_upload_stays_changed_until_committed(tmp_path):
+    store = UploadStore(str(tmp_path / "uploads"))
+
+    upload = store.put("doc.txt", io.BytesIO(b"contenido"))
+    assert upload["changed"]
+    # The ingest failed or was cancelled: uploading the file again retries it
+    assert store.put("doc.txt", io.BytesIO(b"contenido"))["changed"]
+
+    store.commit([upload])
+    assert not store.put("doc.txt", io.BytesIO(b"contenido"))["changed"]
+    assert UploadStore(str(tmp_path / "uploads")).refs == {
+        "doc.txt": upload["file_hash"]
+    }
+
+
+def test_chunks_record_the_blob_path_instead_of_the_staging_path(tmp_path):
+    store = UploadStore(str(tmp_path / "uploads"))
+    upload = store.put(
+        "alma.txt", io.BytesIO("El alma y la razón gobiernan la vida. ".encode() * 20)
+    )
+    rag = RAG(
+        "sys",
+        embed_model=StubEmbedding(),
+        llm=StubLLM(),
+        vector_store_config={"BACKEND": "mmap"},
+    )
+    with store.staging([upload]) as data_dir:
+        rag.create_or_update_rag_index(
+            str(tmp_path / "vector_store"),
+            "col",
+            data_dir,
+            source_paths=store.blob_paths([upload]),
+        )
+
+    response = asyncio.run(rag.aquery("el alma", "compact", 2))
+
+    assert response.source_nodes
+    for node in response.source_nodes:
+        assert node.metadata["file_name"] == "alma.txt"
+        assert node.metadata["file_path"] == store.blob_path(upload["file_hash"])
+        assert os.path.exists(node.metadata["file_path"])
@@ -0,0 +1,348 @@
+"""Local intent router for the agno "route" team (agno-route-multi-agent.ipynb).
+
+Messages are embedded and matched to the centroid of the example messages of
+each route (member agent). Confident matches are routed locally in well under
+a millisecond; the others go to the LLM router (the team leader), whose
+decisions are logged and learned, so the share of messages routed locally
+grows with use.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Protocol, TypedDict
+
+import numpy as np
+
+
+class Embedder(Protocol):
+    """Interface of the embedders of agno (`agno.embedder`)."""
+
+    def get_embedding(self, text: str) -> list[float]: ...
+
+
+class HashingEmbedder:
+    """Local embedder of word and character n-grams, with the hashing trick.
+
+    It needs no model and embeds a message in microseconds. Any agno embedder
+    (e.g. `SentenceTransformerEmbedder`) can replace it for better accuracy.
+
+    Parameters
+    ----------
+    dimensions : int, optional
+        The size of the vectors, by default 2048.
+    ngram_range : tuple[int, int], optional
+        The lengths of the character n-grams of each word, by default (3, 5).
+    """
+
+    def __init__(self, dimensions: int = 2048, ngram_range: tuple[int, int] = (3, 5)):
+        self.dimensions = dimensions
+        self.ngram_range = ngram_range
+
+    def _features(self, text: str) -> list[str]:
+        words = re.findall(r"\w+", text.lower())
+        features = list(words)
+        for word in words:
+            padded = f"<{word}>"
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                features += [padded[i : i + n] for i in range(len(padded) - n + 1)]
+        return features
+
+    def get_embedding(self, text: str) -> list[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for feature in self._features(text):
+            digest = zlib.crc32(feature.encode("utf-8"))
+            vector[digest % self.dimensions] += 1.0 if digest & 1 << 31 else -1.0
+        return vector.tolist()
+
+
+class RoutingDecision(TypedDict):
+    """Class to store the routing decision of one message, as logged."""
+
+    message: str
+    # The route taken, or None when the local router is not confident enough
+    route: str | None
+    # "local", "llm" (decided by the LLM router) or "feedback" (a correction)
+    source: str
+    # The nearest route of the local router and its cosine similarity, and the
+    # margin over the second nearest
+    local_route: str | None
+    score: float
+    margin: float
+    seconds: float
+    timestamp: float
+
+
+@dataclass
+class RouterStats:
+    """Class to store the counters of the local router."""
+
+    local: int = 0
+    llm: int = 0
+    local_seconds: float = 0.0
+    llm_seconds: float = 0.0
+    # LLM decisions also predicted by the local router, and those it got right
+    shadowed: int = 0
+    agreed: int = 0
+
+    @property
+    def accuracy(self) -> float | None:
+        """Agreement of the local router with the LLM router, when it deferred."""
+        return self.agreed / self.shadowed if self.shadowed else None
+
+    @property
+    def saved_seconds(self) -> float:
+        """Time saved routing locally instead of with the LLM (average LLM time)."""
+        if not self.llm:
+            return 0.0
+        return self.local * self.llm_seconds / self.llm - self.local_seconds
+
+    def summary(self) -> str:
+        """Get a one-line human readable report."""
+        total = self.local + self.llm
+        accuracy = f"{self.accuracy:.0%}" if self.accuracy is not None else "N/A"
+        local_ms = 1000 * self.local_seconds / self.local if self.local else 0.0
+        llm_ms = 1000 * self.llm_seconds / self.llm if self.llm else 0.0
+        return (
+            f"{self.local}/{total} messages routed locally ({local_ms:.2f} ms each), "
+            f"{self.llm} by the LLM ({llm_ms:.0f} ms each), accuracy {accuracy} "
+            f"on {self.shadowed} LLM decisions, ~{self.saved_seconds:.1f}s saved"
+        )
+
+
+class IntentRouter:
+    """Nearest-centroid router of user messages to the members of a team.
+
+    The centroid of a route is the normalized mean of the embeddings of its
+    example messages. A message goes to the route of the nearest centroid
+    (cosine similarity) when the similarity is at least `min_score` and beats
+    the second nearest by at least `margin`; otherwise the route is left to
+    the LLM router, and its decision is added to the examples with `record`.
+    Every decision is appended to a JSONL log, which `load_log` learns from
+    in a later session.
+
+    Parameters
+    ----------
+    routes : list[str]
+        The route names, e.g. the names of the member agents.
+    embedder : Embedder | None, optional
+        The embedder of the messages, by default a local `HashingEmbedder`.
+    min_score : float, optional
+        The minimum cosine similarity to route locally, by default 0.2.
+    min_margin : float, optional
+        The minimum similarity over the second route, by default 0.05.
+    log_path : str | None, optional
+        The JSONL file where the decisions are appended, by default None.
+    """
+
+    def __init__(
+        self,
+        routes: list[str],
+        embedder: Embedder | None = None,
+        min_score: float = 0.2,
+        min_margin: float = 0.05,
+        log_path: str | None = None,
+    ):
+        self.routes = list(routes)
+        self.embedder = embedder or HashingEmbedder()
+        self.min_score = min_score
+        self.min_margin = min_margin
+        self.log_path = log_path
+        self.stats = RouterStats()
+
+        self._lock = threading.Lock()
+        # Sum of the normalized example embeddings and number of examples per route
+        self._sums: dict[str, np.ndarray] = {}
+        self._counts: dict[str, int] = {route: 0 for route in self.routes}
+        self._centroids: np.ndarray | None = None
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embedder.get_embedding(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def add_examples(self, route: str, messages: list[str]) -> None:
+        """Add example messages of a route, updating its centroid."""
+        if route not in self._counts:
+            raise ValueError(f"Unknown route {route!r}. Choose one of {self.routes}.")
+        vectors = [self._embed(message) for message in messages]
+        with self._lock:
+            for vector in vectors:
+                self._sums[route] = self._sums.get(route, 0) + vector
+            self._counts[route] += len(vectors)
+            self._centroids = None
+
+    def _centroid_matrix(self) -> np.ndarray:
+        if self._centroids is None:
+            dimensions = next(iter(self._sums.values())).shape[0]
+            centroids = np.stack(
+                [self._sums.get(route, np.zeros(dimensions)) for route in self.routes]
+            )
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            self._centroids = centroids / np.where(norms == 0, 1.0, norms)
+        return self._centroids
+
+    def predict(self, message: str) -> tuple[str | None, float, float]:
+        """Get the nearest route of a message, its similarity and its margin.
+
+        Returns
+        -------
+        tuple[str | None, float, float]
+            The nearest route (None without examples), the cosine similarity
+            to its centroid and the margin over the second nearest route.
+        """
+        vector = self._embed(message)
+        with self._lock:
+            if not self._sums:
+                return None, 0.0, 0.0
+            scores = self._centroid_matrix() @ vector
+        order = np.argsort(scores)[::-1]
+        best = float(scores[order[0]])
+        second = float(scores[order[1]]) if len(order) > 1 else -1.0
+        return self.routes[order[0]], best, best - second
+
+    def route(self, message: str) -> RoutingDecision:
+        """Route a message locally if the router is confident enough.
+
+        Returns
+        -------
+        RoutingDecision
+            The decision; its "route" is None when the message must be routed
+            by the LLM (then call `record` with the route the LLM chose).
+        """
+        start = time.perf_counter()
+        local_route, score, margin = self.predict(message)
+        confident = (
+            local_route is not None
+            and score >= self.min_score
+            and margin >= self.min_margin
+        )
+        decision = RoutingDecision(
+            message=message,
+            route=local_route if confident else None,
+            source="local",
+            local_route=local_route,
+            score=score,
+            margin=margin,
+            seconds=time.perf_counter() - start,
+            timestamp=time.time(),
+        )
+        if confident:
+            with self._lock:
+                self.stats.local += 1
+                self.stats.local_seconds += decision["seconds"]
+            self._log(decision)
+        return decision
+
+    def record(
+        self,
+        decision: RoutingDecision,
+        route: str,
+        seconds: float = 0.0,
+        source: str = "llm",
+    ) -> None:
+        """Learn the route the LLM (or a person) chose for a message.
+
+        Parameters
+        ----------
+        decision : RoutingDecision
+            The decision of `route` for the message.
+        route : str
+            The route chosen.
+        seconds : float, optional
+            The time the LLM took to choose it.
+        source : str, optional
+            "llm", or "feedback" to correct a local decision, by default "llm".
+        """
+        self.add_examples(route, [decision["message"]])
+        with self._lock:
+            if source == "llm":
+                self.stats.llm += 1
+                self.stats.llm_seconds += seconds
+                if decision["local_route"] is not None:
+                    self.stats.shadowed += 1
+                    self.stats.agreed += decision["local_route"] == route
+        self._log(
+            RoutingDecision(
+                **{**decision, "route": route, "source": source, "seconds": seconds}
+            )
+        )
+
+    def _log(self, decision: RoutingDecision) -> None:
+        if self.log_path is None:
+            return
+        with self._lock, open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(decision, ensure_ascii=False) + "\n")
+
+    def load_log(self, path: str | None = None) -> int:
+        """Learn the LLM decisions and corrections of a log, e.g. of past sessions.
+
+        Returns
+        -------
+        int
+            The number of decisions learned.
+        """
+        path = path or self.log_path
+        if path is None or not os.path.exists(path):
+            return 0
+
+        examples: dict[str, list[str]] = {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    decision = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                # Local decisions are not learned, so errors do not reinforce
+                if decision["source"] != "local" and decision["route"] in self._counts:
+                    examples.setdefault(decision["route"], []).append(
+                        decision["message"]
+                    )
+        for route, messages in examples.items():
+            self.add_examples(route, messages)
+        return sum(len(messages) for messages in examples.values())
+
+    def evaluate(self, labeled: list[tuple[str, str]]) -> dict:
+        """Measure the router on labeled messages, without learning from them.
+
+        Parameters
+        ----------
+        labeled : list[tuple[str, str]]
+            The (message, route) pairs.
+
+        Returns
+        -------
+        dict
+            The accuracy of the nearest route, the share of messages routed
+            locally (confident), the accuracy on those, and the mean latency.
+        """
+        if not labeled:
+            return {}
+        start = time.perf_counter()
+        predictions = [self.predict(message) for message, _ in labeled]
+        elapsed = time.perf_counter() - start
+
+        confident = [
+            (prediction[0], route)
+            for prediction, (_, route) in zip(predictions, labeled)
+            if prediction[1] >= self.min_score and prediction[2] >= self.min_margin
+        ]
+        return {
+            "accuracy": sum(
+                prediction[0] == route
+                for prediction, (_, route) in zip(predictions, labeled)
+            )
+            / len(labeled),
+            "coverage": len(confident) / len(labeled),
+            "confident_accuracy": (
+                sum(predicted == route for predicted, route in confident)
+                / len(confident)
+                if confident
+                else None
+            ),
+            "mean_ms": 1000 * elapsed / len(labeled),
+        }